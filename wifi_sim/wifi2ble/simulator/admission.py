@@ -0,0 +1,79 @@
+import hashlib
+import math
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+def parse_rate_limits(value):
+    """Parse a default rate and per-key rates such as 100,<api_key>=10 into (default, {api_key: rate}) requests per second."""
+    default_rate = 0.0
+    rates = {}
+    for item in value.split(","):
+        key, separator, rate = item.partition("=")
+        if separator:
+            rates[key] = float(rate)
+        else:
+            default_rate = float(key)
+    return default_rate, rates
+
+def key_label(api_key):
+    """Shorten an API key for logs and metrics, so that scraping metrics does not reveal valid keys.
+
+    The first characters keep the label readable and a hash of the whole key keeps keys with the same prefix apart.
+    """
+    return f"{api_key[:4]}...{hashlib.sha256(api_key.encode()).hexdigest()[:8]}"
+
+class KeyRateLimiter:
+    """Token bucket per API key, holding at most one second of requests. A rate of 0 admits every request.
+
+    Admitted and rejected requests are counted per key in either case.
+    """
+
+    def __init__(self, default_rate=0.0, rates=None):
+        self.default_rate = default_rate
+        self.rates = dict(rates or {})
+        self.lock = threading.Lock()
+        # API key -> [tokens, refilled_at]
+        self.buckets = {}
+        # API key -> [admitted, rejected]
+        self.counts = {}
+
+    def admit(self, api_key):
+        """Take a token for a request with the given key. Returns 0 if admitted, or the seconds until a token is available."""
+        rate = self.rates.get(api_key, self.default_rate)
+        with self.lock:
+            counts = self.counts.get(api_key)
+            if counts is None:
+                counts = self.counts[api_key] = [0, 0]
+            if rate <= 0:
+                counts[0] += 1
+                return 0
+            now = time.monotonic()
+            bucket = self.buckets.get(api_key)
+            if bucket is None:
+                bucket = self.buckets[api_key] = [max(rate, 1.0), now]
+            bucket[0] = min(max(rate, 1.0), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                counts[0] += 1
+                return 0
+            counts[1] += 1
+            return (1 - bucket[0]) / rate
+
+    @staticmethod
+    def retry_after(wait_s):
+        """Format a wait in seconds as a Retry-After header value."""
+        return str(max(1, math.ceil(wait_s)))
+
+    def stats(self):
+        """Return the admitted and rejected requests per shortened key."""
+        with self.lock:
+            counts = {api_key: list(values) for api_key, values in self.counts.items()}
+        stats = {}
+        for api_key, (admitted, rejected) in counts.items():
+            stats[(key_label(api_key), "admitted")] = admitted
+            stats[(key_label(api_key), "rejected")] = rejected
+        return stats
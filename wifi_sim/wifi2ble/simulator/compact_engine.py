@@ -0,0 +1,261 @@
+import itertools
+import random
+import sys
+import threading
+from array import array
+import logging
+from desk import Desk
+
+logger = logging.getLogger(__name__)
+
+class CompactDeskView:
+    """Desk stored in slots instead of dicts, exposing the same interface as Desk.
+
+    Statuses are small codes, the state flags share one integer, the manufacturer is interned and errors are
+    kept in a ring of at most Desk.MAX_ERROR_COUNT packed integers. The lock is shared with other desks.
+    """
+    __slots__ = ("engine", "lock", "desk_id", "name", "manufacturer", "position", "target_position_mm", "speed", "status",
+                 "flags", "activations", "sit_stand_counter", "min_position", "max_position", "clock_s", "version",
+                 "errors", "error_start")
+    # Bits of flags, the first four in the order of the state fields they hold
+    POSITION_LOST = 1
+    OVERLOAD_UP = 2
+    OVERLOAD_DOWN = 4
+    ANTI_COLLISION = 8
+    COLLISION_OCCURRED = 16
+    STATE_FLAGS = POSITION_LOST | OVERLOAD_UP | OVERLOAD_DOWN | ANTI_COLLISION
+    FLAG_FIELDS = (
+        ("isPositionLost", POSITION_LOST),
+        ("isOverloadProtectionUp", OVERLOAD_UP),
+        ("isOverloadProtectionDown", OVERLOAD_DOWN),
+        ("isAntiCollision", ANTI_COLLISION),
+    )
+    # An error is packed as time_s << ERROR_CODE_BITS | errorCode
+    ERROR_CODE_BITS = 16
+
+    def __init__(self, engine, lock, desk: Desk):
+        self.engine = engine
+        self.lock = lock
+        self.desk_id = desk.desk_id
+        self.name = desk.config["name"]
+        self.manufacturer = sys.intern(desk.config["manufacturer"])
+        state = desk.state
+        self.position = state["position_mm"]
+        self.target_position_mm = desk.target_position_mm
+        self.speed = state["speed_mms"]
+        self.status = engine.status_code(state["status"])
+        self.flags = self.COLLISION_OCCURRED if desk.collision_occurred else 0
+        for field, flag in self.FLAG_FIELDS:
+            if state[field]:
+                self.flags |= flag
+        self.activations = desk.usage["activationsCounter"]
+        self.sit_stand_counter = desk.usage["sitStandCounter"]
+        self.min_position = desk.min_position
+        self.max_position = desk.max_position
+        self.clock_s = desk.clock_s
+        self.version = desk.version
+        # Oldest error first, from error_start on. The array grows up to Desk.MAX_ERROR_COUNT, then wraps around
+        self.errors = array("q")
+        self.error_start = 0
+        for error in reversed(desk.lastErrors[:Desk.MAX_ERROR_COUNT]):
+            self._add_error(error["time_s"], error["errorCode"])
+
+    @property
+    def config(self):
+        return {"name": self.name, "manufacturer": self.manufacturer}
+
+    @property
+    def state(self):
+        flags = self.flags
+        state = {
+            "position_mm": self.position,
+            "speed_mms": self.speed,
+            "status": self.engine.statuses[self.status],
+        }
+        for field, flag in self.FLAG_FIELDS:
+            state[field] = bool(flags & flag)
+        return state
+
+    @property
+    def usage(self):
+        return {
+            "activationsCounter": self.activations,
+            "sitStandCounter": self.sit_stand_counter,
+        }
+
+    @property
+    def lastErrors(self):
+        """The errors, newest first, as Desk keeps them."""
+        errors, start, count = self.errors, self.error_start, len(self.errors)
+        bits, mask = self.ERROR_CODE_BITS, (1 << self.ERROR_CODE_BITS) - 1
+        return [
+            {"time_s": errors[(start + i) % count] >> bits, "errorCode": errors[(start + i) % count] & mask}
+            for i in range(count - 1, -1, -1)
+        ]
+
+    @property
+    def sit_stand_position(self):
+        return (self.max_position - self.min_position) / 2 + self.min_position
+
+    @property
+    def collision_occurred(self):
+        return bool(self.flags & self.COLLISION_OCCURRED)
+
+    def _add_error(self, time_s, error_code):
+        """Add the newest error, replacing the oldest one when the ring is full."""
+        if not 0 <= error_code < 1 << self.ERROR_CODE_BITS:
+            raise ValueError(f"Error code out of range: {error_code}")
+        packed = time_s << self.ERROR_CODE_BITS | error_code
+        if len(self.errors) < Desk.MAX_ERROR_COUNT:
+            self.errors.append(packed)
+        else:
+            self.errors[self.error_start] = packed
+            self.error_start = (self.error_start + 1) % Desk.MAX_ERROR_COUNT
+
+    def get_target_position(self):
+        """Get the target position to move towards"""
+        with self.lock:
+            return self.target_position_mm
+
+    def clamp_position(self, position_mm):
+        """Return the position the desk would accept as a target."""
+        return max(self.min_position, min(position_mm, self.max_position))
+
+    def set_target_position(self, position_mm):
+        """Set the target position to move towards, respecting min and max limits."""
+        with self.lock:
+            self.target_position_mm = self.clamp_position(position_mm)
+            logger.info("Desk target position set: ID=%s, Requested=%s, Accepted=%s", self.desk_id, position_mm, self.target_position_mm)
+            if position_mm != self.position:
+                self.activations += 1
+                self.version += 1
+                if self.engine.listener:
+                    self.engine.listener(self, "usage")
+                logger.info("Desk activated: ID=%s, ActivationCounter=%s", self.desk_id, self.activations)
+
+    def _generate_error(self):
+        """Generate an error during movement."""
+        self._add_error(self.clock_s, Desk.ERROR_CODE_E93)
+        self.flags |= self.ANTI_COLLISION | self.COLLISION_OCCURRED
+        self.status = CompactTickEngine.STATUS_COLLISION
+        if self.engine.listener:
+            self.engine.listener(self, "collision")
+        logger.error("Desk collision detected: ID=%s, Time=%s, Position=%s", self.desk_id, self.clock_s, self.position)
+
+    def update(self):
+        """Advance the desk by one second. Mirrors Desk.update(), drawing collisions from the same generator."""
+        with self.lock:
+            self.clock_s += 1
+            if self.flags & self.COLLISION_OCCURRED:
+                self.flags &= ~self.COLLISION_OCCURRED
+                return
+
+            previous_position, previous_speed, previous_status, previous_flags = self.position, self.speed, self.status, self.flags
+            successful_movement = False
+            if self.position < self.target_position_mm:
+                self.position = min(self.position + min(Desk.DEFAULT_SPEED_MMS, self.target_position_mm - self.position), self.max_position)
+                self.speed = Desk.DEFAULT_SPEED_MMS
+                successful_movement = True
+                logger.info("Desk moving up: ID=%s, Position=%s", self.desk_id, self.position)
+            elif self.position > self.target_position_mm:
+                self.position = max(self.position - min(Desk.DEFAULT_SPEED_MMS, self.position - self.target_position_mm), self.min_position)
+                self.speed = -Desk.DEFAULT_SPEED_MMS
+                successful_movement = True
+                logger.info("Desk moving down: ID=%s, Position=%s", self.desk_id, self.position)
+            else:
+                self.speed = 0
+
+            sit_stand_position = self.sit_stand_position
+            crossed = previous_position < sit_stand_position <= self.position or previous_position > sit_stand_position >= self.position
+            if crossed:
+                self.sit_stand_counter += 1
+                logger.info("Desk crossed sit/stand position: ID=%s, SitStandCounter=%s", self.desk_id, self.sit_stand_counter)
+
+            if successful_movement:
+                if self.flags & self.ANTI_COLLISION:
+                    self.flags &= ~self.ANTI_COLLISION
+                    self.status = CompactTickEngine.STATUS_NORMAL
+                    logger.info("Desk reset from collision: ID=%s, Time=%s, Position=%s", self.desk_id, self.clock_s, self.position)
+                elif random.random() < Desk.COLLISION_CHANCE:
+                    self._generate_error()
+                    if self.speed > 0:
+                        self.position = max(self.position - 10, self.min_position)
+                    elif self.speed < 0:
+                        self.position = min(self.position + 10, self.max_position)
+                    self.target_position_mm = self.position
+                    self.speed = 0
+
+            moved = self.position != previous_position or self.speed != previous_speed or self.status != previous_status
+            if moved or crossed or (self.flags ^ previous_flags) & self.STATE_FLAGS:
+                self.version += 1
+                if self.engine.listener:
+                    self.engine.listener(self, "state" if moved else "usage")
+
+    def get_data(self):
+        """Get a copy of the desk's data."""
+        with self.lock:
+            return {
+                "config": self.config,
+                "state": self.state,
+                "usage": self.usage,
+                "lastErrors": self.lastErrors,
+            }
+
+    def update_category(self, category, data):
+        """Update a specific category of the desk."""
+        with self.lock:
+            if category == "state" and "position_mm" in data:
+                self.set_target_position(data["position_mm"])
+                return True
+
+            return False
+
+class CompactTickEngine:
+    """Keeps each desk in a slotted object with striped locks and ticks them one by one like Desk objects.
+
+    Collisions are drawn from the random module, as Desk.update() does, so a seeded run matches the python engine.
+    """
+    # Desks share this many locks. A desk operation never holds two desk locks, so sharing cannot deadlock
+    LOCK_STRIPES = 64
+    STATUS_NORMAL = 0
+    STATUS_COLLISION = 1
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.locks = [threading.RLock() for _ in range(self.LOCK_STRIPES)]
+        self.next_lock = itertools.cycle(self.locks)
+        self.views = {}
+        # Called as listener(view, kind) for every desk that changes, with the same kinds as Desk.listener
+        self.listener = None
+        self.statuses = ["Normal", "Collision"]
+        self.status_codes = {status: code for code, status in enumerate(self.statuses)}
+
+    def status_code(self, status):
+        """Return the code of a status string, registering unknown statuses."""
+        if status not in self.status_codes:
+            self.status_codes[status] = len(self.statuses)
+            self.statuses.append(status)
+        return self.status_codes[status]
+
+    def add(self, desk: Desk):
+        """Copy a desk into a compact view and return the view that replaces it."""
+        with self.lock:
+            view = CompactDeskView(self, next(self.next_lock), desk)
+            self.views[desk.desk_id] = view
+            return view
+
+    def attach(self, desks):
+        """Move a dict of desks into compact views and return the matching dict of views."""
+        return {desk_id: self.add(desk) for desk_id, desk in desks.items()}
+
+    def remove(self, desk_id):
+        """Stop ticking a desk."""
+        with self.lock:
+            self.views.pop(desk_id, None)
+
+    def step(self, skip_ids=()):
+        """Advance every desk by one second, skipping the given desk IDs."""
+        with self.lock:
+            for desk_id, view in self.views.items():
+                if desk_id not in skip_ids:
+                    view.update()
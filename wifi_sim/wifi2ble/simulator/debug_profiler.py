@@ -0,0 +1,156 @@
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DebugProfiler:
+    """On-demand CPU, memory and stack captures of the running process, for the debug endpoints.
+
+    Nothing is instrumented between captures. A CPU profile samples the stacks of the other threads from the thread
+    that asked for it, and tracemalloc only traces allocations during a memory capture, unless it was already tracing.
+    One capture runs at a time.
+    """
+    MAX_SECONDS = 60
+    SAMPLE_INTERVAL_S = 0.005
+    MIN_SAMPLE_INTERVAL_S = 0.001
+    MEMORY_FRAMES = 1
+    MAX_MEMORY_FRAMES = 25
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (code, line) -> frame label, kept between captures as code objects live as long as their module
+        self.labels = {}
+
+    def _check_seconds(self, seconds):
+        if not 0 <= seconds <= self.MAX_SECONDS:
+            raise ValueError(f"seconds must be between 0 and {self.MAX_SECONDS}")
+
+    def profile(self, seconds, interval_s=SAMPLE_INTERVAL_S, thread_filter=None):
+        """Sample the stacks of every thread, or of those whose name contains thread_filter, for a number of seconds.
+
+        Returns the profile in the folded stack format of flame graph tools, one "thread;outer;...;inner count"
+        line per distinct stack, and the number of samples taken, or None if another capture is running.
+        """
+        self._check_seconds(seconds)
+        if interval_s < self.MIN_SAMPLE_INTERVAL_S:
+            raise ValueError(f"interval must be at least {self.MIN_SAMPLE_INTERVAL_S}")
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            stacks = collections.Counter()
+            samples = self._sample(seconds, interval_s, thread_filter, stacks)
+        finally:
+            self.lock.release()
+        lines = [f"{';'.join(stack)} {count}" for stack, count in sorted(stacks.items(), key=lambda item: -item[1])]
+        logger.info(f"CPU profile captured: {samples} samples of {len(stacks)} distinct stacks over {seconds}s.")
+        return "\n".join(lines) + "\n", samples
+
+    def _sample(self, seconds, interval_s, thread_filter, stacks):
+        """Add up the stacks of the other threads every interval_s until the capture ends and return the number of samples."""
+        own = threading.get_ident()
+        labels = self.labels
+        deadline = time.monotonic() + seconds
+        next_sample = time.monotonic()
+        names = {}
+        samples = 0
+        while True:
+            frames = sys._current_frames()
+            if frames.keys() - names.keys():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                name = names.get(ident, str(ident))
+                if ident == own or (thread_filter and thread_filter not in name):
+                    continue
+                stack = []
+                while frame is not None:
+                    key = (frame.f_code, frame.f_lineno)
+                    label = labels.get(key)
+                    if label is None:
+                        code = frame.f_code
+                        label = labels[key] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(name)
+                stacks[tuple(reversed(stack))] += 1
+            del frames
+            samples += 1
+            next_sample += interval_s
+            now = time.monotonic()
+            if now >= deadline:
+                return samples
+            if next_sample > now:
+                time.sleep(min(next_sample, deadline) - now)
+            else:
+                # Sampling took longer than the interval: skip the missed samples rather than catch up
+                next_sample = now
+
+    def memory(self, seconds, top=25, frames=MEMORY_FRAMES):
+        """Trace allocations for a number of seconds and report the top allocation sites and the growth during the capture.
+
+        When tracing starts with the capture, the first snapshot is taken halfway, as one taken at once would be empty.
+        Returns the report as text, or None if another capture is running.
+        """
+        self._check_seconds(seconds)
+        if top < 1:
+            raise ValueError("top must be positive")
+        if not 1 <= frames <= self.MAX_MEMORY_FRAMES:
+            raise ValueError(f"frames must be between 1 and {self.MAX_MEMORY_FRAMES}")
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            # Allocations are only traced during the capture, unless tracing was already on, e.g. with PYTHONTRACEMALLOC
+            started_here = not tracemalloc.is_tracing()
+            if started_here:
+                tracemalloc.start(frames)
+            try:
+                first_after_s = seconds / 2 if started_here else 0
+                time.sleep(first_after_s)
+                first = tracemalloc.take_snapshot()
+                time.sleep(seconds - first_after_s)
+                second = tracemalloc.take_snapshot()
+                traced, peak = tracemalloc.get_traced_memory()
+            finally:
+                if started_here:
+                    tracemalloc.stop()
+        finally:
+            self.lock.release()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+        first, second = first.filter_traces(filters), second.filter_traces(filters)
+        key = "traceback" if frames > 1 else "lineno"
+        scope = "since the capture started" if started_here else "since tracing started"
+        lines = [
+            f"Memory capture of {seconds:g}s, tracing {'started for the capture' if started_here else 'already on'}, {frames} frame(s) per allocation",
+            f"Traced memory at the end: {traced / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB",
+            "",
+            f"Top {top} allocation sites still allocated {scope}:",
+        ]
+        lines.extend(self._format_stats(second.statistics(key)[:top]))
+        lines.extend(["", f"Top {top} differences between the snapshots {first_after_s:g}s and {seconds:g}s into the capture:"])
+        lines.extend(self._format_stats(second.compare_to(first, key)[:top]))
+        logger.info(f"Memory capture finished: {traced / 1024:.1f} KiB traced over {seconds}s.")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _format_stats(stats):
+        lines = []
+        for stat in stats:
+            lines.append(f"  {stat}")
+            if len(stat.traceback) > 1:
+                lines.extend(f"    {line}" for line in stat.traceback.format(most_recent_first=True))
+        return lines or ["  (none)"]
+
+    @staticmethod
+    def stacks():
+        """Return the current stack of every thread as text, like a thread dump."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        parts = []
+        for ident, frame in sys._current_frames().items():
+            parts.append(f"Thread {names.get(ident, ident)} ({ident}):\n{''.join(traceback.format_stack(frame))}")
+        return "\n".join(parts)
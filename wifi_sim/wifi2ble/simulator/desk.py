@@ -9,8 +9,10 @@ class Desk:
     COLLISION_CHANCE = 0.03
     MAX_ERROR_COUNT = 10
     ERROR_CODE_E93 = 93
+    MIN_POSITION = 680
+    MAX_POSITION = 1320
 
-    def __init__(self, desk_id, name, manufacturer, initial_position=680, min_position=680, max_position=1320):
+    def __init__(self, desk_id, name, manufacturer, initial_position=MIN_POSITION, min_position=MIN_POSITION, max_position=MAX_POSITION):
         self.desk_id = desk_id
         self.config = {
             "name": name,
@@ -39,9 +41,14 @@ class Desk:
         self.sit_stand_position = (max_position - min_position) / 2 + min_position
         self.clock_s = 180
         self.collision_occurred = False
+        # Bumped whenever state, usage or lastErrors change
+        self.version = 0
+        # Called as listener(desk, kind) when the desk moves or changes status ("state"),
+        # only its counters change ("usage") or it collides ("collision")
+        self.listener = None
 
-        logger.info(f"Desk initialized: ID={desk_id}, Name={name}, Manufacturer={manufacturer}, "
-            f"Position={initial_position}, Min={min_position}, Max={max_position}")
+        logger.debug("Desk initialized: ID=%s, Name=%s, Manufacturer=%s, Position=%s, Min=%s, Max=%s",
+                    desk_id, name, manufacturer, initial_position, min_position, max_position)
 
 
     def get_target_position(self):
@@ -49,14 +56,21 @@ class Desk:
         with self.lock:
             return self.target_position_mm
 
+    def clamp_position(self, position_mm):
+        """Return the position the desk would accept as a target."""
+        return max(self.min_position, min(position_mm, self.max_position))
+
     def set_target_position(self, position_mm):
         """Set the target position to move towards, respecting min and max limits."""
         with self.lock:
-            self.target_position_mm = max(self.min_position, min(position_mm, self.max_position))
-            logger.info(f"Desk target position set: ID={self.desk_id}, Requested={position_mm}, Accepted={self.target_position_mm}")
+            self.target_position_mm = self.clamp_position(position_mm)
+            logger.info("Desk target position set: ID=%s, Requested=%s, Accepted=%s", self.desk_id, position_mm, self.target_position_mm)
             if position_mm != self.state["position_mm"]:
                 self.usage["activationsCounter"] += 1
-                logger.info(f"Desk activated: ID={self.desk_id}, ActivationCounter={self.usage["activationsCounter"]}")
+                self.version += 1
+                if self.listener:
+                    self.listener(self, "usage")
+                logger.info("Desk activated: ID=%s, ActivationCounter=%s", self.desk_id, self.usage["activationsCounter"])
 
     def _generate_error(self):
         """Generate an error during movement."""
@@ -68,8 +82,10 @@ class Desk:
             self.state["isAntiCollision"] = True
             self.state["status"] = "Collision"
             self.collision_occurred = True
+            if self.listener:
+                self.listener(self, "collision")
 
-            logger.error(f"Desk collision detected: ID={self.desk_id}, Time={self.clock_s}, Position={self.state['position_mm']}")
+            logger.error("Desk collision detected: ID=%s, Time=%s, Position=%s", self.desk_id, self.clock_s, self.state["position_mm"])
     
     def update(self):
         """Update clock and position gradually toward target_position_mm within limits, increment sitStandCounter on crossing."""
@@ -83,33 +99,35 @@ class Desk:
                 self.collision_occurred = False
                 return
 
+            previous_state = dict(self.state)
+            previous_sit_stand_counter = self.usage["sitStandCounter"]
             previous_position = self.state["position_mm"]
             if self.state["position_mm"] < self.target_position_mm:
                 self.state["position_mm"] += min(self.DEFAULT_SPEED_MMS, self.target_position_mm - self.state["position_mm"])
                 self.state["position_mm"] = min(self.state["position_mm"], self.max_position)
                 self.state["speed_mms"] = self.DEFAULT_SPEED_MMS
                 successful_movement = True
-                logger.info(f"Desk moving up: ID={self.desk_id}, Position={self.state['position_mm']}")
+                logger.info("Desk moving up: ID=%s, Position=%s", self.desk_id, self.state["position_mm"])
             elif self.state["position_mm"] > self.target_position_mm:
                 self.state["position_mm"] -= min(self.DEFAULT_SPEED_MMS, self.state["position_mm"] - self.target_position_mm)
                 self.state["position_mm"] = max(self.state["position_mm"], self.min_position)
                 self.state["speed_mms"] = -self.DEFAULT_SPEED_MMS
                 successful_movement = True
-                logger.info(f"Desk moving down: ID={self.desk_id}, Position={self.state['position_mm']}")
+                logger.info("Desk moving down: ID=%s, Position=%s", self.desk_id, self.state["position_mm"])
             else:
                 self.state["speed_mms"] = 0
 
             if (previous_position < self.sit_stand_position <= self.state["position_mm"]) or \
                (previous_position > self.sit_stand_position >= self.state["position_mm"]):
                 self.usage["sitStandCounter"] += 1
-                logger.info(f"Desk crossed sit/stand position: ID={self.desk_id}, SitStandCounter={self.usage['sitStandCounter']}")
+                logger.info("Desk crossed sit/stand position: ID=%s, SitStandCounter=%s", self.desk_id, self.usage["sitStandCounter"])
 
 
             if successful_movement:
                 if self.state["isAntiCollision"]:
                     self.state["isAntiCollision"] = False
                     self.state["status"] = "Normal"
-                    logger.info(f"Desk reset from collision: ID={self.desk_id}, Time={self.clock_s}, Position={self.state['position_mm']}")
+                    logger.info("Desk reset from collision: ID=%s, Time=%s, Position=%s", self.desk_id, self.clock_s, self.state["position_mm"])
                 elif random.random() < self.COLLISION_CHANCE:
                     self._generate_error()
                     if self.state["speed_mms"] > 0:
@@ -120,14 +138,20 @@ class Desk:
                     self.target_position_mm = self.state["position_mm"]
                     self.state["speed_mms"] = 0
 
+            if self.state != previous_state or self.usage["sitStandCounter"] != previous_sit_stand_counter:
+                self.version += 1
+                if self.listener:
+                    moved = any(self.state[key] != previous_state[key] for key in ("position_mm", "speed_mms", "status"))
+                    self.listener(self, "state" if moved else "usage")
+
     def get_data(self):
-        """Get a snapshot of the desk's data."""
+        """Get a copy of the desk's data."""
         with self.lock:
             return {
-                "config": self.config,
-                "state": self.state,
-                "usage": self.usage,
-                "lastErrors": self.lastErrors,
+                "config": dict(self.config),
+                "state": dict(self.state),
+                "usage": dict(self.usage),
+                "lastErrors": [dict(error) for error in self.lastErrors],
             }
 
     def update_category(self, category, data):
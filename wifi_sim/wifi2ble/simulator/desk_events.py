@@ -0,0 +1,196 @@
+import collections
+import json
+import selectors
+import socket
+import ssl
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EventSubscriber:
+    """A detached client connection receiving server-sent events, with a bounded buffer."""
+
+    def __init__(self, sock, desk_ids, max_buffered_events):
+        self.sock = sock
+        self.desk_ids = desk_ids
+        self.pending = collections.deque()
+        self.max_buffered_events = max_buffered_events
+        self.dropped_events = 0
+        self.output = b""
+
+    def push(self, message):
+        """Buffer a message, dropping the oldest one when the buffer is full."""
+        if len(self.pending) >= self.max_buffered_events:
+            self.pending.popleft()
+            self.dropped_events += 1
+        self.pending.append(message)
+
+    def next_output(self):
+        """Return the bytes to write next, announcing dropped events before resuming."""
+        if not self.output:
+            parts = []
+            if self.dropped_events:
+                parts.append(EventHub.format_event("dropped", {"count": self.dropped_events}))
+                self.dropped_events = 0
+            while self.pending:
+                parts.append(self.pending.popleft())
+            self.output = b"".join(parts)
+        return self.output
+
+class EventTrace:
+    """Writes desk and power events to a JSON lines file, stamped with the simulation time."""
+
+    def __init__(self, trace_file):
+        self.file = open(trace_file, "w")
+
+    def write(self, simulation_time_s, kind, data):
+        self.file.write(json.dumps({"simulationTime_s": simulation_time_s, "event": kind, **data}) + "\n")
+
+    def close(self):
+        self.file.close()
+
+class EventHub:
+    """Fans desk change events out to server-sent event subscribers from a single I/O thread."""
+    MAX_BUFFERED_EVENTS = 256
+    HEARTBEAT_INTERVAL_S = 15
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.selector = None
+        self.thread = None
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_pending = False
+        self.stopped = False
+
+    @property
+    def has_subscribers(self):
+        return bool(self.subscribers)
+
+    @staticmethod
+    def format_event(kind, data):
+        """Encode one server-sent event."""
+        return f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+    @staticmethod
+    def event_data(desk, kind):
+        """Return the payload of an event about a desk."""
+        if kind == "collision":
+            error = desk.lastErrors[0]
+            return {"desk_id": desk.desk_id, "time_s": error["time_s"], "errorCode": error["errorCode"]}
+        elif kind == "usage":
+            return {"desk_id": desk.desk_id, **desk.usage}
+        state = desk.state
+        return {
+            "desk_id": desk.desk_id,
+            "position_mm": state["position_mm"],
+            "speed_mms": state["speed_mms"],
+            "status": state["status"],
+        }
+
+    def publish(self, desk, kind):
+        """Queue an event about a desk for every interested subscriber. Called by desks as they change."""
+        if not self.subscribers or kind == "usage":
+            return
+        self.publish_data(desk.desk_id, kind, self.event_data(desk, kind))
+
+    def publish_data(self, desk_id, kind, data):
+        """Queue an event with an already built payload for every subscriber interested in the desk."""
+        message = self.format_event(kind, data)
+        with self.lock:
+            for subscriber in self.subscribers.values():
+                if subscriber.desk_ids is None or desk_id in subscriber.desk_ids:
+                    subscriber.push(message)
+            self._wake()
+
+    def subscribe(self, sock, desk_ids=None):
+        """Take over a connection whose response headers were already sent and stream events to it."""
+        sock.setblocking(False)
+        subscriber = EventSubscriber(sock, set(desk_ids) if desk_ids else None, self.MAX_BUFFERED_EVENTS)
+        with self.lock:
+            if self.stopped:
+                sock.close()
+                return
+            if self.thread is None:
+                self.selector = selectors.DefaultSelector()
+                self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+                self.thread = threading.Thread(target=self._serve_subscribers, name="desk-events", daemon=True)
+                self.thread.start()
+            self.subscribers[sock.fileno()] = subscriber
+            self.selector.register(sock, selectors.EVENT_READ, subscriber)
+        logger.info(f"Event subscriber added: {len(self.subscribers)} connected, filter={desk_ids or 'all'}.")
+
+    def stop(self):
+        """Disconnect every subscriber and stop the I/O thread."""
+        with self.lock:
+            self.stopped = True
+            self._wake()
+        if self.thread:
+            self.thread.join()
+
+    def _wake(self):
+        """Wake the I/O thread. Must be called with the lock held."""
+        if not self.wakeup_pending:
+            self.wakeup_pending = True
+            self.wakeup_writer.send(b"\0")
+
+    def _remove(self, subscriber):
+        """Forget a subscriber and close its connection. Must be called with the lock held."""
+        self.subscribers.pop(subscriber.sock.fileno(), None)
+        self.selector.unregister(subscriber.sock)
+        subscriber.sock.close()
+        logger.info(f"Event subscriber removed: {len(self.subscribers)} connected.")
+
+    def _serve_subscribers(self):
+        """Write buffered events to writable subscribers and detect closed connections."""
+        next_heartbeat = time.monotonic() + self.HEARTBEAT_INTERVAL_S
+        while True:
+            ready = self.selector.select(timeout=max(0, next_heartbeat - time.monotonic()))
+            with self.lock:
+                if self.stopped:
+                    for subscriber in list(self.subscribers.values()):
+                        self._remove(subscriber)
+                    self.selector.close()
+                    return
+
+                for key, events in ready:
+                    if key.fileobj is self.wakeup_reader:
+                        self.wakeup_reader.recv(4096)
+                        self.wakeup_pending = False
+                    elif events & selectors.EVENT_READ and not self._is_connected(key.data):
+                        self._remove(key.data)
+
+                if time.monotonic() >= next_heartbeat:
+                    next_heartbeat = time.monotonic() + self.HEARTBEAT_INTERVAL_S
+                    for subscriber in self.subscribers.values():
+                        subscriber.push(b": keep-alive\n\n")
+
+                for subscriber in list(self.subscribers.values()):
+                    self._flush(subscriber)
+
+    def _is_connected(self, subscriber):
+        """Read from a readable subscriber connection. Clients never send data, so this detects closes."""
+        try:
+            return bool(subscriber.sock.recv(4096))
+        except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return True
+        except OSError:
+            return False
+
+    def _flush(self, subscriber):
+        """Write as much buffered output as the socket accepts without blocking. Must be called with the lock held."""
+        output = subscriber.next_output()
+        if not output:
+            return
+        try:
+            sent = subscriber.sock.send(output)
+        except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            sent = 0
+        except OSError:
+            self._remove(subscriber)
+            return
+        subscriber.output = output[sent:]
+        mask = selectors.EVENT_READ | (selectors.EVENT_WRITE if subscriber.output else 0)
+        self.selector.modify(subscriber.sock, mask, subscriber)
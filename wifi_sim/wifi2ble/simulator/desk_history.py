@@ -0,0 +1,183 @@
+import bisect
+import queue
+import threading
+from array import array
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _Ring:
+    """Fixed-size ring of one desk's samples in parallel arrays: 4-byte time, 2-byte position and speed, 1-byte status."""
+    __slots__ = ("times", "positions", "speeds", "statuses", "start", "count")
+
+    def __init__(self, capacity):
+        self.times = array("i", bytes(4 * capacity))
+        self.positions = array("h", bytes(2 * capacity))
+        self.speeds = array("h", bytes(2 * capacity))
+        self.statuses = array("B", bytes(capacity))
+        self.start = 0
+        self.count = 0
+
+    def append(self, time_s, position_mm, speed_mms, status):
+        capacity = len(self.times)
+        if self.count < capacity:
+            index = (self.start + self.count) % capacity
+            self.count += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % capacity
+        self.times[index] = time_s
+        self.positions[index] = position_mm
+        self.speeds[index] = speed_mms
+        self.statuses[index] = status
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        # Time of the i-th oldest sample, so that bisect can search the ring in place
+        return self.times[(self.start + i) % len(self.times)]
+
+class DeskHistory:
+    """Position, speed and status history of every desk, kept as a ring buffer of changes per desk.
+
+    A sample is only appended when a desk's position, speed or status changes, and holds until the next one,
+    so a ring of a few hundred samples covers every tick of a moving desk and hours of a stationary one.
+    Ticks are handed to a background thread, so recording does not lengthen the tick.
+    """
+    STATUSES = ("Normal", "Collision", "Off")
+    STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+    # Most buckets a single query may return
+    MAX_POINTS = 2000
+
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self.rings = {}
+        self.lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+
+    def record(self, time_s, desks, changed_ids, powered_off):
+        """Queue the snapshot entries of the desks changed on a tick. The entries and sets must not be modified later."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._record_queued, name="desk-history", daemon=True)
+            self.thread.start()
+        self.queue.put((time_s, desks, changed_ids, powered_off))
+
+    def stop(self):
+        """Record the queued ticks and stop the background thread."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def _record_queued(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self._record(*item)
+
+    def _record(self, time_s, desks, changed_ids, powered_off):
+        """Append a sample for each changed desk whose position, speed or status differs from its last sample."""
+        # Runs for every moving desk on every tick, so the ring's last sample is compared inline
+        time_s = int(time_s)
+        capacity = self.capacity
+        codes = self.STATUS_CODES
+        off = codes["Off"]
+        with self.lock:
+            rings = self.rings
+            for desk_id in changed_ids:
+                entry = desks.get(desk_id)
+                if entry is None:
+                    rings.pop(desk_id, None)
+                    continue
+                state = entry.data["state"]
+                position = round(state["position_mm"])
+                speed = round(state["speed_mms"])
+                status = off if desk_id in powered_off else codes.get(state["status"], 0)
+                ring = rings.get(desk_id)
+                if ring is None:
+                    ring = rings[desk_id] = _Ring(capacity)
+                else:
+                    last = (ring.start + ring.count - 1) % capacity
+                    if ring.positions[last] == position and ring.speeds[last] == speed and ring.statuses[last] == status:
+                        continue
+                ring.append(time_s, position, speed, status)
+
+    def series(self, desk_id, now_s, start_s=None, end_s=None, step_s=None):
+        """Downsample a desk's position between start_s and end_s into step_s buckets of min, max and time-weighted average.
+
+        Returns None for an unknown desk. Only the samples in the range are read, under the history lock.
+        """
+        end_s = now_s if end_s is None else end_s
+        with self.lock:
+            ring = self.rings.get(desk_id)
+            if ring is None:
+                return None
+            count = len(ring)
+            start_s = ring[0] if start_s is None else start_s
+            if end_s <= start_s:
+                raise ValueError("to must be after from")
+            if step_s is None:
+                step_s = (end_s - start_s) / 100
+            if step_s <= 0:
+                raise ValueError("step must be positive")
+            if (end_s - start_s) / step_s > self.MAX_POINTS:
+                raise ValueError(f"Too many points: at most {self.MAX_POINTS} steps per query")
+
+            buckets = {}
+            # The sample in effect at start_s, or the first one after it
+            i = max(bisect.bisect_right(ring, start_s) - 1, 0)
+            capacity = len(ring.times)
+            while i < count:
+                index = (ring.start + i) % capacity
+                segment_start = max(ring.times[index], start_s)
+                if segment_start >= end_s:
+                    break
+                segment_end = min(ring[i + 1] if i + 1 < count else max(now_s, segment_start), end_s)
+                position = ring.positions[index]
+                status = ring.statuses[index]
+                # Split the time the sample held across the buckets it spans
+                while True:
+                    k = int((segment_start - start_s) // step_s)
+                    if start_s + (k + 1) * step_s <= segment_start:
+                        # Floor division can land one bucket early on a boundary
+                        k += 1
+                    part_end = min(segment_end, start_s + (k + 1) * step_s)
+                    bucket = buckets.get(k)
+                    if bucket is None:
+                        buckets[k] = [position, position, position * (part_end - segment_start), part_end - segment_start, position, status]
+                    else:
+                        bucket[0] = min(bucket[0], position)
+                        bucket[1] = max(bucket[1], position)
+                        bucket[2] += position * (part_end - segment_start)
+                        bucket[3] += part_end - segment_start
+                        bucket[4] = position
+                        bucket[5] = status
+                    if part_end >= segment_end:
+                        break
+                    segment_start = part_end
+                i += 1
+
+        return {
+            "from": start_s,
+            "to": end_s,
+            "step": step_s,
+            "series": [
+                {
+                    "t": start_s + k * step_s,
+                    "min": low,
+                    "max": high,
+                    "avg": round(weighted / duration, 1) if duration else last,
+                    "status": self.STATUSES[status],
+                }
+                for k, (low, high, weighted, duration, last, status) in sorted(buckets.items())
+            ],
+        }
+
+    def stats(self):
+        """Return the number of desks with history and of samples kept."""
+        with self.lock:
+            return {"desks": len(self.rings), "samples": sum(len(ring) for ring in self.rings.values()), "queuedTicks": self.queue.qsize()}
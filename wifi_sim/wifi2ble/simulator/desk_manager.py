@@ -1,11 +1,22 @@
 import threading
+import collections
+import itertools
 import time
 import json
-import os
 import random
 import logging
 from desk import Desk
 from users import SeatedUser, StandingUser, ActiveUser, UserType
+from numpy_engine import NumpyTickEngine
+from lazy_engine import LazyMotionEngine
+from compact_engine import CompactTickEngine
+from desk_events import EventHub, EventTrace
+from fleet_snapshot import FleetSnapshot, DeskSnapshot
+from state_store import StateStore
+from metrics import MetricsRegistry, InstrumentedLock
+from desk_history import DeskHistory
+from fleet_aggregates import FleetAggregates
+from shards import shard_of
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +26,14 @@ class DeskManager:
     DAY_START_HOUR = 6
     NIGHT_START_HOUR = 18
     POWER_OFF_CHANCE = 0.03
-    
-    def __init__(self, simulation_speed=60):
+    # Real-time interval of the user and power-off simulation threads, in ticks
+    SIMULATION_INTERVAL_TICKS = 5
+    FLEET_CATEGORIES = ("config", "state", "usage", "lastErrors")
+    # Saved desks built per lock acquisition when they are built in the background
+    BUILD_BATCH_SIZE = 1000
+
+    def __init__(self, simulation_speed=60, engine="python", seed=None, state_file=None, snapshot_interval_s=60,
+                 shard=None, epoch=None, initial_state_file=None, history_size=512, load_in_background=False):
         self.desks = {}
         self.users = {}
         self.powered_off_desks = {}
@@ -24,15 +41,157 @@ class DeskManager:
         self.simulation_thread = None
         self.power_off_thread = None
         self.stop_event = threading.Event()
-        self.lock = threading.Lock()
+        self.resume_event = threading.Event()
+        self.paused_at_s = None
+        self.trace = None
+        self.mqtt = None
+        self.metrics = MetricsRegistry()
+        self.lock = InstrumentedLock(self.metrics, "desk_manager")
         self.current_time_s = 43200
+        self.tick_count = 0
+        self.store = StateStore(state_file or self.STATE_FILE, snapshot_interval_s, initial_state_file)
+        # (index, count) of the shard this manager simulates, or None for the whole fleet
+        self.shard = shard
+        # Distinguishes desk versions of this run from those of earlier runs. Shards of one run share it
+        self.epoch = epoch or f"{int(time.time()):x}"
         self.simulation_speed = simulation_speed
-        self.load_state()
+        self.events = EventHub()
+        # Writes from the REST API, applied by the tick loop
+        self.commands = collections.deque()
+        # Desks changed since the last snapshot, and whether the set of listed desks changed. The desks are dict keys,
+        # kept in the order they changed, so that the state store records them in the same order on every seeded run
+        self.changed_desks = {}
+        self.membership_changed = True
+        self.snapshot = FleetSnapshot()
+        self.snapshot_stale = True
+        # Called as listener(snapshot, changed_desks, membership_changed) after each publish, with the lock held
+        self.snapshot_listeners = []
+        # Position history of every desk, in samples per desk, or None if disabled
+        self.history = DeskHistory(history_size) if history_size > 0 else None
+        # Fleet-wide totals, updated from the changed desks of every snapshot
+        self.aggregates = FleetAggregates()
+        # Desk ID -> snapshot entry of a desk read from the saved state, served as it is until the desk is built
+        self.saved_entries = {}
+        # Desk ID -> (user type, clock_s) of those desks, and the tick they were loaded at
+        self.saved_details = {}
+        self.loaded_tick = 0
+        # Set once the saved desks are served, and once every desk is built
+        self.ready = threading.Event()
+        self.loaded = threading.Event()
+        self.loader_thread = None
+        # Seconds from the creation of the manager to each startup phase
+        self.created = time.perf_counter()
+        self.startup_s = {}
+        self.engine = self._create_engine(engine, seed)
+        self._register_metrics()
+        if not load_in_background:
+            self._load()
+
+    def _register_metrics(self):
+        """Register the simulation loop, collision and fleet metrics."""
+        self.loop_duration = self.metrics.histogram("desk_simulation_loop_seconds", "Duration of one pass of a simulation loop", ("loop",))
+        self.loop_overruns = self.metrics.counter("desk_simulation_loop_overruns_total", "Passes of a real-time simulation loop that took longer than its interval", ("loop",))
+        self.collisions = self.metrics.counter("desk_collisions_total", "Collisions detected by desks")
+        self.metrics.callback("desk_ticks_total", "Ticks simulated since startup", lambda: self.tick_count, "counter")
+        self.metrics.callback("desk_desks", "Desks in the fleet, including powered-off desks", lambda: len(self.desks) + len(self.saved_entries))
+        self.metrics.callback("desk_startup_seconds", "Seconds from startup until the saved desks were served, every desk was built and the server accepted requests",
+                              lambda: dict(self.startup_s), label_names=("phase",))
+        self.metrics.callback("desk_powered_off_desks", "Desks currently powered off", lambda: len(self.powered_off_desks))
+        self.metrics.callback("desk_moving_desks", "Powered-on desks that moved on the last tick", lambda: self.aggregates.moving)
+        self.metrics.callback("desk_collision_desks", "Powered-on desks in collision status", lambda: self.aggregates.count_status("Collision"))
+        self.metrics.callback("desk_queued_commands", "Updates from the REST API waiting for the next tick", lambda: len(self.commands))
+        self.metrics.callback("desk_state_store_stat", "State store journal and snapshot counters", self.store.stats, label_names=("stat",))
+        if self.history is not None:
+            self.metrics.callback("desk_history_stat", "Desks with position history and samples kept", self.history.stats, label_names=("stat",))
+        self.metrics.callback("desk_event_subscribers", "Connected event stream subscribers", lambda: len(self.events.subscribers))
+
+    def _observe_loop(self, loop, started, interval_s=None):
+        """Record the duration of a simulation loop pass and whether it overran its real-time interval."""
+        elapsed = time.perf_counter() - started
+        self.loop_duration.observe(elapsed, loop)
+        if interval_s is not None and elapsed > interval_s:
+            self.loop_overruns.inc(loop)
+            logger.warning(f"Simulation loop {loop} overran its {interval_s}s interval: {elapsed:.3f}s.")
+
+    def _on_desk_change(self, desk, kind):
+        """Record a desk change for the next snapshot and forward it to event subscribers."""
+        self.changed_desks[desk.desk_id] = None
+        if kind == "collision":
+            self.collisions.inc()
+        self.events.publish(desk, kind)
+        if self.trace:
+            self.trace.write(self.current_time_s, kind, EventHub.event_data(desk, kind))
+
+    def start_trace(self, trace_file):
+        """Write every desk and power event to a JSON lines file until the updates stop."""
+        self.trace = EventTrace(trace_file)
+        logger.info(f"Writing event trace to {trace_file}.")
+
+    def start_mqtt(self, bridge):
+        """Publish the changed desks of every snapshot through an MQTT bridge until the updates stop."""
+        self.mqtt = bridge
+        with self.lock:
+            # Every desk is published once, so that the broker's retained states start complete
+            self.changed_desks.update(dict.fromkeys(itertools.chain(self.desks, self.saved_entries)))
+            self.snapshot_stale = True
+            self.snapshot_listeners.append(bridge.on_snapshot)
+        self.metrics.callback("desk_mqtt_stat", "MQTT bridge desk changes, messages published and refused, and pending desks",
+                              bridge.stats, label_names=("stat",))
+        bridge.start()
+
+    def _mark_membership_changed(self, desk_id):
+        """Record that a desk was added, removed, powered off or restored. Must be called with the lock held."""
+        self.changed_desks[desk_id] = None
+        self.membership_changed = True
+        self.snapshot_stale = True
+
+    def _publish_snapshot(self, tick=False):
+        """Publish a snapshot of the fleet for lock-free readers. Must be called with the lock held."""
+        changed_desks, self.changed_desks = self.changed_desks, {}
+        membership_changed = self.membership_changed
+        self.snapshot = self.snapshot.publish(self.desks, changed_desks, self.powered_off_desks, membership_changed, self.saved_entries)
+        self.aggregates.update(self.current_time_s, self.snapshot, changed_desks)
+        self.membership_changed = False
+        self.snapshot_stale = False
+        for listener in self.snapshot_listeners:
+            listener(self.snapshot, changed_desks, membership_changed)
+        if self.history is not None and changed_desks:
+            self.history.record(self.current_time_s, self.snapshot.desks, changed_desks, self.snapshot.powered_off)
+        # Every tick is journaled, even without changes, so that desk clocks can be restored
+        if changed_desks or tick:
+            self._record_changes(changed_desks, tick)
+
+    def _record_changes(self, changed_desks, tick=False):
+        """Hand the snapshot entries of changed desks to the state store. Must be called with the lock held."""
+        changes = {}
+        for desk_id in changed_desks:
+            if desk_id in self.saved_entries:
+                # The store loaded them and saves them again as they were
+                continue
+            entry = self.snapshot.desks.get(desk_id)
+            if entry is None:
+                changes[desk_id] = None
+            else:
+                desk = self.desks[desk_id]
+                changes[desk_id] = (entry.data, desk.clock_s, self._user_type(desk_id), self.powered_off_desks.get(desk_id))
+        if changes or tick:
+            self.store.record(self.tick_count, self.current_time_s, self.simulation_speed, changes)
+
+    def _user_type(self, desk_id):
+        """Return the saved name of a desk's user type."""
+        return self.users[desk_id].__class__.__name__.replace("User", "").lower()
+
+    def get_snapshot(self):
+        """Get the latest fleet snapshot. Desks added or powered off since the last tick are published first."""
+        if self.snapshot_stale:
+            with self.lock:
+                if self.snapshot_stale:
+                    self._publish_snapshot()
+        return self.snapshot
 
     def get_desk_ids(self):
         """Return the list of desk IDs, excluding powered-off desks."""
-        with self.lock:
-            return [desk_id for desk_id in self.desks if desk_id not in self.powered_off_desks]
+        return list(self.get_snapshot().desk_ids)
 
     def get_desk(self, desk_id):
         """Get a desk by its ID."""
@@ -40,46 +199,224 @@ class DeskManager:
             if desk_id in self.powered_off_desks:
                 logger.warning(f"Desk ID={desk_id} is currently powered off.")
                 return None
-            return self.desks.get(desk_id)
+        return self._live_desk(desk_id)
+
+    def _live_desk(self, desk_id):
+        """Get a desk by its ID, building it first if it is still served from its saved data. Takes the lock to build it."""
+        desk = self.desks.get(desk_id)
+        if desk is None and desk_id in self.saved_entries:
+            with self.lock:
+                desk = self.desks.get(desk_id)
+                if desk is None and desk_id in self.saved_entries:
+                    desk = self._build_saved_desk(desk_id)
+        return desk
 
     def get_desk_data(self, desk_id):
-        """Get a desk's data snapshot by its ID."""
+        """Get a desk's data snapshot by its ID. The returned data must not be modified."""
         logger.debug(f"Retrieving data for desk ID={desk_id}.")
-        desk = self.get_desk(desk_id)
-        return desk.get_data() if desk else None
+        desk = self.get_snapshot().get(desk_id)
+        return desk.data if desk else None
+
+    def get_desk_snapshot(self, desk_id):
+        """Get the latest immutable snapshot entry of a desk, or None if it is not available."""
+        return self.get_snapshot().get(desk_id)
+
+    def get_desk_version(self, desk_id):
+        """Get a desk's version, which changes whenever its state, usage or errors change."""
+        desk = self.get_snapshot().get(desk_id)
+        return f"{self.epoch}-{desk.version}" if desk else None
 
     def get_desk_category(self, desk_id, category):
-        """Get a specific category from a desk."""
-        desk = self.get_desk(desk_id)
+        """Get a specific category from a desk. The returned data must not be modified."""
+        desk = self.get_snapshot().get(desk_id)
         if desk:
-            data = desk.get_data()
-            return data.get(category)
+            return desk.data.get(category)
         return None
 
+    def get_desk_history(self, desk_id, start_s=None, end_s=None, step_s=None):
+        """Get a desk's downsampled position history up to the current simulation time, or None if not available."""
+        if self.history is None:
+            return None
+        return self.history.series(desk_id, self.current_time_s, start_s, end_s, step_s)
+
+    def get_fleet_summary(self):
+        """Get the fleet-wide usage, status, collision and position totals of the latest snapshot."""
+        self.get_snapshot()
+        return self.aggregates.summary()
+
+    def owns(self, desk_id):
+        """Check whether a desk belongs to the shard this manager simulates."""
+        return self.shard is None or shard_of(desk_id, self.shard[1]) == self.shard[0]
+
+    def get_fleet_data(self, categories=None, fields=None):
+        """Get the data of every powered-on desk from one snapshot, projected to the requested categories and fields."""
+        return self.project_fleet(self.get_snapshot(), self._build_projection(categories, fields))
+
+    @staticmethod
+    def project_fleet(snapshot, projection):
+        """Project the data of every powered-on desk of a snapshot to a category -> fields mapping."""
+        fleet = []
+        for desk_id in snapshot.desk_ids:
+            data = snapshot.desks[desk_id].data
+            fleet.append((desk_id, {
+                category: data[category] if names is None
+                else {name: data[category][name] for name in names if name in data[category]}
+                for category, names in projection.items()
+            }))
+        return fleet
+
+    def _build_projection(self, categories, fields):
+        """Translate expanded categories and dotted field paths into a category -> fields mapping."""
+        projection = {}
+        for category in categories or []:
+            if category not in self.FLEET_CATEGORIES:
+                raise ValueError(f"Unknown category: {category}")
+            projection[category] = None
+        for field in fields or []:
+            category, _, name = field.partition(".")
+            if category not in self.FLEET_CATEGORIES:
+                raise ValueError(f"Unknown category: {category}")
+            if not name or category == "lastErrors":
+                projection[category] = None
+            elif category not in projection:
+                projection[category] = [name]
+            elif projection[category] is not None:
+                projection[category].append(name)
+        if not projection:
+            projection = dict.fromkeys(self.FLEET_CATEGORIES)
+        return projection
+
     def update_desk_category(self, desk_id, category, data):
-        """Update a specific category of a desk."""
-        desk = self.get_desk(desk_id)
-        return desk.update_category(category, data) if desk else False
+        """Queue an update of a desk's category for the tick loop and return the accepted values, or None if not updatable.
+
+        An invalid position is not queued and returns an error, as in update_desks().
+        """
+        if self.get_snapshot().get(desk_id) is None:
+            return None
+        desk = self._live_desk(desk_id)
+        if desk is None or category != "state" or "position_mm" not in data:
+            return None
+        if not self.is_valid_position(data["position_mm"]):
+            return {"error": "Invalid position_mm"}
+        accepted = {"position_mm": desk.clamp_position(data["position_mm"])}
+        self.commands.append((desk_id, category, data))
+        return accepted
+
+    def update_desks(self, commands):
+        """Queue many position updates at once from (desk_id, position_mm) pairs and return the result of each desk."""
+        snapshot = self.get_snapshot()
+        results = {}
+        accepted = []
+        for desk_id, position_mm in commands:
+            desk = self._live_desk(desk_id) if snapshot.get(desk_id) is not None else None
+            if desk is None:
+                results[desk_id] = {"error": "Desk not found"}
+            elif not self.is_valid_position(position_mm):
+                results[desk_id] = {"error": "Invalid position_mm"}
+            else:
+                results[desk_id] = {"position_mm": desk.clamp_position(position_mm)}
+                accepted.append((desk_id, "state", {"position_mm": position_mm}))
+        self.commands.extend(accepted)
+        logger.info(f"Batch update queued: accepted={len(accepted)}, rejected={len(results) - len(accepted)}")
+        return results
+
+    @staticmethod
+    def is_valid_position(position_mm):
+        """Check that a requested position is a number."""
+        return isinstance(position_mm, (int, float)) and not isinstance(position_mm, bool)
+
+    def select_desks(self, selector):
+        """Return the IDs of powered-on desks matching a selector with optional desk_ids and user fields."""
+        return self.filter_desks(self.get_snapshot().desk_ids, self.get_user_types(), selector)
+
+    def get_user_types(self):
+        """Return the saved name of the user type of every desk."""
+        with self.lock:
+            return self._user_types()
+
+    def _user_types(self):
+        """Return the saved name of the user type of every desk. Must be called with the lock held."""
+        user_types = {desk_id: self._user_type(desk_id) for desk_id in self.users}
+        user_types.update((desk_id, user_type.value) for desk_id, (user_type, _) in self.saved_details.items())
+        return user_types
+
+    @staticmethod
+    def filter_desks(desk_ids, user_types, selector):
+        """Filter desk IDs by a selector with optional desk_ids and user fields, given a desk ID -> user type mapping."""
+        unknown = set(selector) - {"desk_ids", "user"}
+        if unknown:
+            raise ValueError(f"Unknown selector fields: {', '.join(sorted(unknown))}")
+        if "desk_ids" in selector:
+            if not isinstance(selector["desk_ids"], list) or not all(isinstance(desk_id, str) for desk_id in selector["desk_ids"]):
+                raise ValueError("desk_ids must be a list of strings")
+            wanted = set(selector["desk_ids"])
+            desk_ids = [desk_id for desk_id in desk_ids if desk_id in wanted]
+        if "user" in selector:
+            desk_ids = [desk_id for desk_id in desk_ids if user_types.get(desk_id) == str(selector["user"]).lower()]
+        return desk_ids
+
+    def _apply_commands(self):
+        """Apply queued updates from the REST API. Must be called with the lock held."""
+        while self.commands:
+            desk_id, category, data = self.commands.popleft()
+            desk = self.desks.get(desk_id)
+            if desk and desk_id not in self.powered_off_desks:
+                desk.update_category(category, data)
 
     def add_desk(self, desk_id, name, manufacturer, user_type: UserType):
-        """Add a new desk with a unique ID."""
+        """Add a new desk with a unique ID. Desks of other shards are skipped."""
+        if not self.owns(desk_id):
+            logger.debug(f"Desk ID={desk_id} belongs to another shard. Skipping addition.")
+            return False
         with self.lock:
-            if desk_id not in self.desks:
-                desk = Desk(desk_id, name, manufacturer)
-                self.desks[desk_id] = desk
-                self.users[desk_id] = self._create_user(desk, user_type)
+            if self._add_desk(desk_id, name, manufacturer, user_type):
                 logger.info(f"Desk ID={desk_id} added with user type {user_type}.")
                 return True
             logger.warning(f"Desk ID={desk_id} already exists. Skipping addition.")
             return False
 
+    def add_desks(self, desks):
+        """Add many desks at once from (desk_id, name, manufacturer, user_type) tuples and return the number added.
+
+        Existing desks and desks of other shards are skipped.
+        """
+        added = 0
+        with self.lock:
+            for desk_id, name, manufacturer, user_type in desks:
+                if self.owns(desk_id) and self._add_desk(desk_id, name, manufacturer, user_type):
+                    added += 1
+        logger.info(f"{added} desks added.")
+        return added
+
+    def _add_desk(self, desk_id, name, manufacturer, user_type):
+        """Add a desk unless one with its ID exists. Must be called with the lock held."""
+        if desk_id in self.desks or desk_id in self.saved_entries:
+            return False
+        desk = Desk(desk_id, name, manufacturer)
+        desk.listener = self._on_desk_change
+        if self.engine:
+            desk = self.engine.add(desk)
+        self.desks[desk_id] = desk
+        self.users[desk_id] = self._create_user(desk, user_type)
+        self._mark_membership_changed(desk_id)
+        return True
+
     def remove_desk(self, desk_id):
         """Remove a desk by its ID."""
         with self.lock:
             if desk_id in self.desks:
                 del self.desks[desk_id]
                 del self.users[desk_id]
+                if self.engine:
+                    self.engine.remove(desk_id)
                 self.powered_off_desks.pop(desk_id, None)
+                self._mark_membership_changed(desk_id)
+                logger.info(f"Desk ID={desk_id} and user removed.")
+                return True
+            if desk_id in self.saved_entries:
+                del self.saved_entries[desk_id]
+                del self.saved_details[desk_id]
+                self._mark_membership_changed(desk_id)
                 logger.info(f"Desk ID={desk_id} and user removed.")
                 return True
             logger.warning(f"Attempted to remove non-existent desk ID={desk_id}.")
@@ -89,7 +426,7 @@ class DeskManager:
         """Check if the current time is during the day."""
         simulated_time_h = (self.current_time_s % self.SECONDS_PER_DAY) / 3600
         daytime = self.DAY_START_HOUR <= simulated_time_h < self.NIGHT_START_HOUR
-        logger.info(f"Daytime check: {'Day' if daytime else 'Night'} (Simulated hour: {simulated_time_h:.2f}).")
+        logger.debug("Daytime check: %s (Simulated hour: %.2f).", "Day" if daytime else "Night", simulated_time_h)
         return daytime
 
     def increment_time(self):
@@ -99,6 +436,28 @@ class DeskManager:
             logger.debug(f"Simulation time incremented to {self.current_time_s} seconds.")
 
 
+    def _create_engine(self, engine, seed):
+        """Create the tick engine. The python engine ticks each Desk object and needs no engine instance."""
+        if engine == "python":
+            return None
+        elif engine == "numpy":
+            logger.info("Using the numpy tick engine.")
+            engine = NumpyTickEngine()
+            engine.listener = self._on_desk_change
+            return engine
+        elif engine == "lazy":
+            logger.info(f"Using the lazy motion engine (seed={seed}).")
+            engine = LazyMotionEngine(seed)
+            engine.listener = self._on_desk_change
+            return engine
+        elif engine == "compact":
+            logger.info("Using the compact desk engine.")
+            engine = CompactTickEngine()
+            engine.listener = self._on_desk_change
+            return engine
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
+
     def _create_user(self, desk, user_type: UserType):
         """Create a behavior instance based on the behavior type."""
         if user_type == UserType.SEATED:
@@ -110,70 +469,174 @@ class DeskManager:
         else:
             raise ValueError(f"Unknown behavior type: {user_type}")
                             
+    def _wait_until_ready(self):
+        """Hold a simulation thread until the saved desks are served. Returns False if the updates stop first."""
+        while not self.ready.wait(0.1):
+            if self.stop_event.is_set():
+                return False
+        return True
+
     def _update_all_desks(self):
         """Continuously update each desk's position."""
+        if not self._wait_until_ready():
+            return
         while not self.stop_event.is_set():
-            with self.lock:
-                for desk_id, desk in self.desks.items():
-                    if desk_id not in self.powered_off_desks:
-                        desk.update()
+            started = time.perf_counter()
+            self._tick()
+            self._observe_loop("tick", started, 1)
             time.sleep(1)
             self.increment_time()
 
+    def _tick(self):
+        """Apply queued updates, advance every desk by one second and publish a snapshot."""
+        with self.lock:
+            self._apply_commands()
+            self._tick_desks()
+            self.tick_count += 1
+            self._publish_snapshot(tick=True)
+
+    def _tick_desks(self):
+        """Advance every powered-on desk by one second. Must be called with the lock held."""
+        if self.engine:
+            self.engine.step(self.powered_off_desks)
+        else:
+            for desk_id, desk in self.desks.items():
+                if desk_id not in self.powered_off_desks:
+                    desk.update()
+
     def _simulate_user_interactions(self):
         """Simulate local user interactions for all desks."""
+        if not self._wait_until_ready():
+            return
         while not self.stop_event.is_set():
-            if self.is_daytime():
-                with self.lock:
-                    for desk_id, user in self.users.items():
-                        if desk_id not in self.powered_off_desks:
-                            logger.debug(f"User simulation for desk {desk_id}.")
-                            user.simulate(5*self.simulation_speed)
-            time.sleep(5)
+            started = time.perf_counter()
+            self._simulate_users_once()
+            self._observe_loop("users", started, self.SIMULATION_INTERVAL_TICKS)
+            time.sleep(self.SIMULATION_INTERVAL_TICKS)
+
+    def _simulate_users_once(self):
+        """Let every user of a powered-on desk act once, during the day."""
+        if self.is_daytime():
+            with self.lock:
+                for desk_id, user in self.users.items():
+                    if desk_id not in self.powered_off_desks:
+                        logger.debug("User simulation for desk %s.", desk_id)
+                        user.simulate(self.SIMULATION_INTERVAL_TICKS*self.simulation_speed)
 
     def _simulate_power_off(self):
         """Randomly power off desks for a period of time."""
+        if not self._wait_until_ready():
+            return
         while not self.stop_event.is_set():
-            with self.lock:
-                if self.desks and random.random() < self.POWER_OFF_CHANCE:
-                    desk_id = random.choice(list(self.desks.keys()))
-                    if desk_id not in self.powered_off_desks:
-                        power_off_duration_s = random.randint(5*60, 2*60*60)
-                        self.powered_off_desks[desk_id] = self.current_time_s + power_off_duration_s
-                        logger.warning(f"Desk ID={desk_id} powered off for {power_off_duration_s // 60} minutes.")
-            time.sleep(5)
+            started = time.perf_counter()
+            self._power_off_once()
+            self._observe_loop("power", started, self.SIMULATION_INTERVAL_TICKS)
+            time.sleep(self.SIMULATION_INTERVAL_TICKS)
+            started = time.perf_counter()
+            self._restore_power_once()
+            self._observe_loop("power", started, self.SIMULATION_INTERVAL_TICKS)
 
-            with self.lock:
-                desks_to_restore = [
-                    desk_id for desk_id, power_on_time_s in self.powered_off_desks.items()
-                    if self.current_time_s >= power_on_time_s
-                ]
-                for desk_id in desks_to_restore:
-                    logger.info(f"Desk ID={desk_id} restored from power-off state.")
-                    del self.powered_off_desks[desk_id]
+    def _power_off_once(self):
+        """Power off a random desk with a small chance."""
+        with self.lock:
+            if self.desks and random.random() < self.POWER_OFF_CHANCE:
+                desk_id = random.choice(list(self.desks.keys()))
+                if desk_id not in self.powered_off_desks:
+                    power_off_duration_s = random.randint(5*60, 2*60*60)
+                    self.powered_off_desks[desk_id] = self.current_time_s + power_off_duration_s
+                    self._mark_membership_changed(desk_id)
+                    if self.trace:
+                        self.trace.write(self.current_time_s, "powerOff", {"desk_id": desk_id, "duration_s": power_off_duration_s})
+                    logger.warning(f"Desk ID={desk_id} powered off for {power_off_duration_s // 60} minutes.")
+
+    def _restore_power_once(self):
+        """Power on the desks whose power-off period is over."""
+        with self.lock:
+            desks_to_restore = [
+                desk_id for desk_id, power_on_time_s in self.powered_off_desks.items()
+                if self.current_time_s >= power_on_time_s
+            ]
+            for desk_id in desks_to_restore:
+                logger.info(f"Desk ID={desk_id} restored from power-off state.")
+                del self.powered_off_desks[desk_id]
+                self._mark_membership_changed(desk_id)
+                if self.trace:
+                    self.trace.write(self.current_time_s, "powerOn", {"desk_id": desk_id})
+
+    def run_virtual(self, duration_s, pause_at_s=()):
+        """Run ticks, user behaviors and power-off events in one thread, as fast as possible, for duration_s simulated seconds."""
+        # A single thread keeps a seeded run reproducible. Pause points are simulated seconds from the start of the run.
+        self.loaded.wait()
+        start_s = self.current_time_s
+        pause_points = sorted(pause_at_s)
+        started = time.monotonic()
+        logger.info(f"Virtual run started: {duration_s} simulated seconds from {start_s}.")
+        tick = 0
+        while not self.stop_event.is_set() and self.current_time_s - start_s < duration_s:
+            pass_started = time.perf_counter()
+            self._tick()
+            self._observe_loop("tick", pass_started)
+            if tick % self.SIMULATION_INTERVAL_TICKS == 0:
+                pass_started = time.perf_counter()
+                self._simulate_users_once()
+                self._observe_loop("users", pass_started)
+                pass_started = time.perf_counter()
+                self._power_off_once()
+                self._restore_power_once()
+                self._observe_loop("power", pass_started)
+            self.increment_time()
+            tick += 1
+            while pause_points and self.current_time_s - start_s >= pause_points[0]:
+                pause_points.pop(0)
+                self._wait_for_resume()
+        logger.info(f"Virtual run finished: {tick} ticks in {time.monotonic() - started:.1f}s, simulated time {self.current_time_s}.")
+
+    def _wait_for_resume(self):
+        """Hold the virtual clock until resume() or stop_updates() is called."""
+        self.paused_at_s = self.current_time_s
+        logger.warning(f"Simulation paused at simulated time {self.current_time_s}.")
+        self.resume_event.wait()
+        self.resume_event.clear()
+        self.paused_at_s = None
+
+    def resume(self):
+        """Continue a virtual run that is paused."""
+        if self.paused_at_s is not None:
+            self.resume_event.set()
+
+    def start_virtual(self, duration_s, pause_at_s=()):
+        """Start a virtual run in the update thread."""
+        self.stop_event.clear()
+        self.update_thread = threading.Thread(target=self.run_virtual, args=(duration_s, pause_at_s), name="desk-ticks")
+        self.update_thread.start()
 
     def start_updates(self):
         """Start the update and simulation threads."""
         if self.update_thread is None or not self.update_thread.is_alive():
             self.stop_event.clear()
-            self.update_thread = threading.Thread(target=self._update_all_desks)
+            self.update_thread = threading.Thread(target=self._update_all_desks, name="desk-ticks")
             self.update_thread.start()
             logger.info("Update thread started.")
 
         if self.simulation_thread is None or not self.simulation_thread.is_alive():
-            self.simulation_thread = threading.Thread(target=self._simulate_user_interactions)
+            self.simulation_thread = threading.Thread(target=self._simulate_user_interactions, name="desk-users")
             self.simulation_thread.start()
             logger.info("User simulation thread started.")
 
         if self.power_off_thread is None or not self.power_off_thread.is_alive():
-            self.power_off_thread = threading.Thread(target=self._simulate_power_off)
+            self.power_off_thread = threading.Thread(target=self._simulate_power_off, name="desk-power")
             self.power_off_thread.start()
             logger.info("Power-off simulation thread started.")
 
     def stop_updates(self):
         """Stop the update and simulation threads."""
+        if self.loader_thread:
+            # Desks that are not built yet are saved as they were loaded
+            self.stop_event.set()
+            self.loader_thread.join()
         if self.update_thread or self.simulation_thread:
             self.stop_event.set()
+            self.resume_event.set()
             if self.update_thread:
                 self.update_thread.join()
                 logger.info("Update thread stopped.")
@@ -183,52 +646,111 @@ class DeskManager:
             if self.power_off_thread:
                 self.power_off_thread.join()
                 logger.info("Power-off simulation thread stopped.")
+        self.events.stop()
+        if self.history is not None:
+            self.history.stop()
+        if self.trace:
+            self.trace.close()
         self.save_state()
+        if self.mqtt:
+            self.mqtt.stop()
 
     def save_state(self):
-        """Save the current state of desks and users."""
-        state = {}
+        """Journal the pending changes and write a final snapshot of desks and users."""
         with self.lock:
-            for desk_id, desk in self.desks.items():
-                state[desk_id] = {
-                    "desk_data": desk.get_data(),
-                    "user": self.users[desk_id].__class__.__name__.replace("User", "").lower(),
-                }
-                state[desk_id]["desk_data"]["clock_s"] = desk.clock_s
-                state["current_time_s"] = self.current_time_s
-                state["simulation_speed"] = self.simulation_speed
-        with open(self.STATE_FILE, "w") as f:
-            json.dump(state, f)
-        logger.info(f"Desk Manager state saved to {self.STATE_FILE}.")
+            self._apply_commands()
+            self._publish_snapshot(tick=True)
+        self.store.stop()
+        logger.info(f"Desk Manager state saved to {self.store.state_file}.")
 
     def load_state(self):
-        """Load the state of desks and users from a JSON file, if it exists."""
-        if os.path.exists(self.STATE_FILE):
-            with open(self.STATE_FILE, "r") as f:
-                try:
-                    data = json.load(f)
-                    self.current_time_s = data.get("current_time_s", 43200)
-                    self.simulation_speed = data.get("simulation_speed", 60)
-                    for desk_id, saved_data in data.items():
-                        if desk_id in [ "current_time_s", "simulation_speed" ]:
-                            continue
-                        desk_data = saved_data["desk_data"]
-                        user_type = UserType(saved_data["user"])
-                        desk = Desk(
-                            desk_id,
-                            desk_data["config"]["name"],
-                            desk_data["config"]["manufacturer"],
-                            desk_data["state"]["position_mm"],
-                        )
-                        desk.config.update(desk_data["config"])
-                        desk.state.update(desk_data["state"])
-                        desk.usage.update(desk_data["usage"])
-                        desk.lastErrors = desk_data["lastErrors"]
-                        desk.clock_s = desk_data["clock_s"]
-                        self.desks[desk_id] = desk
-                        self.users[desk_id] = self._create_user(desk, user_type)
-                    logger.info(f"Desk Manager state loaded from {self.STATE_FILE}")
-                except (json.JSONDecodeError, KeyError, ValueError) as e:
-                    logger.error(f"Failed to load state from {self.STATE_FILE}: {e}. Starting with default state.")
-        else:
-            logger.warning(f"No state file found at {self.STATE_FILE}. Starting with default state.")
+        """Read the desks and users of the last snapshot and the journal after it, and serve the desks from their saved data.
+
+        The desks are built later by _build_saved_desks(), or when they are first written to.
+        """
+        try:
+            data = self.store.load(self.owns, self.tick_count)
+            if data is None:
+                logger.warning(f"No state file found at {self.store.state_file}. Starting with default state.")
+            else:
+                self.current_time_s = data.get("current_time_s", 43200)
+                self.simulation_speed = data.get("simulation_speed", 60)
+                self.loaded_tick = self.tick_count
+                for desk_id, saved_data in data.items():
+                    if desk_id in [ "current_time_s", "simulation_speed" ] or not self.owns(desk_id):
+                        continue
+                    desk_data = saved_data["desk_data"]
+                    user_type = UserType(saved_data["user"])
+                    self.saved_entries[desk_id] = DeskSnapshot(0, {category: desk_data[category] for category in self.FLEET_CATEGORIES})
+                    self.saved_details[desk_id] = (user_type, desk_data["clock_s"])
+                    power_on_time_s = StateStore.power_on_time_of(saved_data, self.current_time_s)
+                    if power_on_time_s is not None:
+                        self.powered_off_desks[desk_id] = power_on_time_s
+                logger.info(f"Desk Manager state loaded from {self.store.state_file}: {len(self.saved_entries)} desks.")
+        except (json.JSONDecodeError, KeyError, ValueError) as e:
+            logger.error(f"Failed to load state from {self.store.state_file}: {e}. Starting with default state.")
+            self.saved_entries.clear()
+            self.saved_details.clear()
+            self.powered_off_desks.clear()
+            self.store.desks.clear()
+        with self.lock:
+            # Powered-off desks are built right away, so that powering them on is saved like any other change
+            for desk_id in self.powered_off_desks:
+                self._build_saved_desk(desk_id)
+            self.changed_desks.update(dict.fromkeys(itertools.chain(self.saved_entries, self.powered_off_desks)))
+            self.membership_changed = True
+            self._publish_snapshot()
+        self.startup_s["ready"] = round(time.perf_counter() - self.created, 3)
+        self.ready.set()
+
+    def start_loading(self, on_loaded=None):
+        """Load the saved state in a background thread and call on_loaded once every desk is built.
+
+        The saved desks are served as soon as the state is read, and built in batches while the simulation runs.
+        Until then, the simulation threads wait and the REST API answers desk requests with 503.
+        """
+        self.loader_thread = threading.Thread(target=self._load, args=(on_loaded,), name="desk-loader")
+        self.loader_thread.start()
+
+    def _load(self, on_loaded=None):
+        self.load_state()
+        self._build_saved_desks()
+        if on_loaded and not self.stop_event.is_set():
+            on_loaded()
+        self._mark_loaded()
+
+    def _mark_loaded(self):
+        self.startup_s["loaded"] = round(time.perf_counter() - self.created, 3)
+        self.loaded.set()
+        logger.info(f"Desk Manager loaded: {len(self.desks)} desks served after {self.startup_s['ready']}s, built after {self.startup_s['loaded']}s.")
+
+    def _build_saved_desks(self):
+        """Build the desks still served from their saved data, a batch per lock acquisition so that ticks and requests go on."""
+        while self.saved_entries and not self.stop_event.is_set():
+            with self.lock:
+                for desk_id in list(itertools.islice(self.saved_entries, self.BUILD_BATCH_SIZE)):
+                    self._build_saved_desk(desk_id)
+
+    def _build_saved_desk(self, desk_id):
+        """Build the desk and user of a saved desk, which are unchanged since they were loaded. Must be called with the lock held."""
+        data = self.saved_entries.pop(desk_id).data
+        user_type, clock_s = self.saved_details.pop(desk_id)
+        desk = Desk(desk_id, data["config"]["name"], data["config"]["manufacturer"], data["state"]["position_mm"])
+        desk.config.update(data["config"])
+        desk.state.update(data["state"])
+        desk.usage.update(data["usage"])
+        # The saved entry stays in the snapshot until the desk changes, so the desk gets its own list
+        desk.lastErrors = list(data["lastErrors"])
+        # Idle since it was loaded, but its clock has been ticking
+        desk.clock_s = clock_s + self.tick_count - self.loaded_tick
+        desk.listener = self._on_desk_change
+        if self.engine:
+            desk = self.engine.add(desk)
+        self.desks[desk_id] = desk
+        self.users[desk_id] = self._create_user(desk, user_type)
+        return desk
+
+    def mark_startup(self, phase):
+        """Record the seconds from startup to a phase, such as the server accepting requests."""
+        self.startup_s[phase] = round(time.perf_counter() - self.created, 3)
+        logger.info(f"Startup phase {phase} reached after {self.startup_s[phase]}s.")
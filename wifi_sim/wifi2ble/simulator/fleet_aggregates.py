@@ -0,0 +1,150 @@
+import collections
+import threading
+from desk import Desk
+
+class FleetAggregates:
+    """Fleet-wide usage, status, collision and position totals, kept up to date from the desks changed on each tick.
+
+    The last contribution of each changed desk is subtracted and that of its new entry added, so updating costs
+    O(changed desks) and a summary is read in constant time, whatever the size of the fleet.
+    """
+    STATUSES = ("Normal", "Collision", "Off")
+    # Width of the position distribution buckets, from Desk.MIN_POSITION to Desk.MAX_POSITION
+    BUCKET_MM = 80
+    BUCKET_COUNT = -(-(Desk.MAX_POSITION - Desk.MIN_POSITION) // BUCKET_MM)
+    # Simulated seconds over which the collision rate is measured
+    RATE_WINDOW_S = 3600
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.moving = 0
+        self.activations = 0
+        self.sit_stand = 0
+        self.statuses = dict.fromkeys(self.STATUSES, 0)
+        self.buckets = [0] * self.BUCKET_COUNT
+        # Desk ID -> (activations, sit/stand crossings, status, moving, bucket, last error) the desk adds to the totals
+        self.contributions = {}
+        self.collisions = 0
+        # (time_s, collisions) of the updates with collisions in the rate window, oldest first
+        self.recent = collections.deque()
+        self.recent_collisions = 0
+        self.started_s = None
+        self.updated_s = None
+
+    def update(self, time_s, snapshot, changed_ids):
+        """Replace the contribution of the changed desks with that of their entry in a fleet snapshot."""
+        # Runs for every moving desk on every tick. Each desk's last contribution is kept, so that the entries
+        # of the previous snapshot are not read again
+        min_position, bucket_mm, last_bucket = Desk.MIN_POSITION, self.BUCKET_MM, self.BUCKET_COUNT - 1
+        contributions, statuses, buckets = self.contributions, self.statuses, self.buckets
+        snapshot_desks, powered_off = snapshot.desks, snapshot.powered_off
+        moving = activations = sit_stand = collisions = 0
+        with self.lock:
+            for desk_id in changed_ids:
+                old = contributions.pop(desk_id, None)
+                if old is not None:
+                    activations -= old[0]
+                    sit_stand -= old[1]
+                    statuses[old[2]] -= 1
+                    moving -= old[3]
+                    buckets[old[4]] -= 1
+                entry = snapshot_desks.get(desk_id)
+                if entry is None:
+                    continue
+                data = entry.data
+                state = data["state"]
+                usage = data["usage"]
+                status = "Off" if desk_id in powered_off else state["status"]
+                bucket = int(state["position_mm"] - min_position) // bucket_mm
+                new = contributions[desk_id] = (
+                    usage["activationsCounter"],
+                    usage["sitStandCounter"],
+                    status,
+                    state["speed_mms"] != 0 and status != "Off",
+                    0 if bucket < 0 else last_bucket if bucket > last_bucket else bucket,
+                    data["lastErrors"][0] if data["lastErrors"] else None,
+                )
+                activations += new[0]
+                sit_stand += new[1]
+                statuses[status] = statuses.get(status, 0) + 1
+                moving += new[3]
+                buckets[new[4]] += 1
+                if old is not None and new[5] is not None and new[5] != old[5]:
+                    collisions += self._new_collisions(old[5], data["lastErrors"])
+            self.moving += moving
+            self.activations += activations
+            self.sit_stand += sit_stand
+            self._count_collisions(time_s, collisions)
+
+    @staticmethod
+    def _new_collisions(last_error, errors):
+        """Count the E93 errors added in front of a desk's previous last error. Several ticks may have been coalesced."""
+        collisions = 0
+        for error in errors:
+            if error == last_error:
+                break
+            if error["errorCode"] == Desk.ERROR_CODE_E93:
+                collisions += 1
+        return collisions
+
+    def _count_collisions(self, time_s, collisions):
+        """Add collisions at a simulated time to the rate window and drop those older than the window. Called with the lock held."""
+        if self.started_s is None:
+            self.started_s = time_s
+        self.updated_s = time_s
+        if collisions:
+            self.collisions += collisions
+            self.recent_collisions += collisions
+            self.recent.append((time_s, collisions))
+        while self.recent and self.recent[0][0] <= time_s - self.RATE_WINDOW_S:
+            self.recent_collisions -= self.recent.popleft()[1]
+
+    def count_status(self, status):
+        """Return the number of desks with a status, including Off for powered-off desks."""
+        return self.statuses.get(status, 0)
+
+    def summary(self, others=()):
+        """Return the totals, combined with those of other aggregates covering other desks."""
+        totals = {"desks": 0, "moving": 0, "activations": 0, "sit_stand": 0, "collisions": 0, "recent_collisions": 0, "span_s": 0}
+        statuses = dict.fromkeys(self.STATUSES, 0)
+        buckets = [0] * self.BUCKET_COUNT
+        time_s = None
+        for aggregates in (self, *others):
+            with aggregates.lock:
+                totals["desks"] += len(aggregates.contributions)
+                totals["moving"] += aggregates.moving
+                totals["activations"] += aggregates.activations
+                totals["sit_stand"] += aggregates.sit_stand
+                totals["collisions"] += aggregates.collisions
+                totals["recent_collisions"] += aggregates.recent_collisions
+                for status, count in aggregates.statuses.items():
+                    statuses[status] = statuses.get(status, 0) + count
+                for i, count in enumerate(aggregates.buckets):
+                    buckets[i] += count
+                if aggregates.updated_s is not None:
+                    totals["span_s"] = max(totals["span_s"], min(aggregates.updated_s - aggregates.started_s, self.RATE_WINDOW_S))
+                    time_s = aggregates.updated_s if time_s is None else max(time_s, aggregates.updated_s)
+        span_s = totals["span_s"]
+        return {
+            "time_s": time_s,
+            "desks": totals["desks"],
+            "movingDesks": totals["moving"],
+            "usage": {
+                "activationsCounter": totals["activations"],
+                "sitStandCounter": totals["sit_stand"],
+            },
+            "status": statuses,
+            "collisions": {
+                "total": totals["collisions"],
+                "lastHour": totals["recent_collisions"],
+                "perHour": round(totals["recent_collisions"] * 3600 / span_s, 2) if span_s else 0.0,
+            },
+            "positions": [
+                {
+                    "from_mm": Desk.MIN_POSITION + i * self.BUCKET_MM,
+                    "to_mm": min(Desk.MIN_POSITION + (i + 1) * self.BUCKET_MM, Desk.MAX_POSITION),
+                    "desks": count,
+                }
+                for i, count in enumerate(buckets)
+            ],
+        }
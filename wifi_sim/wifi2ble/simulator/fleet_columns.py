@@ -0,0 +1,138 @@
+import json
+import struct
+import sys
+from array import array
+
+class FleetColumns:
+    """Compact binary encoding of many desks' data, one column per field instead of one JSON object per desk.
+
+    Layout, little-endian: the magic, the row and column counts, the desk ID column, then each column as its
+    name, a type code and its payload. Numbers are packed arrays, booleans a bitmap, and strings that repeat,
+    like statuses and manufacturers, are stored once and referenced by index.
+    """
+    CONTENT_TYPE = "application/x-desk-columns"
+    MAGIC = b"DKC1"
+    INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+    # Strings are dictionary-encoded when at most this fraction of the rows have distinct values
+    DICTIONARY_RATIO = 0.5
+
+    @classmethod
+    def encode(cls, fleet):
+        """Encode (desk_id, data) pairs whose data maps categories to field dicts, or to lists like lastErrors."""
+        names = {}
+        for _, data in fleet:
+            for category, value in data.items():
+                if isinstance(value, dict):
+                    for field in value:
+                        names.setdefault(f"{category}.{field}", (category, field))
+                else:
+                    names.setdefault(category, (category, None))
+        parts = [cls.MAGIC, struct.pack("<IH", len(fleet), len(names)), cls._encode_column("desk_id", [desk_id for desk_id, _ in fleet])]
+        for name, (category, field) in names.items():
+            if field is None:
+                values = [data.get(category) for _, data in fleet]
+            else:
+                values = [data[category].get(field) if category in data else None for _, data in fleet]
+            parts.append(cls._encode_column(name, values))
+        return b"".join(parts)
+
+    @classmethod
+    def _encode_column(cls, name, values):
+        kind, payload = cls._encode_values(values)
+        name = name.encode("utf-8")
+        return b"".join((struct.pack("<H", len(name)), name, kind, struct.pack("<I", len(payload)), payload))
+
+    @classmethod
+    def _encode_values(cls, values):
+        """Pick the most compact type for a column and return its type code and payload."""
+        types = {type(value) for value in values}
+        if types == {bool}:
+            bits = sum(1 << i for i, value in enumerate(values) if value)
+            return b"b", bits.to_bytes((len(values) + 7) // 8, "little")
+        if types == {int} and all(cls.INT32_MIN <= value <= cls.INT32_MAX for value in values):
+            return b"i", cls._pack(array("i", values))
+        if types and types <= {int, float}:
+            return b"d", cls._pack(array("d", values))
+        if types == {str}:
+            encoded = [value.encode("utf-8") for value in values]
+            lengths = [len(value) for value in encoded]
+            distinct = list(dict.fromkeys(encoded))
+            if max(lengths) <= 0xFFFF and len(distinct) <= 256 and len(distinct) <= len(values) * cls.DICTIONARY_RATIO:
+                index = {value: i for i, value in enumerate(distinct)}
+                dictionary = cls._pack(array("H", [len(value) for value in distinct])) + b"".join(distinct)
+                return b"s", struct.pack("<H", len(distinct)) + dictionary + bytes(index[value] for value in encoded)
+            if max(lengths) <= 0xFFFF:
+                return b"t", cls._pack(array("H", lengths)) + b"".join(encoded)
+        # Mixed types, missing fields and nested lists fall back to one JSON array
+        return b"j", json.dumps(values, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def _pack(values):
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values.tobytes()
+
+    @staticmethod
+    def _unpack(typecode, payload, count=None):
+        values = array(typecode)
+        values.frombytes(payload if count is None else payload[:count * values.itemsize])
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    @classmethod
+    def decode(cls, body):
+        """Decode a body back into (desk_id, data) pairs. Integers mixed with floats in a column come back as floats."""
+        if body[:4] != cls.MAGIC:
+            raise ValueError("Not a desk columns body")
+        rows, column_count = struct.unpack_from("<IH", body, 4)
+        offset = 10
+        columns = []
+        for _ in range(column_count + 1):
+            (name_length,) = struct.unpack_from("<H", body, offset)
+            name = body[offset + 2:offset + 2 + name_length].decode("utf-8")
+            offset += 2 + name_length
+            kind = body[offset:offset + 1]
+            (payload_length,) = struct.unpack_from("<I", body, offset + 1)
+            payload = body[offset + 5:offset + 5 + payload_length]
+            offset += 5 + payload_length
+            columns.append((name, cls._decode_values(kind, payload, rows)))
+        fleet = [(desk_id, {}) for desk_id in columns[0][1]]
+        for name, values in columns[1:]:
+            category, _, field = name.partition(".")
+            for (_, data), value in zip(fleet, values):
+                if field:
+                    data.setdefault(category, {})[field] = value
+                else:
+                    data[category] = value
+        return fleet
+
+    @classmethod
+    def _decode_values(cls, kind, payload, rows):
+        if kind == b"b":
+            bits = int.from_bytes(payload, "little")
+            return [bool(bits >> i & 1) for i in range(rows)]
+        if kind == b"i":
+            return cls._unpack("i", payload).tolist()
+        if kind == b"d":
+            return cls._unpack("d", payload).tolist()
+        if kind == b"s":
+            (count,) = struct.unpack_from("<H", payload)
+            lengths = cls._unpack("H", payload[2:], count)
+            offset = 2 + 2 * count
+            distinct = []
+            for length in lengths:
+                distinct.append(payload[offset:offset + length].decode("utf-8"))
+                offset += length
+            return [distinct[i] for i in payload[offset:offset + rows]]
+        if kind == b"t":
+            lengths = cls._unpack("H", payload, rows)
+            offset = 2 * rows
+            values = []
+            for length in lengths:
+                values.append(payload[offset:offset + length].decode("utf-8"))
+                offset += length
+            return values
+        if kind == b"j":
+            return json.loads(payload)
+        raise ValueError(f"Unknown column type: {kind!r}")
@@ -0,0 +1,46 @@
+import itertools
+
+class DeskSnapshot:
+    """Immutable copy of one desk's data and version. The data dicts must never be mutated."""
+    __slots__ = ("version", "data")
+
+    def __init__(self, version, data):
+        self.version = version
+        self.data = data
+
+class FleetSnapshot:
+    """Consistent view of the fleet published by the tick loop. Readers use it without locking."""
+
+    def __init__(self, sequence=0, desks=None, desk_ids=(), powered_off=frozenset()):
+        self.sequence = sequence
+        self.desks = desks or {}
+        self.desk_ids = desk_ids
+        self.powered_off = powered_off
+
+    def get(self, desk_id):
+        """Get a desk's snapshot, or None if it does not exist or is powered off."""
+        if desk_id in self.powered_off:
+            return None
+        return self.desks.get(desk_id)
+
+    def publish(self, desks, changed_ids, powered_off, membership_changed, saved=None):
+        """Return the next snapshot, re-reading only the changed desks from the live desks.
+
+        saved maps the IDs of desks that are not built yet to their entry of the saved state, listed after the live desks.
+        """
+        saved = saved or {}
+        entries = dict(self.desks) if changed_ids else self.desks
+        for desk_id in changed_ids:
+            desk = desks.get(desk_id)
+            if desk is not None:
+                entries[desk_id] = DeskSnapshot(desk.version, desk.get_data())
+            elif desk_id in saved:
+                entries[desk_id] = saved[desk_id]
+            else:
+                entries.pop(desk_id, None)
+        if membership_changed:
+            desk_ids = tuple(desk_id for desk_id in itertools.chain(desks, saved) if desk_id not in powered_off)
+            powered_off = frozenset(powered_off)
+        else:
+            desk_ids, powered_off = self.desk_ids, self.powered_off
+        return FleetSnapshot(self.sequence + 1, entries, desk_ids, powered_off)
@@ -0,0 +1,157 @@
+import json
+import queue
+import threading
+import time
+import logging
+from http.server import HTTPServer
+
+logger = logging.getLogger(__name__)
+
+class DetachableHTTPServer(HTTPServer):
+    """HTTP server that lets a handler take over its connection instead of having it closed when the handler returns."""
+
+    def __init__(self, server_address, handler_class, reuse_port=False):
+        # Lets several processes listen on the same port, with the kernel spreading connections between them
+        self.allow_reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
+        self.detached_requests = set()
+        # Handshakes by result ("full", "resumed", "failed") once TLS is enabled
+        self.tls_handshakes = None
+        self.tls_lock = threading.Lock()
+        self.tls_handshake_timeout = None
+        self.tls_observer = None
+
+    def enable_tls(self, context, handshake_timeout=5.0, observer=None):
+        """Serve over TLS. Handshakes happen when a connection is served rather than when it is accepted,
+        so that a slow client cannot stall the accept loop. observer(seconds, result) is called after each handshake."""
+        self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+        self.tls_handshakes = {"full": 0, "resumed": 0, "failed": 0}
+        self.tls_handshake_timeout = handshake_timeout
+        self.tls_observer = observer
+
+    def tls_stats(self):
+        """Return the number of full, resumed and failed TLS handshakes."""
+        with self.tls_lock:
+            return dict(self.tls_handshakes or {})
+
+    def _handshake(self, request, client_address):
+        """Complete the TLS handshake of an accepted connection within the handshake timeout. Returns whether it succeeded."""
+        started = time.perf_counter()
+        timeout = request.gettimeout()
+        request.settimeout(self.tls_handshake_timeout)
+        try:
+            request.do_handshake()
+            result = "resumed" if request.session_reused else "full"
+        except OSError as e:
+            logger.info("TLS handshake failed: %s - %s", client_address[0], e)
+            result = "failed"
+        finally:
+            request.settimeout(timeout)
+        elapsed = time.perf_counter() - started
+        with self.tls_lock:
+            self.tls_handshakes[result] += 1
+        if self.tls_observer:
+            self.tls_observer(elapsed, result)
+        return result != "failed"
+
+    def finish_request(self, request, client_address):
+        if self.tls_handshakes is not None and not self._handshake(request, client_address):
+            return
+        super().finish_request(request, client_address)
+
+    def detach_request(self, request):
+        """Keep the connection open after the handler returns. The caller becomes responsible for closing it."""
+        self.detached_requests.add(request)
+
+    def shutdown_request(self, request):
+        if request in self.detached_requests:
+            self.detached_requests.discard(request)
+            return
+        super().shutdown_request(request)
+
+class WorkerPoolHTTPServer(DetachableHTTPServer):
+    """HTTP server that hands accepted connections to a bounded pool of worker threads."""
+    RETRY_AFTER_S = 1
+    OVERLOADED_BODY = json.dumps({"error": "Server overloaded"}).encode("utf-8")
+    # Written without reading the request, so it cannot depend on the request's protocol version
+    OVERLOADED_RESPONSE = (
+        "HTTP/1.1 503 Service Unavailable\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(OVERLOADED_BODY)}\r\n"
+        f"Retry-After: {RETRY_AFTER_S}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode("ascii") + OVERLOADED_BODY
+
+    def __init__(self, server_address, handler_class, workers=16, queue_size=64, reuse_port=False, shed_load=False, max_queue_wait=1.0):
+        if shed_load:
+            # A shedding server accepts as fast as it can; a short listen backlog would make clients retry their SYN after 1s instead
+            self.request_queue_size = max(self.request_queue_size, 128)
+        super().__init__(server_address, handler_class, reuse_port)
+        self.pending_requests = queue.Queue(maxsize=queue_size)
+        self.shed_load = shed_load
+        self.max_queue_wait = max_queue_wait
+        self.shed_lock = threading.Lock()
+        self.shed = {"queue_full": 0, "queue_wait": 0}
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._process_pending_requests, name=f"http-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        logger.info(f"Worker pool started with {workers} workers and a queue of {queue_size} connections.")
+
+    def process_request(self, request, client_address):
+        """Queue the connection for a worker. While the queue is full, block the accept loop or shed the connection."""
+        if not self.shed_load:
+            self.pending_requests.put((request, client_address, None))
+            return
+        try:
+            self.pending_requests.put_nowait((request, client_address, time.monotonic()))
+        except queue.Full:
+            self._shed_request(request, client_address, "queue_full")
+
+    def _shed_request(self, request, client_address, reason):
+        """Answer a connection with 503 Service Unavailable without reading the request, and close it."""
+        with self.shed_lock:
+            self.shed[reason] += 1
+        if self.tls_handshakes is not None and (reason == "queue_full" or not self._handshake(request, client_address)):
+            # Answering would need a handshake on the accept loop; the client sees the connection close instead
+            self.shutdown_request(request)
+            return
+        try:
+            request.sendall(self.OVERLOADED_RESPONSE)
+            # Unread request bytes would make the close reset the connection before the client reads the response
+            request.setblocking(False)
+            request.recv(65536)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def shed_stats(self):
+        """Return the number of connections shed because the queue was full or they waited too long in it."""
+        with self.shed_lock:
+            return dict(self.shed)
+
+    def _process_pending_requests(self):
+        """Serve queued connections until the server is closed."""
+        while True:
+            item = self.pending_requests.get()
+            if item is None:
+                return
+            request, client_address, queued_at = item
+            if queued_at is not None and time.monotonic() - queued_at > self.max_queue_wait:
+                # The client has waited long enough that a fast 503 is better than a slow answer
+                self._shed_request(request, client_address, "queue_wait")
+                continue
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        """Close the listening socket and let the workers exit once the queue drains."""
+        super().server_close()
+        for _ in self.workers:
+            self.pending_requests.put(None)
+        logger.info("Worker pool stopping.")
@@ -0,0 +1,305 @@
+import heapq
+import itertools
+import math
+import random
+import threading
+import logging
+from desk import Desk
+
+logger = logging.getLogger(__name__)
+
+class LazyDeskView:
+    """Desk whose motion is stored as a segment (start tick, start position, target, direction) and evaluated on read."""
+
+    def __init__(self, engine, desk: Desk):
+        self.engine = engine
+        self.lock = engine.lock
+        self.desk_id = desk.desk_id
+        self.config = desk.config
+        self.min_position = desk.min_position
+        self.max_position = desk.max_position
+        self.sit_stand_position = desk.sit_stand_position
+        state = desk.state
+        self.status = state["status"]
+        self.position_lost = state["isPositionLost"]
+        self.overload_up = state["isOverloadProtectionUp"]
+        self.overload_down = state["isOverloadProtectionDown"]
+        self.anti_collision = state["isAntiCollision"]
+        self.activations = desk.usage["activationsCounter"]
+        self.sit_stand_counter = desk.usage["sitStandCounter"]
+        self.lastErrors = desk.lastErrors
+        self.version = desk.version
+        self.clock_offset = engine.now - desk.clock_s
+        # Clock and pending collision flag of a powered-off desk, which does not tick
+        self.paused_clock = None
+        self.collision_pending = False
+        # Tick on which the collision flag is cleared; the desk does not move on that tick
+        self.collision_clear_tick = engine.now + 1 if desk.collision_occurred else 0
+        # Motion segment: position and speed at start_tick, moving towards the target from start_tick + 1
+        self.segment = 0
+        self.start_tick = engine.now
+        self.start_position = state["position_mm"]
+        self.start_speed = state["speed_mms"]
+        self.target_position_mm = desk.target_position_mm
+        self.direction = 0
+        self.moving_ticks = 0
+
+    def _position_at(self, tick):
+        """Position after the given tick, computed from the motion segment."""
+        elapsed = tick - self.start_tick
+        if elapsed <= 0 or self.direction == 0:
+            return self.start_position
+        distance = abs(self.target_position_mm - self.start_position)
+        return self.start_position + self.direction * min(Desk.DEFAULT_SPEED_MMS * elapsed, distance)
+
+    def _speed_at(self, tick):
+        """Speed after the given tick, computed from the motion segment."""
+        elapsed = tick - self.start_tick
+        if elapsed <= 0:
+            return self.start_speed
+        return self.direction * Desk.DEFAULT_SPEED_MMS if elapsed <= self.moving_ticks else 0
+
+    def _current_tick(self):
+        """The engine tick the desk's state is evaluated at. A powered-off desk stays at its last tick."""
+        return self.engine.now if self.paused_clock is None else self.start_tick
+
+    @property
+    def state(self):
+        with self.lock:
+            tick = self._current_tick()
+            return {
+                "position_mm": self._position_at(tick),
+                "speed_mms": self._speed_at(tick),
+                "status": self.status,
+                "isPositionLost": self.position_lost,
+                "isOverloadProtectionUp": self.overload_up,
+                "isOverloadProtectionDown": self.overload_down,
+                "isAntiCollision": self.anti_collision,
+            }
+
+    @property
+    def usage(self):
+        return {
+            "activationsCounter": self.activations,
+            "sitStandCounter": self.sit_stand_counter,
+        }
+
+    @property
+    def clock_s(self):
+        return self.engine.now - self.clock_offset if self.paused_clock is None else self.paused_clock
+
+    @property
+    def collision_occurred(self):
+        return self.engine.now < self.collision_clear_tick
+
+    def get_target_position(self):
+        """Get the target position to move towards"""
+        with self.lock:
+            return self.target_position_mm
+
+    def clamp_position(self, position_mm):
+        """Return the position the desk would accept as a target."""
+        return max(self.min_position, min(position_mm, self.max_position))
+
+    def set_target_position(self, position_mm):
+        """Set the target position to move towards, respecting min and max limits."""
+        with self.lock:
+            engine = self.engine
+            tick = self._current_tick()
+            position = self._position_at(tick)
+            engine.start_segment(self, position, self._speed_at(tick), tick, self.clamp_position(position_mm))
+            logger.info("Desk target position set: ID=%s, Requested=%s, Accepted=%s", self.desk_id, position_mm, self.target_position_mm)
+            if position_mm != position:
+                self.activations += 1
+                self.version += 1
+                if engine.listener:
+                    engine.listener(self, "usage")
+                logger.info("Desk activated: ID=%s, ActivationCounter=%s", self.desk_id, self.activations)
+
+    def get_data(self):
+        """Get a copy of the desk's data."""
+        with self.lock:
+            return {
+                "config": dict(self.config),
+                "state": self.state,
+                "usage": self.usage,
+                "lastErrors": [dict(error) for error in self.lastErrors],
+            }
+
+    def update_category(self, category, data):
+        """Update a specific category of the desk."""
+        with self.lock:
+            if category == "state" and "position_mm" in data:
+                self.set_target_position(data["position_mm"])
+                return True
+
+            return False
+
+class LazyMotionEngine:
+    """Evaluates desk motion in closed form and only does work for moving desks and scheduled events."""
+    # Events on the same tick are applied in this order, so a crossing is counted before a collision ends the segment
+    EVENT_RESET = 0
+    EVENT_CROSSING = 1
+    EVENT_COLLISION = 2
+    EVENT_STOP = 3
+
+    def __init__(self, seed=None):
+        self.lock = threading.RLock()
+        self.rng = random.Random(seed)
+        self.now = 0
+        self.views = {}
+        # Desks with an unfinished motion segment; each changes position on every tick of it
+        self.moving = set()
+        self.paused = set()
+        # Heap of (tick, event, sequence, view, segment); entries of replaced segments are skipped
+        self.events = []
+        self.sequence = itertools.count()
+        # Called as listener(view, kind) for every desk that changes, with the same kinds as Desk.listener
+        self.listener = None
+
+    def add(self, desk: Desk):
+        """Copy a desk into the engine and return the view that replaces it."""
+        with self.lock:
+            view = LazyDeskView(self, desk)
+            self.views[desk.desk_id] = view
+            state = desk.state
+            self.start_segment(view, state["position_mm"], state["speed_mms"], self.now, desk.target_position_mm)
+            return view
+
+    def attach(self, desks):
+        """Move a dict of desks into the engine and return the matching dict of views."""
+        return {desk_id: self.add(desk) for desk_id, desk in desks.items()}
+
+    def remove(self, desk_id):
+        """Stop simulating a desk."""
+        with self.lock:
+            view = self.views.pop(desk_id, None)
+            if view is not None:
+                view.segment += 1
+                self.moving.discard(view)
+                self.paused.discard(desk_id)
+
+    def start_segment(self, view, position, speed, tick, target):
+        """Replace a desk's motion segment and schedule its sit/stand crossing, collision and stop events."""
+        view.segment += 1
+        view.start_position = position
+        view.start_speed = speed
+        view.start_tick = max(tick, view.collision_clear_tick)
+        view.target_position_mm = target
+        distance = target - position
+        view.direction = (distance > 0) - (distance < 0)
+        view.moving_ticks = math.ceil(abs(distance) / Desk.DEFAULT_SPEED_MMS)
+        self.moving.discard(view)
+        if view.paused_clock is not None:
+            return
+
+        start, moving_ticks = view.start_tick, view.moving_ticks
+        if moving_ticks == 0:
+            if speed != 0:
+                self._schedule(start + 1, self.EVENT_STOP, view)
+            return
+
+        self.moving.add(view)
+        first_roll = 1
+        if view.anti_collision:
+            self._schedule(start + 1, self.EVENT_RESET, view)
+            first_roll = 2
+        collision_tick = first_roll + self._sample_collision_ticks() - 1
+        if collision_tick <= moving_ticks:
+            self._schedule(start + collision_tick, self.EVENT_COLLISION, view)
+
+        sit_stand = view.sit_stand_position
+        if position < sit_stand <= target:
+            self._schedule(start + math.ceil((sit_stand - position) / Desk.DEFAULT_SPEED_MMS), self.EVENT_CROSSING, view)
+        elif position > sit_stand >= target:
+            self._schedule(start + math.ceil((position - sit_stand) / Desk.DEFAULT_SPEED_MMS), self.EVENT_CROSSING, view)
+
+        if collision_tick > moving_ticks:
+            self._schedule(start + moving_ticks + 1, self.EVENT_STOP, view)
+
+    def _schedule(self, tick, event, view):
+        heapq.heappush(self.events, (tick, event, next(self.sequence), view, view.segment))
+
+    def _sample_collision_ticks(self):
+        """Number of moving ticks up to and including the first collision, drawn from a geometric distribution."""
+        if Desk.COLLISION_CHANCE <= 0:
+            return math.inf
+        return int(math.log(1.0 - self.rng.random()) / math.log(1.0 - Desk.COLLISION_CHANCE)) + 1
+
+    def step(self, skip_ids=()):
+        """Advance the engine by one second, skipping the given desk IDs. Mirrors Desk.update() for every desk."""
+        with self.lock:
+            paused = {desk_id for desk_id in skip_ids if desk_id in self.views}
+            for desk_id in paused - self.paused:
+                self._pause(self.views[desk_id])
+            self.now += 1
+            for desk_id in self.paused - paused:
+                self._resume(self.views[desk_id])
+            self.paused = paused
+
+            changes = []
+            while self.events and self.events[0][0] <= self.now:
+                _, event, _, view, segment = heapq.heappop(self.events)
+                if segment == view.segment:
+                    self._apply_event(event, view, changes)
+
+            moving = 0
+            for view in self.moving:
+                if 1 <= self.now - view.start_tick <= view.moving_ticks:
+                    view.version += 1
+                    changes.append((view, "state"))
+                    moving += 1
+
+            if self.listener:
+                for view, kind in changes:
+                    self.listener(view, kind)
+
+            logger.debug(f"Tick advanced: moving={moving}, changes={len(changes)}, scheduledEvents={len(self.events)}")
+
+    def _apply_event(self, event, view, changes):
+        """Apply a scheduled event that is due on the current tick."""
+        now = self.now
+        if event == self.EVENT_RESET:
+            view.anti_collision = False
+            view.status = "Normal"
+            logger.info("Desk reset from collision: ID=%s, Time=%s", view.desk_id, view.clock_s)
+        elif event == self.EVENT_CROSSING:
+            view.sit_stand_counter += 1
+            logger.info("Desk crossed sit/stand position: ID=%s, SitStandCounter=%s", view.desk_id, view.sit_stand_counter)
+        elif event == self.EVENT_COLLISION:
+            position = view._position_at(now)
+            view.lastErrors.insert(0, {"time_s": view.clock_s, "errorCode": Desk.ERROR_CODE_E93})
+            if len(view.lastErrors) > Desk.MAX_ERROR_COUNT:
+                view.lastErrors.pop()
+            view.anti_collision = True
+            view.status = "Collision"
+            logger.error("Desk collision detected: ID=%s, Time=%s, Position=%s", view.desk_id, view.clock_s, position)
+            if view.direction > 0:
+                position = max(position - 10, view.min_position)
+            else:
+                position = min(position + 10, view.max_position)
+            view.collision_clear_tick = now + 1
+            self.start_segment(view, position, 0, now, position)
+            view.version += 1
+            changes.append((view, "collision"))
+            changes.append((view, "state"))
+        elif event == self.EVENT_STOP:
+            self.start_segment(view, view.target_position_mm, 0, now, view.target_position_mm)
+            view.version += 1
+            changes.append((view, "state"))
+
+    def _pause(self, view):
+        """Freeze a desk that was powered off after the current tick."""
+        tick = self.now
+        view.collision_pending = view.collision_clear_tick > tick
+        position, speed = view._position_at(tick), view._speed_at(tick)
+        view.paused_clock = view.clock_s
+        self.start_segment(view, position, speed, tick, view.target_position_mm)
+
+    def _resume(self, view):
+        """Let a powered-on desk tick again from the current tick."""
+        view.clock_offset = self.now - view.paused_clock - 1
+        view.paused_clock = None
+        if view.collision_pending:
+            view.collision_clear_tick = self.now
+        self.start_segment(view, view.start_position, view.start_speed, self.now - 1, view.target_position_mm)
@@ -0,0 +1,118 @@
+import copy
+import queue
+import threading
+import time
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger(__name__)
+
+# Loggers whose records below WARNING can be rate-limited, by category
+LOG_CATEGORIES = {
+    "movement": ("desk", "users", "numpy_engine", "lazy_engine", "compact_engine"),
+    "requests": ("simple_rest_server",),
+}
+
+def parse_log_rates(value):
+    """Parse per-category rate limits such as movement=10,requests=100 into records per second."""
+    rates = {}
+    for item in value.split(","):
+        category, _, rate = item.partition("=")
+        if category not in LOG_CATEGORIES:
+            raise ValueError(f"Unknown log category: {category}")
+        rates[category] = float(rate)
+        if not rates[category] > 0:
+            raise ValueError(f"Log rate of {category} must be positive")
+    return rates
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most a given number of records per second for each category. Warnings and errors always pass."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.categories = {name: category for category, names in LOG_CATEGORIES.items() if category in rates for name in names}
+        self.rates = dict(rates)
+        self.lock = threading.Lock()
+        # Token bucket per category, holding one second of records, or one record for rates below one per second
+        self.capacities = {category: max(1.0, rate) for category, rate in self.rates.items()}
+        self.tokens = dict(self.capacities)
+        self.refilled_at = dict.fromkeys(self.rates, time.monotonic())
+        self.dropped = dict.fromkeys(self.rates, 0)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        category = self.categories.get(record.name)
+        if category is None:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            rate = self.rates[category]
+            tokens = min(self.capacities[category], self.tokens[category] + (now - self.refilled_at[category]) * rate)
+            self.refilled_at[category] = now
+            if tokens >= 1:
+                self.tokens[category] = tokens - 1
+                return True
+            self.tokens[category] = tokens
+            self.dropped[category] += 1
+            return False
+
+class LazyQueueHandler(QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread."""
+
+    def prepare(self, record):
+        # QueueHandler formats the message in the logging thread. Hot-path records only carry immutable arguments,
+        # so formatting them later in the listener gives the same text. Tracebacks are rendered now, before frames change.
+        if record.exc_info:
+            record = copy.copy(record)
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class LogPipeline:
+    """Optionally moves the root logger's handlers behind a queue and a listener thread, and rate-limits log categories."""
+
+    def __init__(self, rates=None, asynchronous=False):
+        self.rate_filter = RateLimitFilter(rates) if rates else None
+        self.asynchronous = asynchronous
+        self.queue = None
+        self.queue_handler = None
+        self.listener = None
+
+    def start(self):
+        """Install the filter and, in asynchronous mode, the queue handler on the root logger."""
+        root = logging.getLogger()
+        handlers = list(root.handlers)
+        if self.asynchronous:
+            self.queue = queue.SimpleQueue()
+            self.queue_handler = LazyQueueHandler(self.queue)
+            if self.rate_filter:
+                self.queue_handler.addFilter(self.rate_filter)
+            for handler in handlers:
+                root.removeHandler(handler)
+            root.addHandler(self.queue_handler)
+            self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+            self.listener.start()
+        elif self.rate_filter:
+            for handler in handlers:
+                handler.addFilter(self.rate_filter)
+        logger.info(f"Log pipeline started: asynchronous={self.asynchronous}, rates={self.rate_filter.rates if self.rate_filter else 'none'}.")
+
+    def stop(self):
+        """Write the queued records, stop the listener thread and log synchronously again."""
+        logger.info(f"Log pipeline stopping: {self.stats()}")
+        if self.listener:
+            root = logging.getLogger()
+            root.removeHandler(self.queue_handler)
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                if self.rate_filter:
+                    handler.addFilter(self.rate_filter)
+                root.addHandler(handler)
+            self.listener = None
+
+    def stats(self):
+        """Return the number of dropped records per category and of records waiting for the listener."""
+        stats = {f"dropped_{category}": count for category, count in (self.rate_filter.dropped.items() if self.rate_filter else ())}
+        stats["queued"] = self.queue.qsize() if self.queue else 0
+        return stats
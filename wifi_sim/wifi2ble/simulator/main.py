@@ -1,11 +1,26 @@
 import argparse
+import collections
+import gc
 import ssl
+import sys
+import time
+import pickle
 import random
+import signal
+import threading
+import multiprocessing
 import logging
-from http.server import HTTPServer
 from users import UserType
 from desk_manager import DeskManager
 from simple_rest_server import SimpleRESTServer
+from response_cache import ResponseCache
+from http_servers import DetachableHTTPServer, WorkerPoolHTTPServer
+from log_pipeline import LogPipeline, parse_log_rates
+from shards import ShardedFleet
+from admission import KeyRateLimiter, parse_rate_limits
+from mqtt_bridge import MqttBridge
+from debug_profiler import DebugProfiler
+from traffic_recorder import TrafficRecorder
 
 logger = logging.getLogger("main")
 
@@ -27,50 +42,268 @@ def generate_desk_id():
 def generate_desk_name():
     return f"DESK {random.randint(1000, 9999)}"
 
-def run(server_class=HTTPServer, handler_class=SimpleRESTServer, port=8000, use_https=False, cert_file=None, key_file=None, desks=2, speed=60):
-    logger.info(f"Initializing DeskManager with simulation speed: {speed}")
-    desk_manager = DeskManager(speed)
-    
+def parse_duration(value):
+    """Parse a simulated duration such as 3600, 90m, 12h or 7d into seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def parse_durations(value):
+    """Parse a comma-separated list of simulated durations into seconds."""
+    return [parse_duration(item) for item in value.split(",") if item]
+
+def parse_broker(value):
+    """Parse an MQTT broker address such as localhost or mosquitto:1883 into a host and port."""
+    host, _, port = value.rpartition(":")
+    if not host:
+        return value, 1883
+    return host, int(port)
+
+def resume_on_enter(desk_manager):
+    """Resume a paused virtual run each time Enter is pressed."""
+    for _ in sys.stdin:
+        desk_manager.resume()
+
+def add_initial_desks(desk_manager, desks, shard=None):
+    """Add the default desks, then generated desks until the fleet has the requested number."""
     logger.info("Adding default desks...")
-    desk_manager.add_desk("cd:fb:1a:53:fb:e6", "DESK 4486", "Desk-O-Matic Co.", UserType.ACTIVE)
-    desk_manager.add_desk("ee:62:5b:b8:73:1d", "DESK 6743", "Desk-O-Matic Co.", UserType.STANDING)
-    
-    if len(desk_manager.get_desk_ids()) < desks:
-        logger.info(f"Adding {desks - len(desk_manager.get_desk_ids())} additional desks.")
-        for i in range(desks - len(desk_manager.get_desk_ids())):
-            desk_manager.add_desk(generate_desk_id(), generate_desk_name(), "Desk-O-Matic Co.", UserType.ACTIVE)
-    
-    desk_manager.start_updates()
+    desk_manager.add_desks([
+        ("cd:fb:1a:53:fb:e6", "DESK 4486", "Desk-O-Matic Co.", UserType.ACTIVE),
+        ("ee:62:5b:b8:73:1d", "DESK 6743", "Desk-O-Matic Co.", UserType.STANDING),
+    ])
+    # A shard adds its share of the desks, keeping only the generated IDs it owns
+    missing = (desks if shard is None else -(-desks // shard[1])) - len(desk_manager.get_desk_ids())
+    if missing > 0:
+        logger.info(f"Adding {missing} additional desks.")
+        while missing > 0:
+            missing -= desk_manager.add_desks([(generate_desk_id(), generate_desk_name(), "Desk-O-Matic Co.", UserType.ACTIVE) for _ in range(missing)])
+
+def finish_loading(desk_manager, desks, shard=None):
+    """Resume garbage collection once the saved desks are built, then add the initial desks."""
+    # The built desks live as long as the server: frozen, they are left out of later full collections
+    gc.collect()
+    gc.freeze()
+    gc.enable()
+    add_initial_desks(desk_manager, desks, shard)
+
+def create_http_server(server_address, handler, server_mode="single", workers=16, queue_size=64, reuse_port=False, shed_load=False, max_queue_wait=1.0):
+    """Create the HTTP server for the selected serving mode."""
+    if server_mode == "single":
+        return DetachableHTTPServer(server_address, handler, reuse_port)
+    elif server_mode == "pool":
+        return WorkerPoolHTTPServer(server_address, handler, workers=workers, queue_size=queue_size, reuse_port=reuse_port,
+                                    shed_load=shed_load, max_queue_wait=max_queue_wait)
+    else:
+        raise ValueError(f"Unknown server mode: {server_mode}")
+
+def create_handler(desk_manager, handler_class=SimpleRESTServer, server_mode="single", keep_alive_timeout=15, response_cache=None, rate_limiter=None,
+                   profiler=None, recorder=None):
+    """Create the request handler factory that binds handlers to the desk manager."""
+    # A single-threaded server must close each connection, otherwise one idle keep-alive client blocks everyone else.
+    keep_alive = server_mode != "single"
 
     def handler(*args, **kwargs):
-        handler_class(desk_manager, *args, **kwargs)
+        if keep_alive:
+            handler_class(desk_manager, *args, protocol_version="HTTP/1.1", timeout=keep_alive_timeout,
+                          response_cache=response_cache, rate_limiter=rate_limiter, profiler=profiler, recorder=recorder, **kwargs)
+        else:
+            handler_class(desk_manager, *args, response_cache=response_cache, rate_limiter=rate_limiter, profiler=profiler, recorder=recorder,
+                          **kwargs)
+    return handler
+
+def create_tls_context(cert_file, key_file, session_tickets=2):
+    """Create the TLS context of the servers. Servers sharing a context can resume each other's sessions."""
+    if not cert_file or not key_file:
+        logger.error("Both certificate and key files must be provided for HTTPS.")
+        raise ValueError("Both certificate and key files must be provided for HTTPS.")
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+    # Tickets sent after a full TLS 1.3 handshake, each good for one resumption. 0 disables session tickets
+    context.num_tickets = session_tickets
+    if session_tickets == 0:
+        context.options |= ssl.OP_NO_TICKET
+    return context
+
+def enable_https(httpd, cert_file=None, key_file=None, context=None, handshake_timeout=5.0, observer=None):
+    """Serve over TLS with a context, or one created from the certificate and key files."""
+    context = context or create_tls_context(cert_file, key_file)
+    if hasattr(httpd, "enable_tls"):
+        httpd.enable_tls(context, handshake_timeout, observer)
+    else:
+        httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+
+def tls_stats(servers):
+    """Add up the full, resumed and failed TLS handshakes of servers."""
+    totals = collections.Counter()
+    for server in servers:
+        if hasattr(server, "tls_stats"):
+            totals.update(server.tls_stats())
+    return dict(totals)
+
+def run(server_class=None, handler_class=SimpleRESTServer, port=8000, use_https=False, cert_file=None, key_file=None, desks=2, speed=60,
+        server_mode="single", workers=16, queue_size=64, keep_alive_timeout=15, engine="python", seed=None,
+        response_cache_size=1024, virtual_duration=None, pause_at=(), trace_file=None, snapshot_interval=60, log_pipeline=None,
+        shard=None, inboxes=None, epoch=None, rate_limits=None, shed_load=False, max_queue_wait=1.0, history_size=512,
+        tls_tickets=2, tls_handshake_timeout=5.0, mqtt_broker=None, mqtt_username=None, mqtt_password=None,
+        mqtt_topic_prefix=MqttBridge.TOPIC_PREFIX, mqtt_interval=MqttBridge.FLUSH_INTERVAL_S, debug_endpoints=False, record_traffic=None):
+    if seed is not None:
+        random.seed(seed)
+    logger.info(f"Initializing DeskManager with simulation speed: {speed}")
+    # A server loads the saved state in the background and answers 503 until the saved desks are served
+    load_in_background = virtual_duration is None
+    if shard:
+        # Each shard keeps its own snapshot and journal, and starts from the unsharded state on the first run
+        desk_manager = DeskManager(speed, engine=engine, seed=seed, snapshot_interval_s=snapshot_interval, shard=shard, epoch=epoch,
+                                   state_file=f"data/desks_state.shard-{shard[0]}-of-{shard[1]}.json", initial_state_file=DeskManager.STATE_FILE,
+                                   history_size=history_size, load_in_background=load_in_background)
+    else:
+        desk_manager = DeskManager(speed, engine=engine, seed=seed, snapshot_interval_s=snapshot_interval, history_size=history_size,
+                                   load_in_background=load_in_background)
+
+    if load_in_background:
+        # Collections while the saved desks are built would only rescan them
+        gc.disable()
+        desk_manager.start_loading(lambda: finish_loading(desk_manager, desks, shard))
+    else:
+        add_initial_desks(desk_manager, desks, shard)
+
+    if trace_file:
+        desk_manager.start_trace(trace_file)
+    if mqtt_broker:
+        # Shards publish their own desks, each with a client ID of its own
+        client_id = "desk-simulator" if shard is None else f"desk-simulator-{shard[0]}"
+        desk_manager.start_mqtt(MqttBridge.connect(*mqtt_broker, mqtt_username, mqtt_password, client_id,
+                                                   topic_prefix=mqtt_topic_prefix, flush_interval_s=mqtt_interval))
+    if log_pipeline:
+        desk_manager.metrics.callback("desk_log_pipeline_stat", "Log records dropped by rate limits and waiting for the listener",
+                                      log_pipeline.stats, label_names=("stat",))
+
+    if virtual_duration is not None and not pause_at:
+        # Without pause points there is nothing to serve: run to the end, save the state and exit
+        try:
+            desk_manager.run_virtual(virtual_duration)
+        except KeyboardInterrupt:
+            logger.info("Virtual run interrupted.")
+        finally:
+            desk_manager.stop_updates()
+        return
+    elif virtual_duration is not None:
+        logger.info(f"Virtual run pauses at {pause_at} simulated seconds. Press Enter to resume a paused run.")
+        desk_manager.start_virtual(virtual_duration, pause_at)
+        threading.Thread(target=resume_on_enter, args=(desk_manager,), daemon=True).start()
+    else:
+        desk_manager.start_updates()
+
+    response_cache = ResponseCache(response_cache_size) if response_cache_size > 0 else None
+    if response_cache:
+        desk_manager.metrics.callback("desk_response_cache_stat", "Response cache counters", response_cache.stats, label_names=("stat",))
+    rate_limiter = KeyRateLimiter(*(rate_limits or (0.0, {})))
+    desk_manager.metrics.callback("desk_api_admission_total", "Requests admitted and rejected by the rate limit, by API key prefix",
+                                  rate_limiter.stats, "counter", ("key", "result"))
+    fleet = desk_manager
+    if shard:
+        fleet = ShardedFleet(desk_manager, inboxes)
+        fleet.start()
+    profiler = DebugProfiler() if debug_endpoints else None
+    recorder = TrafficRecorder(record_traffic) if record_traffic else None
+    handler = create_handler(fleet, handler_class, server_mode, keep_alive_timeout, response_cache, rate_limiter, profiler, recorder)
 
     server_address = ("0.0.0.0", port)
     SimpleRESTServer.initialize_api_keys()
-    httpd = server_class(server_address, handler)
+    if server_class:
+        httpd = server_class(server_address, handler)
+    else:
+        httpd = create_http_server(server_address, handler, server_mode, workers, queue_size, shard is not None, shed_load, max_queue_wait)
+    servers = [httpd]
+    if shard:
+        # Also serve the shard on a port of its own, for per-shard metrics and debugging
+        servers.append(create_http_server(("0.0.0.0", port + 1 + shard[0]), handler, server_mode, workers, queue_size))
+    if isinstance(httpd, WorkerPoolHTTPServer) and shed_load:
+        desk_manager.metrics.callback("desk_api_shed_connections_total", "Connections answered with 503 because the server was saturated",
+                                      httpd.shed_stats, "counter", ("reason",))
 
     if use_https:
-        if not cert_file or not key_file:
-            logger.error("Both certificate and key files must be provided for HTTPS.")
-            raise ValueError("Both certificate and key files must be provided for HTTPS.")
-        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        context.load_cert_chain(certfile=cert_file, keyfile=key_file)
-        
-        httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+        # One context for every server, so that a session from one port can be resumed on another
+        context = create_tls_context(cert_file, key_file, tls_tickets)
+        handshake_seconds = desk_manager.metrics.histogram("desk_tls_handshake_seconds", "Time to complete a TLS handshake, by result", ("result",))
+        for server in servers:
+            enable_https(server, context=context, handshake_timeout=tls_handshake_timeout, observer=handshake_seconds.observe)
+        desk_manager.metrics.callback("desk_tls_handshakes_total", "TLS handshakes by result: full, resumed or failed",
+                                      lambda: tls_stats(servers), "counter", ("result",))
         protocol = "HTTPS"
     else:
         protocol = "HTTP"
 
-    logger.info(f"Starting {protocol} server on port {port}...")
+    logger.info(f"Starting {protocol} server on port {port} in {server_mode} mode...")
+    desk_manager.mark_startup("serving")
     
     try:
-        httpd.serve_forever()
+        if shard:
+            logger.info(f"Shard {shard[0]} also serving on port {port + 1 + shard[0]}.")
+            for i, server in enumerate(servers):
+                threading.Thread(target=server.serve_forever, name=f"http-{i}", daemon=True).start()
+            fleet.wait()
+            logger.info("Shutting down shard...")
+            for server in servers:
+                server.shutdown()
+        else:
+            httpd.serve_forever()
     except KeyboardInterrupt:
         logger.info("Shutting down server...")
     finally:
+        for server in servers:
+            server.server_close()
         desk_manager.stop_updates()  # Stop the desk updates
+        if recorder:
+            recorder.stop()
+        if shard:
+            fleet.stop()
+        if response_cache:
+            logger.info(f"Response cache: {response_cache.stats()}")
+        if use_https:
+            handshakes = tls_stats(servers)
+            completed = handshakes.get("full", 0) + handshakes.get("resumed", 0)
+            logger.info(f"TLS handshakes: {handshakes}, resumption ratio: {handshakes.get('resumed', 0) / completed if completed else 0:.1%}")
         logger.info("Server stopped.")
 
+def run_shard(index, inboxes, epoch, log_level, log_rate, async_logging, options):
+    """Entry point of a shard process."""
+    # The parent process turns Ctrl+C into a stop message, so that every shard saves its state
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(log_level)
+    log_pipeline = LogPipeline(log_rate, async_logging)
+    log_pipeline.start()
+    try:
+        run(**options, log_pipeline=log_pipeline, shard=(index, len(inboxes)), inboxes=inboxes, epoch=epoch)
+    finally:
+        log_pipeline.stop()
+
+def run_sharded(shards, log_level="INFO", log_rate=None, async_logging=False, **options):
+    """Run one process per shard of the fleet. The kernel spreads connections to the port between them."""
+    context = multiprocessing.get_context("spawn")
+    inboxes = [context.Queue() for _ in range(shards)]
+    # Shards share the epoch so that a desk's ETag does not depend on which process served it
+    epoch = f"{int(time.time()):x}"
+    processes = [
+        context.Process(target=run_shard, name=f"shard-{index}", args=(index, inboxes, epoch, log_level, log_rate, async_logging, options))
+        for index in range(shards)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {shards} shard processes.")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logger.info("Stopping shards...")
+        for inbox in inboxes:
+            inbox.put(pickle.dumps(("stop",)))
+        for process in processes:
+            process.join()
+    logger.info("All shards stopped.")
+
 """
     To execute the script as HTTPS, use the following command:
         python main.py --port 8443 --https --certfile cert.pem --keyfile key.pem
@@ -85,13 +318,50 @@ if __name__ == "__main__":
     parser.add_argument("--https", action="store_true", help="Enable HTTPS")
     parser.add_argument("--certfile", type=str, help="Path to the SSL certificate file")
     parser.add_argument("--keyfile", type=str, help="Path to the SSL key file")
+    parser.add_argument("--tls-tickets", type=int, default=2, help="TLS session tickets sent after each full handshake, 0 to disable session resumption (default: 2)")
+    parser.add_argument("--tls-handshake-timeout", type=float, default=5.0, help="Seconds a client may take to complete the TLS handshake (default: 5)")
     parser.add_argument("--desks", type=int, default=2, help="Minimum number of desks to simulate (default: 2)")
     parser.add_argument("--speed", type=int, default=60, help="Simulation speed (default: 60)")
+    parser.add_argument("--engine", type=str, default="python", choices=["python", "numpy", "lazy", "compact"], help="Tick engine: per-desk Python objects, vectorized NumPy arrays, closed-form motion evaluated on read or slotted desks with shared locks (default: python)")
+    parser.add_argument("--seed", type=int, help="Seed for the simulation's random number generators")
+    parser.add_argument("--server", type=str, choices=["single", "pool"], help="Serving mode: single-threaded HTTP/1.0 or a worker pool with HTTP/1.1 keep-alive (default: single, pool with --https, which requires it)")
+    parser.add_argument("--workers", type=int, default=16, help="Number of worker threads in pool mode (default: 16)")
+    parser.add_argument("--queue-size", type=int, default=64, help="Maximum number of accepted connections waiting for a worker in pool mode (default: 64)")
+    parser.add_argument("--keep-alive-timeout", type=float, default=15, help="Seconds an idle keep-alive connection is held open in pool mode (default: 15)")
+    parser.add_argument("--virtual", type=parse_duration, help="Run the simulation on a virtual clock, as fast as possible, for this simulated duration (e.g. 3600, 12h, 7d)")
+    parser.add_argument("--pause-at", type=parse_durations, default=[], help="Comma-separated simulated times from the start of a virtual run at which to pause and serve the REST API (e.g. 1h,1d)")
+    parser.add_argument("--trace", type=str, help="Write every desk and power event to this JSON lines file")
+    parser.add_argument("--snapshot-interval", type=float, default=60, help="Seconds between state snapshots; changes in between are kept in a journal (default: 60)")
+    parser.add_argument("--history-size", type=int, default=512, help="Position history samples kept per desk, 0 to disable (default: 512)")
+    parser.add_argument("--response-cache-size", type=int, default=1024, help="Maximum number of encoded desk responses to cache, 0 to disable (default: 1024)")
     parser.add_argument("--log-level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
+    parser.add_argument("--async-logging", action="store_true", help="Format and write log records in a background thread")
+    parser.add_argument("--log-rate", type=parse_log_rates, help="Maximum INFO and DEBUG records per second by category, e.g. movement=10,requests=100")
+    parser.add_argument("--rate-limit", type=parse_rate_limits, help="Requests per second per API key, with optional per-key rates, e.g. 50 or 50,<api_key>=200 (default: unlimited)")
+    parser.add_argument("--overload", type=str, default="block", choices=["block", "shed"], help="In pool mode, when the connection queue is full: stop accepting, or answer 503 right away (default: block)")
+    parser.add_argument("--max-queue-wait", type=float, default=1.0, help="With --overload shed, seconds a connection may wait for a worker before it is answered with 503 (default: 1.0)")
+    parser.add_argument("--mqtt", type=parse_broker, help="Publish desk states and errors to this MQTT broker, as host or host:port (default: disabled)")
+    parser.add_argument("--mqtt-username", type=str, help="Username for the MQTT broker")
+    parser.add_argument("--mqtt-password", type=str, help="Password for the MQTT broker")
+    parser.add_argument("--mqtt-topic-prefix", type=str, default=MqttBridge.TOPIC_PREFIX, help=f"Prefix of the desk topics (default: {MqttBridge.TOPIC_PREFIX})")
+    parser.add_argument("--mqtt-interval", type=float, default=MqttBridge.FLUSH_INTERVAL_S, help=f"Seconds between MQTT publishes; changes in between are coalesced per desk (default: {MqttBridge.FLUSH_INTERVAL_S})")
+    parser.add_argument("--debug-endpoints", action="store_true", help="Serve the CPU profile, memory and thread stack debug endpoints")
+    parser.add_argument("--record-traffic", type=str, help="Record every API request with its timing to this trace file, gzip-compressed if it ends in .gz, for tests/traffic_replay.py")
+    parser.add_argument("--shards", type=int, default=1, help="Number of processes to split the desks between, all serving the same port (default: 1)")
 
     args = parser.parse_args()
+    if args.server is None:
+        # Keep-alive connections let HTTPS clients pay for a handshake once rather than on every request
+        args.server = "pool" if args.https else "single"
+    if args.https and args.server == "single":
+        # The single-threaded server would complete each TLS handshake on its only thread, so a slow client stalls all others
+        parser.error("--https requires --server pool")
+    if args.shards > 1 and (args.virtual is not None or args.trace or args.record_traffic):
+        parser.error("--virtual, --trace and --record-traffic cannot be combined with --shards")
 
     setup_logging(args.log_level)
+    log_pipeline = LogPipeline(args.log_rate, args.async_logging)
+    log_pipeline.start()
 
     logger.info("Starting server with the following configuration:")
     logger.info(f"Port: {args.port}")
@@ -99,15 +369,106 @@ if __name__ == "__main__":
     if args.https:
         logger.info(f"Certificate file: {args.certfile}")
         logger.info(f"Key file: {args.keyfile}")
+        logger.info(f"TLS session tickets: {args.tls_tickets}, handshake timeout: {args.tls_handshake_timeout}s")
     logger.info(f"Number of desks: {args.desks}")
     logger.info(f"Simulation speed: {args.speed}")
+    logger.info(f"Engine: {args.engine}")
+    if args.seed is not None:
+        logger.info(f"Seed: {args.seed}")
+    logger.info(f"Server mode: {args.server}")
+    if args.server == "pool":
+        logger.info(f"Workers: {args.workers}, queue size: {args.queue_size}, keep-alive timeout: {args.keep_alive_timeout}s")
+    if args.virtual is not None:
+        logger.info(f"Virtual run: {args.virtual} simulated seconds, pause at: {args.pause_at or 'none'}")
+    if args.trace:
+        logger.info(f"Trace file: {args.trace}")
+    logger.info(f"Snapshot interval: {args.snapshot_interval}s")
+    logger.info(f"History size: {args.history_size} samples per desk")
+    logger.info(f"Response cache size: {args.response_cache_size}")
     logger.info(f"Logging level: {args.log_level}")
+    logger.info(f"Asynchronous logging: {'Enabled' if args.async_logging else 'Disabled'}")
+    if args.log_rate:
+        logger.info(f"Log rate limits: {args.log_rate}")
+    if args.rate_limit:
+        logger.info(f"API rate limit: {args.rate_limit[0] or 'unlimited'} requests/s, {len(args.rate_limit[1])} per-key rates")
+    if args.server == "pool":
+        logger.info(f"Overload: {args.overload}" + (f", max queue wait: {args.max_queue_wait}s" if args.overload == "shed" else ""))
+    if args.mqtt:
+        logger.info(f"MQTT broker: {args.mqtt[0]}:{args.mqtt[1]}, topic prefix: {args.mqtt_topic_prefix}, interval: {args.mqtt_interval}s")
+    if args.debug_endpoints:
+        logger.info("Debug endpoints: Enabled")
+    if args.record_traffic:
+        logger.info(f"Traffic recording: {args.record_traffic}")
+    if args.shards > 1:
+        logger.info(f"Shards: {args.shards}, shard ports: {args.port + 1}-{args.port + args.shards}")
 
-    run(
-        port=args.port,
-        use_https=args.https,
-        cert_file=args.certfile,
-        key_file=args.keyfile,
-        desks=args.desks,
-        speed=args.speed
-    )
+    try:
+        if args.shards > 1:
+            run_sharded(
+                args.shards,
+                log_level=args.log_level,
+                log_rate=args.log_rate,
+                async_logging=args.async_logging,
+                port=args.port,
+                use_https=args.https,
+                cert_file=args.certfile,
+                key_file=args.keyfile,
+                desks=args.desks,
+                speed=args.speed,
+                server_mode=args.server,
+                workers=args.workers,
+                queue_size=args.queue_size,
+                keep_alive_timeout=args.keep_alive_timeout,
+                engine=args.engine,
+                seed=args.seed,
+                response_cache_size=args.response_cache_size,
+                snapshot_interval=args.snapshot_interval,
+                rate_limits=args.rate_limit,
+                shed_load=args.overload == "shed",
+                max_queue_wait=args.max_queue_wait,
+                history_size=args.history_size,
+                tls_tickets=args.tls_tickets,
+                tls_handshake_timeout=args.tls_handshake_timeout,
+                mqtt_broker=args.mqtt,
+                mqtt_username=args.mqtt_username,
+                mqtt_password=args.mqtt_password,
+                mqtt_topic_prefix=args.mqtt_topic_prefix,
+                mqtt_interval=args.mqtt_interval,
+                debug_endpoints=args.debug_endpoints,
+            )
+        else:
+            run(
+                port=args.port,
+                use_https=args.https,
+                cert_file=args.certfile,
+                key_file=args.keyfile,
+                desks=args.desks,
+                speed=args.speed,
+                server_mode=args.server,
+                workers=args.workers,
+                queue_size=args.queue_size,
+                keep_alive_timeout=args.keep_alive_timeout,
+                engine=args.engine,
+                seed=args.seed,
+                response_cache_size=args.response_cache_size,
+                virtual_duration=args.virtual,
+                pause_at=args.pause_at,
+                trace_file=args.trace,
+                snapshot_interval=args.snapshot_interval,
+                rate_limits=args.rate_limit,
+                shed_load=args.overload == "shed",
+                max_queue_wait=args.max_queue_wait,
+                history_size=args.history_size,
+                tls_tickets=args.tls_tickets,
+                tls_handshake_timeout=args.tls_handshake_timeout,
+                mqtt_broker=args.mqtt,
+                mqtt_username=args.mqtt_username,
+                mqtt_password=args.mqtt_password,
+                mqtt_topic_prefix=args.mqtt_topic_prefix,
+                mqtt_interval=args.mqtt_interval,
+                debug_endpoints=args.debug_endpoints,
+                record_traffic=args.record_traffic,
+                log_pipeline=log_pipeline,
+            )
+    finally:
+        log_pipeline.stop()
@@ -0,0 +1,172 @@
+import bisect
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=""):
+    """Format label pairs in the Prometheus text format."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic counter with optional labels."""
+    type = "counter"
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        # An unlabeled counter is exported as 0 until it is first incremented
+        self.values = {} if self.label_names else {(): 0}
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        return [(self.name + _format_labels(self.label_names, labels), value) for labels, value in values.items()]
+
+class Histogram:
+    """Histogram with fixed bucket upper bounds and optional labels."""
+    type = "histogram"
+    # Seconds, from a cached response to a tick that overran its budget
+    DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # Labels -> [per-bucket counts with a final +Inf bucket, sum, count]
+        self.series = {}
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self.lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self.series.items()}
+        samples = []
+        for labels, (counts, total, count) in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket" + _format_labels(self.label_names, labels, f'le="{bound}"'), cumulative))
+            samples.append((self.name + "_sum" + _format_labels(self.label_names, labels), total))
+            samples.append((self.name + "_count" + _format_labels(self.label_names, labels), count))
+        return samples
+
+class CallbackMetric:
+    """Gauge or counter whose value is read from a callback at scrape time."""
+
+    def __init__(self, name, help, callback, type="gauge", label_names=()):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.type = type
+        self.label_names = tuple(label_names)
+
+    def samples(self):
+        value = self.callback()
+        if not isinstance(value, dict):
+            return [(self.name, value)]
+        return [(self.name + _format_labels(self.label_names, labels if isinstance(labels, tuple) else (labels,)), item)
+                for labels, item in value.items()]
+
+class MetricsRegistry:
+    """Named metrics rendered in the Prometheus text exposition format."""
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, label_names=()):
+        """Return the counter with the given name, creating it on first use."""
+        return self.metrics.get(name) or self._register(Counter(name, help, label_names))
+
+    def histogram(self, name, help, label_names=(), buckets=Histogram.DEFAULT_BUCKETS):
+        """Return the histogram with the given name, creating it on first use."""
+        return self.metrics.get(name) or self._register(Histogram(name, help, label_names, buckets))
+
+    def callback(self, name, help, callback, type="gauge", label_names=()):
+        """Register a metric read from a callback returning a value, or a dict of label values to values."""
+        with self.lock:
+            self.metrics[name] = CallbackMetric(name, help, callback, type, label_names)
+
+    def render(self):
+        """Render every metric in the Prometheus text format."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logger.error(f"Failed to collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name} {value}" for name, value in samples)
+        return "\n".join(lines) + "\n"
+
+class InstrumentedLock:
+    """Lock that records how long threads wait for it and how long they hold it."""
+
+    def __init__(self, registry, name):
+        self.lock = threading.Lock()
+        self.name = name
+        self.wait = registry.histogram("desk_lock_wait_seconds", "Time spent waiting to acquire a lock", ("lock",))
+        self.hold = registry.histogram("desk_lock_hold_seconds", "Time a lock was held", ("lock",))
+        self.acquired_at = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        started = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        if acquired:
+            # Only the holder writes this, so it needs no further synchronization
+            self.acquired_at = time.perf_counter()
+            self.wait.observe(self.acquired_at - started, self.name)
+        return acquired
+
+    def release(self):
+        held = time.perf_counter() - self.acquired_at
+        self.lock.release()
+        self.hold.observe(held, self.name)
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
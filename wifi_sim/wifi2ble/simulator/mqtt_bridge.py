@@ -0,0 +1,174 @@
+import json
+import threading
+import logging
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+logger = logging.getLogger(__name__)
+
+class MqttBridge:
+    """Publishes desk changes to an MQTT broker: a retained state topic per desk and an event per new error.
+
+    The tick loop only adds the changed desk IDs of each snapshot to a pending set. A background thread publishes
+    them once per flush interval from the latest snapshot, so a desk that moves on every tick is sent once per
+    interval with its last state, and a slow or unreachable broker delays the publishes, never the tick.
+    """
+    TOPIC_PREFIX = "/tables"
+    FLUSH_INTERVAL_S = 1.0
+    QOS = 1
+    # Messages the client may hold for a slow broker. Further state publishes are retried on the next flush
+    MAX_QUEUED_MESSAGES = 10000
+
+    def __init__(self, client, topic_prefix=TOPIC_PREFIX, flush_interval_s=FLUSH_INTERVAL_S):
+        # Anything with publish(topic, payload, qos, retain), like a paho client or a stand-in for tests
+        self.client = client
+        self.topic_prefix = topic_prefix.rstrip("/")
+        self.flush_interval_s = flush_interval_s
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.pending = set()
+        self.resync = False
+        # Desk ID -> version of the last published state, or None if the retained state was cleared
+        self.versions = {}
+        # Desk ID -> newest error already seen, or None if the desk had no errors
+        self.last_errors = {}
+        self.counts = {"changes": 0, "states": 0, "cleared": 0, "errors": 0, "failed": 0, "flushes": 0}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def connect(cls, host, port=1883, username=None, password=None, client_id="desk-simulator", **options):
+        """Create a bridge publishing through a paho MQTT client, which connects and reconnects in the background."""
+        if mqtt is None:
+            raise RuntimeError("The MQTT bridge requires paho-mqtt. Install it with 'pip install paho-mqtt'.")
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        else:
+            client = mqtt.Client(client_id=client_id)
+        if username:
+            client.username_pw_set(username, password)
+        client.max_queued_messages_set(cls.MAX_QUEUED_MESSAGES)
+        bridge = cls(client, **options)
+        client.on_connect = bridge._on_connect
+        client.connect_async(host, port)
+        client.loop_start()
+        logger.info(f"MQTT bridge connecting to {host}:{port} as {client_id}.")
+        return bridge
+
+    def _on_connect(self, client, userdata, flags, reason, *args):
+        """Publish every desk again after a connection, as the broker may have lost the retained states."""
+        logger.info(f"MQTT bridge connected: {reason}.")
+        with self.lock:
+            self.resync = True
+
+    def on_snapshot(self, snapshot, changed_desks, membership_changed):
+        """Queue the desks changed in a snapshot. Called by the desk manager after each publish, with its lock held."""
+        if not changed_desks:
+            return
+        with self.lock:
+            self.snapshot = snapshot
+            self.pending.update(changed_desks)
+            self.counts["changes"] += len(changed_desks)
+
+    def start(self):
+        """Start publishing in a background thread."""
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="mqtt-bridge", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Publish the pending desks, stop the background thread and disconnect a paho client."""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        if mqtt is not None and isinstance(self.client, mqtt.Client):
+            self.client.disconnect()
+            self.client.loop_stop()
+        logger.info(f"MQTT bridge stopped: {self.stats()}")
+
+    def _run(self):
+        while not self.stop_event.wait(self.flush_interval_s):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Publish the state and new errors of the desks changed since the last flush, from the latest snapshot."""
+        with self.lock:
+            snapshot, changed, self.pending = self.snapshot, self.pending, set()
+            if self.resync and snapshot is not None:
+                changed.update(snapshot.desks)
+                changed.update(self.versions)
+                self.versions.clear()
+                self.resync = False
+        if not changed:
+            return
+        messages = []
+        for desk_id in changed:
+            entry = snapshot.get(desk_id)
+            version = entry.version if entry else None
+            if desk_id in self.versions and self.versions[desk_id] == version:
+                continue
+            topic = f"{self.topic_prefix}/{desk_id}"
+            if entry is None:
+                # Removed and powered-off desks are not served by the REST API either
+                messages.append((desk_id, f"{topic}/state", b"", True))
+                # A powered-off desk keeps its last entry, so the errors it raised before powering off are still sent
+                entry = snapshot.desks.get(desk_id)
+                if entry is None:
+                    continue
+            else:
+                messages.append((desk_id, f"{topic}/state", json.dumps(entry.data), True))
+            for error in self._new_errors(desk_id, entry.data["lastErrors"]):
+                messages.append((None, f"{topic}/errors", json.dumps({"desk_id": desk_id, **error}), False))
+        self._publish(messages, snapshot)
+
+    def _new_errors(self, desk_id, errors):
+        """Return the errors added in front of a desk's newest known error, oldest first. A desk seen for the first time has none."""
+        known = desk_id in self.last_errors
+        last_error = self.last_errors.get(desk_id)
+        self.last_errors[desk_id] = errors[0] if errors else None
+        if not known:
+            return []
+        new = []
+        for error in errors:
+            if error == last_error:
+                break
+            new.append(error)
+        return new[::-1]
+
+    def _publish(self, messages, snapshot):
+        """Hand a flush's messages to the client. States it refuses are queued again for the next flush."""
+        failed = []
+        counts = self.counts
+        for desk_id, topic, payload, retain in messages:
+            try:
+                info = self.client.publish(topic, payload, qos=self.QOS, retain=retain)
+                ok = getattr(info, "rc", 0) == 0
+            except (OSError, ValueError) as e:
+                logger.warning(f"MQTT publish to {topic} failed: {e}")
+                ok = False
+            if not ok:
+                counts["failed"] += 1
+                if desk_id is not None:
+                    failed.append(desk_id)
+            elif desk_id is None:
+                counts["errors"] += 1
+            else:
+                entry = snapshot.get(desk_id)
+                self.versions[desk_id] = entry.version if entry else None
+                counts["states" if entry else "cleared"] += 1
+        counts["flushes"] += 1
+        if failed:
+            with self.lock:
+                self.pending.update(failed)
+            logger.warning(f"MQTT broker refused {len(failed)} desk states; retrying on the next flush.")
+
+    def stats(self):
+        """Return the desk changes received, the messages published and refused, and the desks waiting for a flush."""
+        with self.lock:
+            return {**self.counts, "pending": len(self.pending)}
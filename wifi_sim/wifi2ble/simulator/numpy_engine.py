@@ -0,0 +1,289 @@
+import random
+import threading
+import logging
+from desk import Desk
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+def _number(value):
+    """Convert a float64 position to the int or float a Desk would hold."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+class NumpyDeskView:
+    """Per-desk view onto the arrays of a NumpyTickEngine, exposing the same interface as Desk."""
+
+    def __init__(self, engine, index, desk_id, config):
+        self.engine = engine
+        self.index = index
+        self.desk_id = desk_id
+        self.config = config
+        self.lock = engine.lock
+
+    @property
+    def state(self):
+        engine, i = self.engine, self.index
+        return {
+            "position_mm": _number(engine.position[i]),
+            "speed_mms": int(engine.speed[i]),
+            "status": engine.statuses[engine.status[i]],
+            "isPositionLost": bool(engine.position_lost[i]),
+            "isOverloadProtectionUp": bool(engine.overload_up[i]),
+            "isOverloadProtectionDown": bool(engine.overload_down[i]),
+            "isAntiCollision": bool(engine.anti_collision[i]),
+        }
+
+    @property
+    def usage(self):
+        return {
+            "activationsCounter": int(self.engine.activations[self.index]),
+            "sitStandCounter": int(self.engine.sit_stand_counter[self.index]),
+        }
+
+    @property
+    def lastErrors(self):
+        return self.engine.errors[self.index]
+
+    @property
+    def min_position(self):
+        return int(self.engine.min_position[self.index])
+
+    @property
+    def max_position(self):
+        return int(self.engine.max_position[self.index])
+
+    @property
+    def sit_stand_position(self):
+        return float(self.engine.sit_stand_position[self.index])
+
+    @property
+    def target_position_mm(self):
+        return _number(self.engine.target[self.index])
+
+    @property
+    def clock_s(self):
+        return int(self.engine.clock[self.index])
+
+    @property
+    def version(self):
+        return int(self.engine.version[self.index])
+
+    def get_target_position(self):
+        """Get the target position to move towards"""
+        with self.lock:
+            return self.target_position_mm
+
+    def clamp_position(self, position_mm):
+        """Return the position the desk would accept as a target."""
+        return max(self.min_position, min(position_mm, self.max_position))
+
+    def set_target_position(self, position_mm):
+        """Set the target position to move towards, respecting min and max limits."""
+        with self.lock:
+            engine, i = self.engine, self.index
+            engine.target[i] = self.clamp_position(position_mm)
+            logger.info("Desk target position set: ID=%s, Requested=%s, Accepted=%s", self.desk_id, position_mm, self.target_position_mm)
+            if position_mm != engine.position[i]:
+                engine.activations[i] += 1
+                engine.version[i] += 1
+                if engine.listener:
+                    engine.listener(self, "usage")
+                logger.info("Desk activated: ID=%s, ActivationCounter=%s", self.desk_id, engine.activations[i])
+
+    def get_data(self):
+        """Get a copy of the desk's data."""
+        with self.lock:
+            return {
+                "config": dict(self.config),
+                "state": self.state,
+                "usage": self.usage,
+                "lastErrors": [dict(error) for error in self.lastErrors],
+            }
+
+    def update_category(self, category, data):
+        """Update a specific category of the desk."""
+        with self.lock:
+            if category == "state" and "position_mm" in data:
+                self.set_target_position(data["position_mm"])
+                return True
+
+            return False
+
+class NumpyTickEngine:
+    """Stores the fleet as NumPy arrays and advances every desk in one vectorized step per tick.
+
+    Collisions are drawn from the random module in fleet order, as Desk.update() does, so a seeded run matches the
+    python engine. Positions and targets are float64, as a Desk keeps fractional targets.
+    """
+    INITIAL_CAPACITY = 1024
+    STATUS_NORMAL = 0
+    STATUS_COLLISION = 1
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("The numpy engine requires NumPy. Install it with 'pip install numpy'.")
+        self.lock = threading.RLock()
+        self.size = 0
+        self.index = {}
+        self.views = []
+        # Called as listener(view, kind) for every desk that changes, with the same kinds as Desk.listener
+        self.listener = None
+        self.errors = []
+        self.statuses = ["Normal", "Collision"]
+        self.status_codes = {status: code for code, status in enumerate(self.statuses)}
+        self._allocate(self.INITIAL_CAPACITY)
+
+    def _allocate(self, capacity):
+        """Allocate (or grow) the per-desk arrays to the given capacity."""
+        layout = {
+            "position": np.float64, "target": np.float64, "speed": np.int32,
+            "min_position": np.int32, "max_position": np.int32, "sit_stand_position": np.float64,
+            "clock": np.int64, "activations": np.int64, "sit_stand_counter": np.int64, "version": np.int64,
+            "status": np.uint8, "collision_occurred": np.bool_, "anti_collision": np.bool_,
+            "position_lost": np.bool_, "overload_up": np.bool_, "overload_down": np.bool_, "in_use": np.bool_,
+        }
+        for name, dtype in layout.items():
+            array = np.zeros(capacity, dtype=dtype)
+            if self.size:
+                array[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def _status_code(self, status):
+        """Return the code of a status string, registering unknown statuses."""
+        if status not in self.status_codes:
+            self.status_codes[status] = len(self.statuses)
+            self.statuses.append(status)
+        return self.status_codes[status]
+
+    def add(self, desk: Desk):
+        """Copy a desk into the arrays and return the view that replaces it."""
+        with self.lock:
+            if self.size == self.capacity:
+                self._allocate(self.capacity * 2)
+            i = self.size
+            self.size += 1
+            state = desk.state
+            self.position[i] = state["position_mm"]
+            self.target[i] = desk.target_position_mm
+            self.speed[i] = state["speed_mms"]
+            self.min_position[i] = desk.min_position
+            self.max_position[i] = desk.max_position
+            self.sit_stand_position[i] = desk.sit_stand_position
+            self.clock[i] = desk.clock_s
+            self.version[i] = desk.version
+            self.activations[i] = desk.usage["activationsCounter"]
+            self.sit_stand_counter[i] = desk.usage["sitStandCounter"]
+            self.status[i] = self._status_code(state["status"])
+            self.collision_occurred[i] = desk.collision_occurred
+            self.anti_collision[i] = state["isAntiCollision"]
+            self.position_lost[i] = state["isPositionLost"]
+            self.overload_up[i] = state["isOverloadProtectionUp"]
+            self.overload_down[i] = state["isOverloadProtectionDown"]
+            self.in_use[i] = True
+            self.errors.append(desk.lastErrors)
+            self.index[desk.desk_id] = i
+            view = NumpyDeskView(self, i, desk.desk_id, desk.config)
+            self.views.append(view)
+            return view
+
+    def attach(self, desks):
+        """Move a dict of desks into the arrays and return the matching dict of views."""
+        return {desk_id: self.add(desk) for desk_id, desk in desks.items()}
+
+    def remove(self, desk_id):
+        """Stop ticking a desk. Its slot is not reused."""
+        with self.lock:
+            i = self.index.pop(desk_id, None)
+            if i is not None:
+                self.in_use[i] = False
+                self.errors[i] = []
+
+    def step(self, skip_ids=()):
+        """Advance every desk in use by one second, skipping the given desk IDs. Mirrors Desk.update()."""
+        with self.lock:
+            n = self.size
+            active = self.in_use[:n].copy()
+            for desk_id in skip_ids:
+                i = self.index.get(desk_id)
+                if i is not None:
+                    active[i] = False
+
+            position, target, speed = self.position[:n], self.target[:n], self.speed[:n]
+            min_position, max_position = self.min_position[:n], self.max_position[:n]
+            anti_collision, status = self.anti_collision[:n], self.status[:n]
+            self.clock[:n][active] += 1
+
+            # A desk that collided on the previous tick only clears the flag
+            collided = active & self.collision_occurred[:n]
+            self.collision_occurred[:n][collided] = False
+            ticking = active & ~collided
+
+            up = ticking & (position < target)
+            down = ticking & (position > target)
+            previous = position.copy()
+            previous_speed = speed.copy()
+            distance = np.minimum(Desk.DEFAULT_SPEED_MMS, np.abs(target - position))
+            position[up] = np.minimum(position + distance, max_position)[up]
+            position[down] = np.maximum(position - distance, min_position)[down]
+            speed[up] = Desk.DEFAULT_SPEED_MMS
+            speed[down] = -Desk.DEFAULT_SPEED_MMS
+            speed[ticking & ~up & ~down] = 0
+
+            sit_stand = self.sit_stand_position[:n]
+            crossed = ticking & (
+                ((previous < sit_stand) & (sit_stand <= position)) | ((previous > sit_stand) & (sit_stand >= position))
+            )
+            self.sit_stand_counter[:n][crossed] += 1
+
+            moved = up | down
+            reset = moved & anti_collision
+            anti_collision[reset] = False
+            status[reset] = self.STATUS_NORMAL
+
+            # One draw per moving desk, in the order Desk.update() would make them
+            candidates = np.flatnonzero(moved & ~reset)
+            draws = np.fromiter((random.random() for _ in range(candidates.size)), np.float64, candidates.size)
+            hits = candidates[draws < Desk.COLLISION_CHANCE]
+            if hits.size:
+                self._generate_errors(hits)
+
+            moved_or_stopped = ticking & ((position != previous) | (speed != previous_speed) | reset)
+            moved_or_stopped[hits] = True
+            changed = moved_or_stopped | crossed
+            self.version[:n][changed] += 1
+
+            if self.listener:
+                for i in hits:
+                    self.listener(self.views[i], "collision")
+                for i in np.flatnonzero(moved_or_stopped):
+                    self.listener(self.views[i], "state")
+                for i in np.flatnonzero(crossed & ~moved_or_stopped):
+                    self.listener(self.views[i], "usage")
+
+            logger.debug(f"Tick advanced: moving={int(moved.sum())}, sitStandCrossings={int(crossed.sum())}, collisions={hits.size}")
+
+    def _generate_errors(self, hits):
+        """Raise a collision on the given desk indices, backing them off 10 mm like Desk._generate_error()."""
+        for i in hits:
+            errors = self.errors[i]
+            errors.insert(0, {"time_s": int(self.clock[i]), "errorCode": Desk.ERROR_CODE_E93})
+            if len(errors) > Desk.MAX_ERROR_COUNT:
+                errors.pop()
+        self.anti_collision[hits] = True
+        self.status[hits] = self.STATUS_COLLISION
+        self.collision_occurred[hits] = True
+
+        speed = self.speed[hits]
+        position = self.position[hits]
+        position = np.where(speed > 0, np.maximum(position - 10, self.min_position[hits]), position)
+        position = np.where(speed < 0, np.minimum(position + 10, self.max_position[hits]), position)
+        self.position[hits] = position
+        self.target[hits] = position
+        self.speed[hits] = 0
+        logger.warning(f"Desk collisions detected: {hits.size} desks stopped and backed off.")
@@ -0,0 +1,47 @@
+import collections
+import threading
+
+class ResponseCache:
+    """LRU cache of encoded JSON response bodies, each tied to the desk snapshot entry it was encoded from."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, source):
+        """Return the cached body for a key if it was encoded from the given source, otherwise None."""
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is None or cached[0] is not source:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+    def put(self, key, source, body):
+        """Store a body encoded from the given source, replacing any stale body for the key."""
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (source, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Return the cache's hit, miss and eviction counters."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,259 @@
+import multiprocessing
+import pickle
+import queue
+import threading
+import itertools
+import zlib
+import logging
+from desk import Desk
+from fleet_snapshot import DeskSnapshot, FleetSnapshot
+from fleet_aggregates import FleetAggregates
+
+logger = logging.getLogger(__name__)
+
+def shard_of(desk_id, count):
+    """Return the index of the shard that owns a desk. Stable across processes and runs."""
+    return zlib.crc32(desk_id.encode("utf-8")) % count
+
+class ShardedFleet:
+    """Serves the whole fleet from one shard process: its own desks from its DeskManager, the others from replicas.
+
+    Each shard publishes the desks it changed on every tick to the inboxes of the other shards, and forwards
+    writes to desks it does not own to the inbox of their owner. It exposes the part of the DeskManager
+    interface that the REST handler uses.
+    """
+    # Seconds between checks that the parent process is still alive
+    POLL_INTERVAL_S = 1
+
+    def __init__(self, desk_manager, inboxes):
+        self.desk_manager = desk_manager
+        self.index, self.count = desk_manager.shard
+        self.inboxes = inboxes
+        self.epoch = desk_manager.epoch
+        self.metrics = desk_manager.metrics
+        self.events = desk_manager.events
+        self.ready = desk_manager.ready
+        # Latest copy of every other shard's desks and user types, replaced as a whole by the receiver thread
+        self.replicas = [FleetSnapshot() for _ in range(self.count)]
+        self.user_types = [{} for _ in range(self.count)]
+        # Totals of the replicated desks, combined with the local ones for the fleet summary
+        self.aggregates = FleetAggregates()
+        # Changes of the local shard waiting for the sender thread
+        self.pending_lock = threading.Lock()
+        self.pending_desks = {}
+        self.pending_membership = None
+        self.pending_event = threading.Event()
+        self.stopped = threading.Event()
+        self.sender = None
+        self.receiver = None
+        self.messages = self.metrics.counter("desk_shard_messages_total", "Replication and command messages exchanged with other shards", ("direction", "type"))
+        self.forwarded = self.metrics.counter("desk_shard_forwarded_commands_total", "Desk updates forwarded to the shard that owns the desk")
+        self.metrics.callback("desk_shard_replica_desks", "Desks replicated from other shards",
+                              lambda: sum(len(replica.desks) for replica in self.replicas))
+
+    def start(self):
+        """Start replicating to and from the other shards. Every local desk is sent with the first update."""
+        with self.desk_manager.lock:
+            self.desk_manager.snapshot_listeners.append(self._on_snapshot)
+            self.desk_manager.changed_desks.update(dict.fromkeys(itertools.chain(self.desk_manager.desks, self.desk_manager.saved_entries)))
+            self.desk_manager.membership_changed = True
+            self.desk_manager.snapshot_stale = True
+        self.sender = threading.Thread(target=self._send_updates, name="shard-sender", daemon=True)
+        self.receiver = threading.Thread(target=self._receive, name="shard-receiver", daemon=True)
+        self.sender.start()
+        self.receiver.start()
+        self.desk_manager.get_snapshot()
+        logger.info(f"Shard {self.index} of {self.count} replicating {len(self.desk_manager.get_desk_ids())} desks.")
+
+    def stop(self):
+        """Stop the sender and receiver threads."""
+        self.stopped.set()
+        self.pending_event.set()
+        if self.sender:
+            self.sender.join()
+        for index, inbox in enumerate(self.inboxes):
+            if index != self.index:
+                # Do not wait for peers that already exited to drain their inboxes
+                inbox.cancel_join_thread()
+
+    def wait(self):
+        """Block until another process asks this shard to stop, or the parent process exits."""
+        while not self.stopped.wait(self.POLL_INTERVAL_S):
+            pass
+
+    def owner(self, desk_id):
+        return shard_of(desk_id, self.count)
+
+    def _snapshot_of(self, index):
+        return self.desk_manager.get_snapshot() if index == self.index else self.replicas[index]
+
+    def get_desk_snapshot(self, desk_id):
+        """Get the latest snapshot entry of a desk from its shard or its replica."""
+        return self._snapshot_of(self.owner(desk_id)).get(desk_id)
+
+    def get_desk_ids(self):
+        """Return the IDs of powered-on desks of every shard, in shard order."""
+        desk_ids = []
+        for index in range(self.count):
+            desk_ids.extend(self._snapshot_of(index).desk_ids)
+        return desk_ids
+
+    def get_fleet_data(self, categories=None, fields=None):
+        """Get the projected data of every powered-on desk of every shard, in shard order."""
+        projection = self.desk_manager._build_projection(categories, fields)
+        fleet = []
+        for index in range(self.count):
+            fleet.extend(self.desk_manager.project_fleet(self._snapshot_of(index), projection))
+        return fleet
+
+    def get_desk_history(self, desk_id, start_s=None, end_s=None, step_s=None):
+        """Get a desk's history. Every shard also records the history of the desks it replicates."""
+        return self.desk_manager.get_desk_history(desk_id, start_s, end_s, step_s)
+
+    def get_fleet_summary(self):
+        """Get the fleet-wide totals of the local desks and of the replicas."""
+        self.desk_manager.get_snapshot()
+        return self.desk_manager.aggregates.summary([self.aggregates])
+
+    def select_desks(self, selector):
+        """Return the IDs of powered-on desks of every shard matching a selector."""
+        user_types = self.desk_manager.get_user_types()
+        for index in range(self.count):
+            if index != self.index:
+                user_types.update(self.user_types[index])
+        return self.desk_manager.filter_desks(self.get_desk_ids(), user_types, selector)
+
+    def update_desk_category(self, desk_id, category, data):
+        """Update a local desk, or forward the update to the shard that owns the desk."""
+        owner = self.owner(desk_id)
+        if owner == self.index:
+            return self.desk_manager.update_desk_category(desk_id, category, data)
+        if self.replicas[owner].get(desk_id) is None or category != "state" or "position_mm" not in data:
+            return None
+        if not self.desk_manager.is_valid_position(data["position_mm"]):
+            return {"error": "Invalid position_mm"}
+        accepted = {"position_mm": self._clamp(data["position_mm"])}
+        self._forward(owner, [(desk_id, category, data)])
+        return accepted
+
+    def update_desks(self, commands):
+        """Queue position updates of local desks and forward the others to their owners, one message per shard."""
+        local = []
+        forwarded = {}
+        results = {}
+        for desk_id, position_mm in commands:
+            owner = self.owner(desk_id)
+            if owner == self.index:
+                local.append((desk_id, position_mm))
+            elif self.replicas[owner].get(desk_id) is None:
+                results[desk_id] = {"error": "Desk not found"}
+            elif not self.desk_manager.is_valid_position(position_mm):
+                results[desk_id] = {"error": "Invalid position_mm"}
+            else:
+                results[desk_id] = {"position_mm": self._clamp(position_mm)}
+                forwarded.setdefault(owner, []).append((desk_id, "state", {"position_mm": position_mm}))
+        for owner, owner_commands in forwarded.items():
+            self._forward(owner, owner_commands)
+        if local:
+            results.update(self.desk_manager.update_desks(local))
+        return results
+
+    @staticmethod
+    def _clamp(position_mm):
+        # Replicas carry no desk limits; every desk uses the defaults
+        return max(Desk.MIN_POSITION, min(position_mm, Desk.MAX_POSITION))
+
+    def _forward(self, owner, commands):
+        """Send queued-command tuples to the shard that owns the desks."""
+        self.inboxes[owner].put(pickle.dumps(("commands", self.index, commands)))
+        self.messages.inc("sent", "commands")
+        self.forwarded.inc(amount=len(commands))
+
+    def _on_snapshot(self, snapshot, changed_desks, membership_changed):
+        """Collect the entries of changed local desks for the sender thread. Called with the DeskManager lock held."""
+        if not changed_desks and not membership_changed:
+            return
+        with self.pending_lock:
+            for desk_id in changed_desks:
+                self.pending_desks[desk_id] = snapshot.desks.get(desk_id)
+            if membership_changed:
+                self.pending_membership = (snapshot.desk_ids, snapshot.powered_off, self.desk_manager._user_types())
+        self.pending_event.set()
+
+    def _send_updates(self):
+        """Send the collected changes to every other shard, coalescing the ticks that passed while sending."""
+        while not self.stopped.is_set():
+            self.pending_event.wait()
+            self.pending_event.clear()
+            with self.pending_lock:
+                desks, self.pending_desks = self.pending_desks, {}
+                membership, self.pending_membership = self.pending_membership, None
+            if not desks and membership is None:
+                continue
+            entries = {desk_id: (entry.version, entry.data) if entry else None for desk_id, entry in desks.items()}
+            # Pickle once for every peer instead of once per queue
+            message = pickle.dumps(("snapshot", self.index, entries, membership))
+            for index, inbox in enumerate(self.inboxes):
+                if index != self.index:
+                    inbox.put(message)
+                    self.messages.inc("sent", "snapshot")
+
+    def _receive(self):
+        """Apply replication and command messages from other shards until stopped."""
+        inbox = self.inboxes[self.index]
+        parent = multiprocessing.parent_process()
+        while not self.stopped.is_set():
+            try:
+                message = pickle.loads(inbox.get(timeout=self.POLL_INTERVAL_S))
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    logger.warning(f"Shard {self.index}: parent process exited. Stopping.")
+                    self.stopped.set()
+                continue
+            kind = message[0]
+            self.messages.inc("received", kind)
+            if kind == "snapshot":
+                self._apply_snapshot(*message[1:])
+            elif kind == "commands":
+                self.desk_manager.commands.extend(message[2])
+            elif kind == "stop":
+                logger.info(f"Shard {self.index} received a stop request.")
+                self.stopped.set()
+        self.pending_event.set()
+
+    def _apply_snapshot(self, index, entries, membership):
+        """Replace a shard's replica with one that includes the received changes, and publish their events."""
+        replica = self.replicas[index]
+        desks = dict(replica.desks)
+        for desk_id, entry in entries.items():
+            if entry is None:
+                desks.pop(desk_id, None)
+                continue
+            entry = DeskSnapshot(*entry)
+            if self.events.has_subscribers:
+                self._publish_events(desk_id, desks.get(desk_id), entry)
+            desks[desk_id] = entry
+        if membership is None:
+            desk_ids, powered_off = replica.desk_ids, replica.powered_off
+        else:
+            desk_ids, powered_off, self.user_types[index] = membership
+        self.replicas[index] = FleetSnapshot(replica.sequence + 1, desks, desk_ids, powered_off)
+        self.aggregates.update(self.desk_manager.current_time_s, self.replicas[index], entries)
+        if self.desk_manager.history is not None:
+            # Stamped with this shard's clock, which runs within a tick of the owner's
+            self.desk_manager.history.record(self.desk_manager.current_time_s, desks, set(entries), powered_off)
+
+    def _publish_events(self, desk_id, previous, entry):
+        """Publish the state and collision events a remote desk change implies. Intermediate ticks may be coalesced."""
+        state = entry.data["state"]
+        previous_state = previous.data["state"] if previous else None
+        if previous_state is None or any(state[key] != previous_state[key] for key in ("position_mm", "speed_mms", "status")):
+            self.events.publish_data(desk_id, "state", {
+                "desk_id": desk_id,
+                "position_mm": state["position_mm"],
+                "speed_mms": state["speed_mms"],
+                "status": state["status"],
+            })
+        errors = entry.data["lastErrors"]
+        if previous and errors and errors[0] != (previous.data["lastErrors"] or [None])[0]:
+            self.events.publish_data(desk_id, "collision", {"desk_id": desk_id, "time_s": errors[0]["time_s"], "errorCode": errors[0]["errorCode"]})
@@ -1,18 +1,49 @@
 import json
+import math
+import time
+import zlib
 import logging
+from urllib.parse import urlsplit, parse_qs
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from desk_manager import DeskManager
+from metrics import MetricsRegistry
+from admission import key_label
+from fleet_columns import FleetColumns
+from debug_profiler import DebugProfiler
 
 logger = logging.getLogger(__name__)
 
 class SimpleRESTServer(BaseHTTPRequestHandler):
     VERSION = "v2"
     API_KEYS_FILE = "config/api_keys.json"
-    API_KEYS = []
+    API_KEYS = frozenset()
+    STREAM_CHUNK_SIZE = 64 * 1024
+    # Smaller bodies are sent uncompressed: compressing them saves fewer bytes than its headers and CPU cost
+    COMPRESS_MIN_BYTES = 1024
+    COMPRESS_LEVEL = 6
+    # zlib window bits of each content coding: gzip framing, and zlib framing for deflate as HTTP defines it
+    CONTENT_ENCODINGS = {"gzip": 31, "deflate": 15}
+    # Headers and body are written separately; without TCP_NODELAY keep-alive responses stall on delayed ACKs.
+    disable_nagle_algorithm = True
 
-    def __init__(self, desk_manager: DeskManager, *args, **kwargs):
+    def __init__(self, desk_manager: DeskManager, *args, protocol_version=None, timeout=None, response_cache=None, rate_limiter=None, profiler=None,
+                 recorder=None, **kwargs):
         self.desk_manager = desk_manager
+        self.response_cache = response_cache
+        self.rate_limiter = rate_limiter
+        # Serves the debug endpoints, which are disabled without it
+        self.profiler = profiler
+        # Records every request of this connection for replay, when traffic recording is on
+        self.recorder = recorder
+        self.connection_number = recorder.open_connection() if recorder else None
+        self.request_body = None
         self.path_parts = []
+        self.query = {}
+        self.status_code = None
+        if protocol_version:
+            self.protocol_version = protocol_version
+        if timeout:
+            self.timeout = timeout
         super().__init__(*args, **kwargs)
 
     @staticmethod
@@ -33,20 +64,297 @@ class SimpleRESTServer(BaseHTTPRequestHandler):
     @classmethod
     def initialize_api_keys(cls):
         """Class method to initialize the API_KEYS static attribute."""
-        cls.API_KEYS = cls.load_api_keys(cls.API_KEYS_FILE)
+        cls.API_KEYS = frozenset(cls.load_api_keys(cls.API_KEYS_FILE))
     
-    def _send_response(self, status_code, data):
-        response_body = json.dumps(data).encode("utf-8")
+    def send_response(self, code, message=None):
+        self.status_code = code
+        super().send_response(code, message)
+
+    def _encode(self, data, content_type="application/json"):
+        """Encode a response body as JSON, or a list of (desk_id, data) pairs as desk columns, and record how long it took."""
+        started = time.perf_counter()
+        if content_type == FleetColumns.CONTENT_TYPE:
+            response_body = FleetColumns.encode(data)
+        else:
+            response_body = json.dumps(data).encode("utf-8")
+        self.desk_manager.metrics.histogram("desk_api_encode_seconds", "Time spent encoding JSON and desk column response bodies").observe(time.perf_counter() - started)
+        return response_body
+
+    def _accepted_encoding(self):
+        """Return the content coding the client prefers among those supported, or None to send bodies as they are."""
+        accept_encoding = self.headers["Accept-Encoding"]
+        if not accept_encoding:
+            return None
+        preferred, preferred_q = None, 0.0
+        for item in accept_encoding.split(","):
+            coding, _, params = item.partition(";")
+            coding = coding.strip().lower()
+            if coding not in self.CONTENT_ENCODINGS:
+                continue
+            q = 1.0
+            name, _, value = params.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+            if q > preferred_q:
+                preferred, preferred_q = coding, q
+        return preferred
+
+    def _accepts(self, media_type):
+        """Check whether the request's Accept header lists a media type."""
+        accept = self.headers["Accept"]
+        return bool(accept) and media_type in (item.partition(";")[0].strip().lower() for item in accept.split(","))
+
+    def _compressor(self, encoding):
+        return zlib.compressobj(self.COMPRESS_LEVEL, zlib.DEFLATED, self.CONTENT_ENCODINGS[encoding])
+
+    def _observe_compression(self, elapsed_s, original_bytes, compressed_bytes):
+        """Record the time spent compressing a body and its size before and after."""
+        metrics = self.desk_manager.metrics
+        metrics.histogram("desk_api_compress_seconds", "Time spent compressing response bodies").observe(elapsed_s)
+        compressed = metrics.counter("desk_api_compression_bytes_total", "Response body bytes before and after compression", ("body",))
+        compressed.inc("original", amount=original_bytes)
+        compressed.inc("compressed", amount=compressed_bytes)
+
+    def _compress(self, response_body, encoding):
+        """Compress a body with a content coding if it is large enough. Returns the body and the coding applied, or None."""
+        if encoding is None or len(response_body) < self.COMPRESS_MIN_BYTES:
+            return response_body, None
+        started = time.perf_counter()
+        compressor = self._compressor(encoding)
+        compressed = compressor.compress(response_body) + compressor.flush()
+        self._observe_compression(time.perf_counter() - started, len(response_body), len(compressed))
+        return compressed, encoding
+
+    def log_message(self, format, *args):
+        """Write the access log line through the logging pipeline instead of directly to stderr."""
+        logger.info("%s - " + format, self.address_string(), *args)
+
+    def log_error(self, format, *args):
+        logger.warning("%s - " + format, self.address_string(), *args)
+
+    def _send_response(self, status_code, data, headers=None):
+        # Only the size is logged at INFO: formatting the body of a fleet-wide response costs as much as encoding it
+        response_body = self._encode(data)
+        self._send_body(status_code, response_body, headers)
+        logger.info("Response sent: %s - %s bytes", status_code, len(response_body))
+        logger.debug("Response body: %s", data)
+
+    def _send_body(self, status_code, response_body, headers=None, content_type="application/json", compress=True):
+        """Send an already encoded body, compressed if the client accepts it. A compressed body comes with its Content-Encoding header."""
+        if compress and len(response_body) >= self.COMPRESS_MIN_BYTES:
+            response_body, encoding = self._compress(response_body, self._accepted_encoding())
+            headers = dict(headers or {})
+            headers.setdefault("Vary", "Accept-Encoding")
+            if encoding:
+                headers["Content-Encoding"] = encoding
         self.send_response(status_code)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
         self.send_header("Content-Length", str(len(response_body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection and self.protocol_version == "HTTP/1.1":
+            self.send_header("Connection", "close")
         self.end_headers()
         self.wfile.write(response_body)
-        logger.info(f"Response sent: {status_code} - {data}")
+
+    def _send_desk(self, desk_id, category=None):
+        """Send a desk's data, or one category of it, from the latest snapshot with its ETag."""
+        desk = self.desk_manager.get_desk_snapshot(desk_id)
+        if desk is None:
+            logger.warning(f"Desk not found: {desk_id}")
+            self._send_response(404, {"error": "Desk not found" if category is None else "Category not found"})
+            return
+        data = desk.data if category is None else desk.data.get(category)
+        if not data and category is not None:
+            logger.warning(f"Category not found: {category} for desk {desk_id}")
+            self._send_response(404, {"error": "Category not found"})
+            return
+
+        # Each content coding is a different representation, with its own ETag
+        encoding = self._accepted_encoding()
+        etag = f'"{self.desk_manager.epoch}-{desk.version}"' if encoding is None else f'"{self.desk_manager.epoch}-{desk.version}-{encoding}"'
+        if self._etag_matches(etag):
+            self._send_not_modified(etag)
+            return
+
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+        if self.response_cache is None:
+            response_body, content_encoding = self._compress(self._encode(data), encoding)
+        else:
+            key = (desk_id, category, encoding)
+            cached = self.response_cache.get(key, desk)
+            if cached is None:
+                cached = self._compress(self._encode(data), encoding)
+                self.response_cache.put(key, desk, cached)
+                headers["X-Cache"] = "MISS"
+            else:
+                headers["X-Cache"] = "HIT"
+            response_body, content_encoding = cached
+        if content_encoding:
+            headers["Content-Encoding"] = content_encoding
+        self._send_body(200, response_body, headers, compress=False)
+        logger.info("Response sent: 200 - %s %s (%s bytes, %s)", desk_id, category or "desk", len(response_body), headers.get("X-Cache", "uncached"))
+
+    def _send_history(self, desk_id):
+        """Send a desk's position history, downsampled to the from, to and step query parameters in simulated seconds."""
+        try:
+            bounds = {}
+            for name in ("from", "to", "step"):
+                if name in self.query:
+                    bounds[name] = float(self.query[name][0])
+                    if not math.isfinite(bounds[name]):
+                        raise ValueError(f"{name} must be a finite number")
+            history = self.desk_manager.get_desk_history(desk_id, bounds.get("from"), bounds.get("to"), bounds.get("step"))
+        except ValueError as e:
+            logger.warning(f"Invalid history query: {e}")
+            self._send_response(400, {"error": str(e)})
+            return
+        if history is None:
+            logger.warning(f"History not found: {desk_id}")
+            self._send_response(404, {"error": "History not found"})
+            return
+        self._send_response(200, {"desk_id": desk_id, **history})
+
+    def _send_not_modified(self, etag):
+        """Answer a conditional GET whose representation has not changed, without a body."""
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.end_headers()
+        logger.info("Response sent: 304 - %s", etag)
+
+    def _etag_matches(self, etag):
+        """Check whether the request's If-None-Match header lists the given ETag."""
+        if_none_match = self.headers["If-None-Match"]
+        if not if_none_match:
+            return False
+        candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+
+    def _send_stream(self, status_code, items):
+        """Stream a JSON object built from (key, value) pairs without encoding it as one string, compressed if the client accepts it."""
+        chunked = self.request_version == "HTTP/1.1" and self.protocol_version == "HTTP/1.1"
+        encoding = self._accepted_encoding()
+        compressor = self._compressor(encoding) if encoding else None
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Vary", "Accept, Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+
+        sizes = [0, 0, 0.0]
+
+        def write(text, final=False):
+            body = text.encode("utf-8")
+            if compressor:
+                started = time.perf_counter()
+                sizes[0] += len(body)
+                body = compressor.compress(body)
+                if final:
+                    body += compressor.flush()
+                sizes[1] += len(body)
+                sizes[2] += time.perf_counter() - started
+                if not body:
+                    return
+            if chunked:
+                self.wfile.write(f"{len(body):x}\r\n".encode("ascii") + body + b"\r\n")
+            else:
+                self.wfile.write(body)
+
+        buffer = []
+        buffered = 0
+        separator = "{"
+        for key, value in items:
+            chunk = f"{separator}{json.dumps(key)}: {json.dumps(value)}"
+            buffer.append(chunk)
+            buffered += len(chunk)
+            separator = ", "
+            if buffered >= self.STREAM_CHUNK_SIZE:
+                write("".join(buffer))
+                buffer.clear()
+                buffered = 0
+        buffer.append("{}" if separator == "{" else "}")
+        write("".join(buffer), final=True)
+        if compressor:
+            self._observe_compression(sizes[2], sizes[0], sizes[1])
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        logger.info("Response streamed: %s - %s items", status_code, len(items))
+
+    def _stream_events(self):
+        """Hand the connection over to the desk manager's event hub as a server-sent event stream."""
+        if not hasattr(self.server, "detach_request"):
+            self._send_response(503, {"error": "Event streaming not supported"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        self.server.detach_request(self.connection)
+        self.desk_manager.events.subscribe(self.connection, self._query_list("desk_id"))
+        logger.info(f"Event stream opened: {self.path}")
+
+    def _send_debug(self, capture):
+        """Run a CPU profile, memory or stack capture and send it as a downloadable text file."""
+        if self.profiler is None:
+            logger.warning(f"Debug endpoints are disabled: {self.path}")
+            self._send_response(404, {"error": "Debug endpoints are disabled"})
+            return
+        headers = {}
+        try:
+            seconds = float(self.query.get("seconds", ["10"])[0])
+            if not math.isfinite(seconds):
+                raise ValueError("seconds must be a finite number")
+            if capture == "profile":
+                interval_s = float(self.query.get("interval", [str(DebugProfiler.SAMPLE_INTERVAL_S)])[0])
+                result = self.profiler.profile(seconds, interval_s, self.query.get("thread", [None])[0])
+                if result is not None:
+                    body, samples = result
+                    headers["X-Profile-Samples"] = str(samples)
+                    filename = "profile-{}.folded"
+            elif capture == "memory":
+                top = int(self.query.get("top", ["25"])[0])
+                frames = int(self.query.get("frames", [str(DebugProfiler.MEMORY_FRAMES)])[0])
+                body = result = self.profiler.memory(seconds, top, frames)
+                filename = "memory-{}.txt"
+            elif capture == "stacks":
+                body = result = self.profiler.stacks()
+                filename = "stacks-{}.txt"
+            else:
+                logger.warning(f"Invalid debug endpoint: {self.path}")
+                self._send_response(400, {"error": "Invalid endpoint"})
+                return
+        except ValueError as e:
+            logger.warning(f"Invalid debug query: {e}")
+            self._send_response(400, {"error": str(e)})
+            return
+        if result is None:
+            logger.warning(f"Debug capture refused, another one is running: {self.path}")
+            self._send_response(409, {"error": "Another capture is running"})
+            return
+        headers["Content-Disposition"] = f'attachment; filename="{filename.format(time.strftime("%Y%m%d-%H%M%S"))}"'
+        self._send_body(200, body.encode("utf-8"), headers, content_type="text/plain; charset=utf-8")
+        logger.info("Response sent: 200 - %s capture", capture)
+
+    def _query_list(self, name):
+        """Return the comma-separated values of a query parameter as a list."""
+        return [value for values in self.query.get(name, []) for value in values.split(",") if value]
     
     def _is_valid_path(self):
-        # Path format: /api/<version>/<api_key>/desks[/<desk_id>]
-        self.path_parts = self.path.strip("/").split("/")
+        # Path format: /api/<version>/<api_key>/desks[/<desk_id>][?<query>]
+        url = urlsplit(self.path)
+        self.path_parts = url.path.strip("/").split("/")
+        self.query = parse_qs(url.query)
     
         if len(self.path_parts) < 4 or self.path_parts[0] != "api":
             logger.warning(f"Invalid endpoint: {self.path}")
@@ -65,64 +373,148 @@ class SimpleRESTServer(BaseHTTPRequestHandler):
             logger.warning(f"Invalid API version: {version}")
             self._send_response(400, {"error": "Invalid API version"})
             return False
-        
-        logger.info(f"Valid API request: {self.path}")
+
+        if self.rate_limiter:
+            wait_s = self.rate_limiter.admit(api_key)
+            if wait_s:
+                logger.info("Rate limit exceeded for API key %s", key_label(api_key))
+                self._send_response(429, {"error": "Too Many Requests"}, {"Retry-After": self.rate_limiter.retry_after(wait_s)})
+                return False
+
+        if self.path_parts[3] == "desks" and not self.desk_manager.ready.is_set():
+            # The saved state is still being read; metrics and debug endpoints are served meanwhile
+            self._send_response(503, {"error": "Loading"}, {"Retry-After": "1"})
+            return False
+
+        logger.info("Valid API request: %s", self.path)
         return True
     
+    def _route(self):
+        """Name the route of the current request for metrics, without desk IDs."""
+        parts = self.path_parts
+        if len(parts) < 4 or parts[0] != "api":
+            return "invalid"
+        if parts[3] == "metrics" and len(parts) == 4:
+            return "metrics"
+        if parts[3] == "debug" and len(parts) == 5:
+            return "debug"
+        if parts[3] != "desks" or len(parts) > 6:
+            return "invalid"
+        if len(parts) == 4:
+            return "fleet" if "expand" in self.query or "fields" in self.query else "desks"
+        if len(parts) == 5:
+            return parts[4] if parts[4] in ("events", "summary") else "desk"
+        return "history" if parts[5] == "history" else "category"
+
+    def _observe_request(self, method, handle):
+        """Handle a request and record its latency and status per route."""
+        started = time.perf_counter()
+        offset_s = self.recorder.now() if self.recorder else None
+        self.path_parts = []
+        self.query = {}
+        self.status_code = None
+        self.request_body = None
+        try:
+            handle()
+        finally:
+            route = self._route()
+            elapsed_s = time.perf_counter() - started
+            metrics = self.desk_manager.metrics
+            metrics.histogram("desk_api_request_duration_seconds", "Time from parsed request headers to the response being written",
+                              ("method", "route")).observe(elapsed_s, method, route)
+            metrics.counter("desk_api_requests_total", "Requests handled, by status", ("method", "route", "status")).inc(method, route, self.status_code)
+            if self.recorder:
+                headers = {name: self.headers[name] for name in self.recorder.HEADERS if name in self.headers}
+                self.recorder.record(offset_s, self.connection_number, method, route, self.path, headers, self.request_body,
+                                     self.status_code, elapsed_s)
+
+    def _send_metrics(self):
+        """Send the desk manager's metrics in the Prometheus text format."""
+        self._send_body(200, self.desk_manager.metrics.render().encode("utf-8"), content_type=MetricsRegistry.CONTENT_TYPE)
+        logger.info("Response sent: 200 - metrics")
+
     def do_GET(self):
+        self._observe_request("GET", self._handle_get)
+
+    def do_PUT(self):
+        self._observe_request("PUT", self._handle_put)
+
+    def _handle_get(self):
         if not self._is_valid_path():
             return
         
-        logger.info(f"Handling GET request for {self.path}")
+        logger.info("Handling GET request for %s", self.path)
         if self.path_parts[3] == "desks":
-            if len(self.path_parts) == 4:
+            if len(self.path_parts) == 4 and ("expand" in self.query or "fields" in self.query):
+                try:
+                    fleet = self.desk_manager.get_fleet_data(self._query_list("expand"), self._query_list("fields"))
+                except ValueError as e:
+                    logger.warning(f"Invalid fleet query: {e}")
+                    self._send_response(400, {"error": str(e)})
+                    return
+                if self._accepts(FleetColumns.CONTENT_TYPE):
+                    response_body = self._encode(fleet, FleetColumns.CONTENT_TYPE)
+                    self._send_body(200, response_body, {"Vary": "Accept, Accept-Encoding"}, content_type=FleetColumns.CONTENT_TYPE)
+                    logger.info("Response sent: 200 - %s desks as columns", len(fleet))
+                else:
+                    self._send_stream(200, fleet)
+            elif len(self.path_parts) == 4:
                 desk_ids = self.desk_manager.get_desk_ids()
                 self._send_response(200, desk_ids)
+            elif len(self.path_parts) == 5 and self.path_parts[4] == "events":
+                self._stream_events()
+            elif len(self.path_parts) == 5 and self.path_parts[4] == "summary":
+                self._send_response(200, self.desk_manager.get_fleet_summary())
             elif len(self.path_parts) == 5:
-                desk_id = self.path_parts[4]
-                desk = self.desk_manager.get_desk_data(desk_id)
-                if desk:
-                    self._send_response(200, desk)
-                else:
-                    logger.warning(f"Desk not found: {desk_id}")
-                    self._send_response(404, {"error": "Desk not found"})
+                self._send_desk(self.path_parts[4])
+            elif len(self.path_parts) == 6 and self.path_parts[5] == "history":
+                self._send_history(self.path_parts[4])
             elif len(self.path_parts) == 6:
-                desk_id = self.path_parts[4]
-                category = self.path_parts[5]
-                data = self.desk_manager.get_desk_category(desk_id, category)
-                if data:
-                    self._send_response(200, data)
-                else:
-                    logger.warning(f"Category not found: {category} for desk {desk_id}")
-                    self._send_response(404, {"error": "Category not found"})
+                self._send_desk(self.path_parts[4], self.path_parts[5])
             else:
                 logger.warning(f"Invalid path structure for GET: {self.path}")
                 self._send_response(400, {"error": "Invalid path"})
+        elif self.path_parts[3] == "metrics" and len(self.path_parts) == 4:
+            self._send_metrics()
+        elif self.path_parts[3] == "debug" and len(self.path_parts) == 5:
+            self._send_debug(self.path_parts[4])
         else:
             logger.warning(f"Invalid endpoint for GET: {self.path}")
             self._send_response(400, {"error": "Invalid endpoint"})
     
-    def do_PUT(self):
+    def _read_body(self):
+        """Read the request body so that a persistent connection stays in sync."""
+        content_length = self.headers["Content-Length"]
+        if content_length is None:
+            return None
+        try:
+            self.request_body = self.rfile.read(int(content_length))
+            return self.request_body
+        except ValueError:
+            self.close_connection = True
+            return None
+
+    def _handle_put(self):
+        post_data = self._read_body()
         if not self._is_valid_path():
             return
 
-        logger.info(f"Handling PUT request for {self.path}")
+        logger.info("Handling PUT request for %s", self.path)
         if self.path_parts[3] == "desks":
-            if len(self.path_parts) == 6:
+            if len(self.path_parts) == 4:
+                self._update_desks(post_data)
+            elif len(self.path_parts) == 6:
                 # Update a specific category of a specific desk
                 try:
-                    content_length = int(self.headers["Content-Length"])
-                    post_data = self.rfile.read(content_length)
                     update_data = json.loads(post_data)
                     desk_id = self.path_parts[4]
                     category = self.path_parts[5]
-                    success = self.desk_manager.update_desk_category(desk_id, category, update_data)
-                    if success:
-                        current_target_position = self.desk_manager.get_desk(desk_id).get_target_position()
-                        response_data = {
-                            "position_mm": current_target_position
-                        }
-                        self._send_response(200, response_data)
+                    accepted = self.desk_manager.update_desk_category(desk_id, category, update_data)
+                    if accepted and "error" in accepted:
+                        logger.warning(f"Update rejected for desk {desk_id}: {accepted['error']}")
+                        self._send_response(400, accepted)
+                    elif accepted:
+                        self._send_response(200, accepted)
                     else:
                         logger.warning(f"Update failed: Category {category} or desk {desk_id} not found.")
                         self._send_response(404, {"error": "Category not found or desk not found"})
@@ -139,17 +531,40 @@ class SimpleRESTServer(BaseHTTPRequestHandler):
             logger.warning(f"Invalid endpoint for PUT: {self.path}")
             self._send_response(400, {"error": "Invalid endpoint"})
 
+    def _update_desks(self, post_data):
+        """Queue a batch of position updates given as a list of commands or a selector with one position."""
+        try:
+            update_data = json.loads(post_data)
+            if "commands" in update_data:
+                commands = [(command["desk_id"], command["position_mm"]) for command in update_data["commands"]]
+                if not all(isinstance(desk_id, str) for desk_id, _ in commands):
+                    raise ValueError("desk_id must be a string")
+            else:
+                position_mm = update_data["position_mm"]
+                commands = [(desk_id, position_mm) for desk_id in self.desk_manager.select_desks(update_data.get("selector", {}))]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Invalid batch update for PUT: {self.path} ({e})")
+            self._send_response(400, {"error": "Invalid data"})
+            return
+        results = self.desk_manager.update_desks(commands)
+        accepted = sum(1 for result in results.values() if "error" not in result)
+        self._send_body(200, self._encode({"accepted": accepted, "rejected": len(results) - accepted, "results": results}))
+        logger.info("Response sent: 200 - batch of %s desks, %s accepted", len(results), accepted)
+
     def do_POST(self):
         """Handle unsupported POST method."""
         logger.warning(f"POST method not allowed: {self.path}")
+        self.close_connection = True
         self._send_response(405, {"error": "Method Not Allowed"})
     
     def do_DELETE(self):
         """Handle unsupported DELETE method."""
         logger.warning(f"DELETE method not allowed: {self.path}")
+        self.close_connection = True
         self._send_response(405, {"error": "Method Not Allowed"})
     
     def do_PATCH(self):
         """Handle unsupported PATCH method."""
         logger.warning(f"PATCH method not allowed: {self.path}")
+        self.close_connection = True
         self._send_response(405, {"error": "Method Not Allowed"})
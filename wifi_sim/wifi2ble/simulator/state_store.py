@@ -0,0 +1,258 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StateStore:
+    """Persists desk changes to an append-only journal and compacts them into periodic snapshots in a background thread."""
+    METADATA_KEYS = ("current_time_s", "simulation_speed", "journal_sequence", "journal_tick")
+
+    def __init__(self, state_file, snapshot_interval_s=60, initial_state_file=None):
+        self.state_file = state_file
+        self.journal_file = self.journal_file_of(state_file)
+        # Loaded instead of state_file until the store has written its own snapshot
+        self.initial_state_file = initial_state_file
+        self.snapshot_interval_s = snapshot_interval_s
+        self.queue = queue.Queue()
+        self.thread = None
+        self.journal = None
+        # Latest (data, clock_s, user, power_on_time_s) change and the tick it was taken at, per desk. Records are only
+        # built when written, so a large fleet does not keep a second copy of every desk's data. Seeded by load(), then owned
+        # by the writer thread
+        self.desks = {}
+        self.sequence = 0
+        self.tick = 0
+        self.current_time_s = None
+        self.simulation_speed = None
+        self.last_snapshot = None
+        self.counters = {
+            "journalBatches": 0,
+            "journalBytes": 0,
+            "journalTime_s": 0.0,
+            "snapshots": 0,
+            "snapshotBytes": 0,
+            "snapshotTime_s": 0.0,
+        }
+
+    @staticmethod
+    def journal_file_of(state_file):
+        return os.path.splitext(state_file)[0] + ".journal"
+
+    def load(self, owns=None, tick=0):
+        """Read the last snapshot and replay the journal after it. Returns the state in the snapshot format, or None.
+
+        The loaded desks, or those for which owns(desk_id) is true, are kept as taken at the given tick, so that
+        they are saved again without being journaled until they change.
+        """
+        state_file, journal_files = self.state_file, [self.journal_file]
+        if not os.path.exists(state_file) and self.initial_state_file:
+            # Until the first snapshot, this store's journal continues the sequence of the initial state's journal
+            state_file = self.initial_state_file
+            journal_files.insert(0, self.journal_file_of(self.initial_state_file))
+        if not os.path.exists(state_file):
+            return None
+        state = {}
+        desks = {}
+        with open(state_file, "r") as f:
+            for key, value in self._read_items(f):
+                if key in self.METADATA_KEYS:
+                    state[key] = value
+                else:
+                    desks[key] = value
+        self.sequence = state.get("journal_sequence", 0)
+        snapshot_tick = state.get("journal_tick", 0)
+        for key, value in desks.items():
+            desks[key] = (value, snapshot_tick)
+
+        replayed = 0
+        last_tick = snapshot_tick
+        for journal_file in journal_files:
+            if os.path.exists(journal_file):
+                with open(journal_file, "r") as f:
+                    for line in f:
+                        try:
+                            batch = json.loads(line)
+                        except json.JSONDecodeError:
+                            # A crash can leave the last line incomplete
+                            logger.warning(f"Ignoring incomplete journal record in {journal_file}.")
+                            break
+                        if batch["seq"] <= self.sequence:
+                            continue
+                        for desk_id, record in batch["desks"].items():
+                            if record is None:
+                                desks.pop(desk_id, None)
+                            else:
+                                desks[desk_id] = (record, batch["tick"])
+                        self.sequence = batch["seq"]
+                        last_tick = batch["tick"]
+                        state["current_time_s"] = batch["current_time_s"]
+                        state["simulation_speed"] = batch["simulation_speed"]
+                        replayed += 1
+
+        # Desks only appear in the journal when they change, but their clocks tick while they are powered on
+        loaded = {key: state[key] for key in ("current_time_s", "simulation_speed") if key in state}
+        for desk_id, (record, record_tick) in desks.items():
+            power_on_time_s = self.power_on_time_of(record, state.get("current_time_s"))
+            if power_on_time_s is None and record_tick < last_tick:
+                record = {**record, "desk_data": {**record["desk_data"], "clock_s": record["desk_data"]["clock_s"] + last_tick - record_tick}}
+            loaded[desk_id] = record
+            if owns is None or owns(desk_id):
+                desk_data = record["desk_data"]
+                self.desks[desk_id] = ((desk_data, desk_data["clock_s"], record["user"], power_on_time_s), tick)
+        logger.info(f"State loaded from {state_file} with {replayed} journal records replayed.")
+        return loaded
+
+    @staticmethod
+    def power_on_time_of(record, current_time_s):
+        """Return the simulated time a saved desk powers on again, or None if it is powered on.
+
+        Records saved before the power-on time was kept power on at the saved time.
+        """
+        if not record.get("poweredOff"):
+            return None
+        return record.get("powerOnTime_s", current_time_s)
+
+    @staticmethod
+    def _read_items(f):
+        """Yield the keys and values of a state file, parsing a snapshot written one desk per line a line at a time."""
+        first = f.readline()
+        if first.rstrip().endswith("}") or first.strip() == "{":
+            # Written whole by an earlier version, on one line or indented
+            yield from json.loads(first + f.read()).items()
+            return
+        for line in itertools.chain([first.removeprefix("{")], f):
+            line = line.strip().rstrip(",")
+            if line and line != "}":
+                yield from json.loads("{" + line + "}").items()
+
+    def record(self, tick, current_time_s, simulation_speed, changes):
+        """Queue the desks changed on a tick as {desk_id: (data, clock_s, user, power_on_time_s) or None if removed}.
+
+        power_on_time_s is None for desks that are powered on.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._write, name="state-store")
+            self.thread.start()
+        self.queue.put((tick, current_time_s, simulation_speed, changes))
+
+    def stop(self):
+        """Write the queued changes and a final snapshot, then stop the writer thread."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        logger.info(f"State store stopped: {self.stats()}")
+
+    def stats(self):
+        """Return the journal and snapshot counters, and the number of batches waiting for the writer."""
+        return {**self.counters, "queuedBatches": self.queue.qsize()}
+
+    def _write(self):
+        """Append every queued batch to the journal and write a snapshot whenever the interval has passed."""
+        self.journal = open(self.journal_file, "a")
+        stopping = False
+        while not stopping:
+            batches = [self.queue.get()]
+            # Coalesce the batches that queued up while the last one was written
+            while batches[-1] is not None and not self.queue.empty():
+                batches.append(self.queue.get())
+            if batches[-1] is None:
+                stopping = True
+                batches.pop()
+            if batches:
+                self._append(*self._merge(batches))
+            if self.last_snapshot is None or time.monotonic() - self.last_snapshot >= self.snapshot_interval_s:
+                self._write_snapshot()
+        self._write_snapshot()
+        self.journal.close()
+
+    @staticmethod
+    def _merge(batches):
+        """Merge consecutive batches into one, keeping the latest change of each desk."""
+        tick, current_time_s, simulation_speed, _ = batches[-1]
+        changes = {}
+        for batch_tick, _, _, batch_changes in batches:
+            for desk_id, change in batch_changes.items():
+                if change is not None and change[3] is None and batch_tick < tick:
+                    data, clock_s, user, power_on_time_s = change
+                    change = (data, clock_s + tick - batch_tick, user, power_on_time_s)
+                changes[desk_id] = change
+        return tick, current_time_s, simulation_speed, changes
+
+    def _append(self, tick, current_time_s, simulation_speed, changes):
+        """Apply a batch to the in-memory records and append it to the journal as one line."""
+        started = time.perf_counter()
+        self.sequence += 1
+        self.tick = tick
+        self.current_time_s = current_time_s
+        self.simulation_speed = simulation_speed
+        records = {}
+        for desk_id, change in changes.items():
+            if change is None:
+                self.desks.pop(desk_id, None)
+                records[desk_id] = None
+                continue
+            self.desks[desk_id] = (change, tick)
+            records[desk_id] = self._record(*change)
+        line = json.dumps({
+            "seq": self.sequence,
+            "tick": tick,
+            "current_time_s": current_time_s,
+            "simulation_speed": simulation_speed,
+            "desks": records,
+        }) + "\n"
+        self.journal.write(line)
+        self.journal.flush()
+        self.counters["journalBatches"] += 1
+        self.counters["journalBytes"] += len(line)
+        self.counters["journalTime_s"] += time.perf_counter() - started
+
+    @staticmethod
+    def _record(data, clock_s, user, power_on_time_s):
+        """Build the saved record of a desk."""
+        record = {"desk_data": {**data, "clock_s": clock_s}, "user": user, "poweredOff": power_on_time_s is not None}
+        if power_on_time_s is not None:
+            record["powerOnTime_s"] = power_on_time_s
+        return record
+
+    def _write_snapshot(self):
+        """Write every desk to a temporary file, rename it over the state file and start a new journal."""
+        if self.current_time_s is None:
+            return
+        started = time.perf_counter()
+        metadata = {
+            "current_time_s": self.current_time_s,
+            "simulation_speed": self.simulation_speed,
+            "journal_sequence": self.sequence,
+            "journal_tick": self.tick,
+        }
+
+        temporary_file = self.state_file + ".tmp"
+        with open(temporary_file, "w") as f:
+            # Still one JSON object, but with the metadata first and a desk per line, so that load() parses it a desk at a time
+            f.write("{" + ", ".join(f"{json.dumps(key)}: {json.dumps(value)}" for key, value in metadata.items()))
+            for desk_id, ((data, clock_s, user, power_on_time_s), tick) in self.desks.items():
+                if power_on_time_s is None and tick < self.tick:
+                    clock_s += self.tick - tick
+                f.write(f",\n{json.dumps(desk_id)}: {json.dumps(self._record(data, clock_s, user, power_on_time_s))}")
+            f.write("\n}\n")
+            size = f.tell()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_file, self.state_file)
+        # Records up to journal_sequence are now in the snapshot; replaying them again would be harmless
+        self.journal.close()
+        self.journal = open(self.journal_file, "w")
+        self.last_snapshot = time.monotonic()
+
+        elapsed = time.perf_counter() - started
+        self.counters["snapshots"] += 1
+        self.counters["snapshotBytes"] = size
+        self.counters["snapshotTime_s"] += elapsed
+        logger.info(f"State snapshot written to {self.state_file}: {len(self.desks)} desks, {size} bytes in {elapsed * 1000:.1f} ms.")
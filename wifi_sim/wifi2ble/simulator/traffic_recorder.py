@@ -0,0 +1,109 @@
+import gzip
+import itertools
+import json
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TrafficRecorder:
+    """Records the requests handled by the REST server to a trace file that tests/traffic_replay.py can re-issue.
+
+    The trace is JSON lines, gzip-compressed when the file name ends in .gz. The first line describes the trace and
+    each other line is one request: [offset_s, connection, method, route, path, headers, body, status, duration_s].
+    Offsets are seconds since recording started, taken when the request's headers were parsed, and requests of the
+    same connection share its number, so a replay can keep both the timing and the concurrency of the traffic.
+    Handlers only queue the requests; a background thread encodes and writes them.
+    """
+    FORMAT = "desk-traffic"
+    VERSION = 1
+    # Request headers that change the response and are kept in the trace
+    HEADERS = ("Accept", "Accept-Encoding", "If-None-Match", "Content-Type")
+    # Event streams hold their connection until the client leaves and debug captures run for seconds; neither is replayable
+    SKIPPED_ROUTES = frozenset(("events", "debug"))
+
+    def __init__(self, trace_file):
+        self.trace_file = trace_file
+        self.started = time.monotonic()
+        self.connections = itertools.count(1)
+        self.queue = queue.SimpleQueue()
+        # Only updated by the writer thread
+        self.counts = {"requests": 0, "bytes": 0}
+        self.file = self.open(trace_file, "wt")
+        self._write_line({"format": self.FORMAT, "version": self.VERSION, "started": time.time(), "fields": [
+            "offset_s", "connection", "method", "route", "path", "headers", "body", "status", "duration_s"]})
+        self.thread = threading.Thread(target=self._write, name="traffic-recorder", daemon=True)
+        self.thread.start()
+        logger.info(f"Recording API traffic to {trace_file}.")
+
+    @staticmethod
+    def open(trace_file, mode="rt"):
+        """Open a trace file, compressed or not depending on its name."""
+        if trace_file.endswith(".gz"):
+            return gzip.open(trace_file, mode, encoding="utf-8")
+        return open(trace_file, mode, encoding="utf-8")
+
+    @classmethod
+    def load(cls, trace_file):
+        """Read a trace and return its description and its requests as lists, in the order they were recorded."""
+        with cls.open(trace_file) as f:
+            header = json.loads(f.readline())
+            if header.get("format") != cls.FORMAT:
+                raise ValueError(f"{trace_file} is not a traffic trace")
+            if header.get("version") != cls.VERSION:
+                raise ValueError(f"Unsupported traffic trace version: {header.get('version')}")
+            requests = []
+            for line in f:
+                try:
+                    requests.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Recording can stop in the middle of a line if the server is killed
+                    logger.warning(f"Ignoring incomplete request record in {trace_file}.")
+                    break
+        requests.sort(key=lambda request: request[0])
+        return header, requests
+
+    def now(self):
+        """Return the offset of the current time in the trace."""
+        return time.monotonic() - self.started
+
+    def open_connection(self):
+        """Return the number of a new client connection."""
+        return next(self.connections)
+
+    def record(self, offset_s, connection, method, route, path, headers, body, status, duration_s):
+        """Queue a handled request. Bodies are bytes, or None for requests without one."""
+        if route not in self.SKIPPED_ROUTES:
+            self.queue.put((offset_s, connection, method, route, path, headers, body, status, duration_s))
+
+    def stop(self):
+        """Write the queued requests and close the trace."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.file.close()
+        logger.info(f"Traffic recording stopped: {self.stats()}")
+
+    def stats(self):
+        return {**self.counts, "queued": self.queue.qsize()}
+
+    def _write(self):
+        while True:
+            request = self.queue.get()
+            if request is None:
+                return
+            offset_s, connection, method, route, path, headers, body, status, duration_s = request
+            if body is not None:
+                # Bodies are expected to be JSON text; other bytes survive the round trip as escaped surrogates
+                body = body.decode("utf-8", "surrogateescape")
+            self._write_line([round(offset_s, 6), connection, method, route, path, headers or None, body, status, round(duration_s, 6)])
+            self.counts["requests"] += 1
+
+    def _write_line(self, value):
+        line = json.dumps(value, separators=(",", ":")) + "\n"
+        self.file.write(line)
+        self.counts["bytes"] += len(line)
@@ -11,6 +11,9 @@ class UserType(Enum):
 
 class UserBehavior:
     """Base class for user behaviors."""
+    # Behaviors are a few parameters per desk; slots keep them small in large fleets
+    __slots__ = ("desk",)
+
     def __init__(self, desk):
         self.desk = desk
 
@@ -23,6 +26,8 @@ class UserBehavior:
 
 class SeatedUser(UserBehavior):
     """User who always keeps the desk in a seated position."""
+    __slots__ = ("preffered_position",)
+
     def __init__(self, desk, preffered_position=0):
         super().__init__(desk)
         if preffered_position < desk.min_position or preffered_position > desk.max_position:
@@ -32,11 +37,13 @@ class SeatedUser(UserBehavior):
     
     def simulate(self, time_delta_s):
         if self.desk.state["position_mm"] > self.preffered_position:
-            logger.info(f"SeatedUser adjusting desk {self.desk.desk_id} to seated position {self.preferred_position}.")
+            logger.info("SeatedUser adjusting desk %s to seated position %s.", self.desk.desk_id, self.preffered_position)
             self.desk.set_target_position(self.preffered_position)
 
 class StandingUser(UserBehavior):
     """User who always keeps the desk in a standing position."""
+    __slots__ = ("preffered_position",)
+
     def __init__(self, desk, preffered_position=0):
         super().__init__(desk)
         if preffered_position < desk.min_position or preffered_position > desk.max_position:
@@ -46,11 +53,13 @@ class StandingUser(UserBehavior):
 
     def simulate(self, time_delta_s):
         if self.desk.state["position_mm"] < self.preffered_position:
-            logger.info(f"StandingUser adjusting desk {self.desk.desk_id} to standing position {self.preferred_position}.")
+            logger.info("StandingUser adjusting desk %s to standing position %s.", self.desk.desk_id, self.preffered_position)
             self.desk.set_target_position(self.preffered_position)
 
 class ActiveUser(UserBehavior):
     """User who moves between seated and standing positions a few times a day."""
+    __slots__ = ("position_cycle_time_s", "seated_position", "standing_position", "next_position", "cycle_timer")
+
     def __init__(self, desk, position_cycle_time_s=3600, seated_position=0, standing_position=0):
         super().__init__(desk)
 
@@ -75,5 +84,6 @@ class ActiveUser(UserBehavior):
             self.next_position = (
                 self.standing_position if self.desk.state["position_mm"] <= self.seated_position else self.seated_position
             )
-            logger.info(f"ActiveUser adjusting desk {self.desk.desk_id} to {'standing' if self.next_position == self.standing_position else 'seated'} position {self.next_position}.")
+            logger.info("ActiveUser adjusting desk %s to %s position %s.", self.desk.desk_id,
+                        "standing" if self.next_position == self.standing_position else "seated", self.next_position)
             self.desk.set_target_position(self.next_position)
@@ -0,0 +1,80 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulator"))
+
+from desk import Desk
+from fleet_columns import FleetColumns
+
+# Window bits of each content coding, as the server uses them
+CODINGS = {"gzip": 31, "deflate": 15}
+
+def create_fleet(args):
+    """Tick a fleet with random targets so that positions, counters and errors differ between desks."""
+    random.seed(args.seed)
+    manufacturers = ["Linak A/S", "Desk-O-Matic Co.", "Ikea", "Steelcase"]
+    desks = [Desk(f"{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}:{random.getrandbits(24):06x}", f"DESK {i}", random.choice(manufacturers))
+             for i in range(args.desks)]
+    for t in range(args.ticks):
+        if t % 20 == 0:
+            for desk in desks:
+                if random.random() < 0.3:
+                    desk.set_target_position(random.randint(desk.min_position, desk.max_position))
+        for desk in desks:
+            desk.update()
+    return [(desk.desk_id, desk.get_data()) for desk in desks]
+
+def encode_json(fleet):
+    # Same separators as the server's streamed fleet listing
+    return ("{" + ", ".join(f"{json.dumps(desk_id)}: {json.dumps(data)}" for desk_id, data in fleet) + "}").encode("utf-8")
+
+def compress(body, coding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, CODINGS[coding])
+    return compressor.compress(body) + compressor.flush()
+
+def measure(encode, repeat):
+    """Return the body and the best time of repeat runs of an encoder."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = encode()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return body, best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare bytes on the wire and encode time of JSON, compressed JSON and desk columns.")
+    parser.add_argument("--desks", type=int, default=10000, help="Number of desks (default: 10000)")
+    parser.add_argument("--ticks", type=int, default=120, help="Ticks with random targets before encoding (default: 120)")
+    parser.add_argument("--level", type=int, default=6, help="zlib compression level (default: 6, as the server)")
+    parser.add_argument("--repeat", type=int, default=5, help="Encodes per format; the best time is reported (default: 5)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    fleet = create_fleet(args)
+    assert FleetColumns.decode(FleetColumns.encode(fleet)) == fleet
+
+    formats = {
+        "json": lambda: encode_json(fleet),
+        "json+gzip": lambda: compress(encode_json(fleet), "gzip", args.level),
+        "json+deflate": lambda: compress(encode_json(fleet), "deflate", args.level),
+        "columns": lambda: FleetColumns.encode(fleet),
+        "columns+gzip": lambda: compress(FleetColumns.encode(fleet), "gzip", args.level),
+    }
+    print(f"Fleet of {len(fleet)} desks, all categories:")
+    json_bytes = None
+    for name, encode in formats.items():
+        body, elapsed = measure(encode, args.repeat)
+        json_bytes = json_bytes or len(body)
+        print(f"{name:>14}: {len(body):>10} bytes ({len(body) / json_bytes:6.1%} of JSON), encode {elapsed * 1000:8.2f} ms, {elapsed / len(fleet) * 1e6:5.2f} us per desk")
+
+    desk_body = json.dumps(fleet[0][1]).encode("utf-8")
+    body, elapsed = measure(lambda: compress(desk_body, "gzip", args.level), args.repeat * 100)
+    print(f"One desk: {len(desk_body)} bytes as JSON, {len(body)} gzipped in {elapsed * 1e6:.1f} us")
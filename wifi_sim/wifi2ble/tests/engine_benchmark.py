@@ -0,0 +1,99 @@
+import argparse
+import logging
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulator"))
+
+from desk import Desk
+from numpy_engine import NumpyTickEngine
+from lazy_engine import LazyMotionEngine
+from compact_engine import CompactTickEngine
+
+ENGINES = {"numpy": NumpyTickEngine, "lazy": LazyMotionEngine, "compact": CompactTickEngine}
+# Engines that draw collisions from the random module like Desk, and must serve the same data as the python engine
+EXACT_ENGINES = ("numpy", "compact")
+
+def create_engine(engine_name, seed):
+    """The lazy engine draws collisions from its own generator; the others draw from the random module, as Desk does."""
+    return LazyMotionEngine(seed) if engine_name == "lazy" else ENGINES[engine_name]()
+
+def create_desks(count):
+    return {f"desk-{i}": Desk(f"desk-{i}", f"DESK {i}", "Desk-O-Matic Co.") for i in range(count)}
+
+def run(engine_name, args):
+    """Tick a fleet for the given engine and return (tick times, fleet statistics, data of every desk)."""
+    random.seed(args.seed)
+    desks = create_desks(args.desks)
+    start_clock = next(iter(desks.values())).clock_s
+    if engine_name in ENGINES:
+        engine = create_engine(engine_name, args.seed)
+        desks = engine.attach(desks)
+        tick = engine.step
+    else:
+        def tick():
+            for desk in desks.values():
+                desk.update()
+
+    # The same seeded target schedule drives both engines
+    targets = random.Random(args.seed)
+    tick_times = []
+    for t in range(args.ticks):
+        if t % args.retarget_every == 0:
+            for desk in desks.values():
+                if targets.random() < args.retarget_fraction:
+                    if args.fractional_targets:
+                        desk.set_target_position(round(targets.uniform(desk.min_position, desk.max_position), 1))
+                    else:
+                        desk.set_target_position(targets.randint(desk.min_position, desk.max_position))
+        started = time.perf_counter()
+        tick()
+        tick_times.append(time.perf_counter() - started)
+
+    stats = {"activations": 0, "sitStandCrossings": 0, "collisions": 0, "meanPosition": 0.0}
+    fleet = {desk_id: desk.get_data() for desk_id, desk in desks.items()}
+    for data in fleet.values():
+        stats["activations"] += data["usage"]["activationsCounter"]
+        stats["sitStandCrossings"] += data["usage"]["sitStandCounter"]
+        stats["collisions"] += sum(1 for error in data["lastErrors"] if error["time_s"] > start_clock)
+        stats["meanPosition"] += data["state"]["position_mm"] / len(desks)
+    return tick_times, stats, fleet
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare tick time and fleet statistics of the python, numpy, lazy and compact engines.")
+    parser.add_argument("--desks", type=int, default=10000, help="Number of desks (default: 10000)")
+    parser.add_argument("--ticks", type=int, default=300, help="Number of one-second ticks (default: 300)")
+    parser.add_argument("--retarget-every", type=int, default=60, help="Ticks between new targets for every desk (default: 60)")
+    parser.add_argument("--retarget-fraction", type=float, default=1.0, help="Fraction of desks given a new target each time (default: 1.0)")
+    parser.add_argument("--fractional-targets", action="store_true", help="Give desks targets with a fractional part, as the REST API accepts")
+    parser.add_argument("--sigmas", type=float, default=4.0, help="Allowed difference of the lazy engine's counts, in standard deviations of sampling noise, sqrt(python + lazy) (default: 4)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    results = {engine_name: run(engine_name, args) for engine_name in ("python", "numpy", "lazy", "compact")}
+    for engine_name, (tick_times, stats, _) in results.items():
+        mean_ms = sum(tick_times) / len(tick_times) * 1000
+        print(f"{engine_name:>7}: mean tick {mean_ms:.2f} ms, max tick {max(tick_times) * 1000:.2f} ms, {stats}")
+
+    _, python_stats, python_fleet = results["python"]
+    failures = []
+    for engine_name in ENGINES:
+        _, engine_stats, engine_fleet = results[engine_name]
+        for name in python_stats:
+            difference = (engine_stats[name] - python_stats[name]) / python_stats[name] if python_stats[name] else 0.0
+            print(f"{name}: python={python_stats[name]:.1f} {engine_name}={engine_stats[name]:.1f} ({difference:+.2%})")
+            # The lazy engine draws collisions from its own generator, so its counts only agree within sampling noise
+            if engine_name not in EXACT_ENGINES and name != "meanPosition":
+                if abs(engine_stats[name] - python_stats[name]) > args.sigmas * math.sqrt(engine_stats[name] + python_stats[name]):
+                    failures.append(f"{engine_name} {name} differs by {difference:+.2%}")
+        if engine_name in EXACT_ENGINES:
+            different = sum(1 for desk_id, data in python_fleet.items() if engine_fleet[desk_id] != data)
+            if different:
+                failures.append(f"{engine_name} serves different data for {different} desks")
+    assert not failures, "; ".join(failures)
+    print(f"The {' and '.join(EXACT_ENGINES)} engines serve the same data as the python engine for all {len(python_fleet)} desks.")
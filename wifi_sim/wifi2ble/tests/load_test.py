@@ -0,0 +1,323 @@
+import http.client
+import json
+import argparse
+import collections
+import logging
+import multiprocessing
+import os
+import random
+import ssl
+import sys
+import tempfile
+import threading
+import time
+
+SIMULATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulator")
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+
+# Constants for the API
+API_VERSION = "v2"
+API_KEY = "E9Y2LxT4g1hQZ7aD8nR3mWx5P0qK6pV7"  # Replace with a valid API key
+REQUEST_KINDS = ("list", "desk", "category", "put")
+CATEGORIES = ("config", "state", "usage", "lastErrors")
+PERCENTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99, "p999": 0.999}
+# Upper bounds of the latency histogram buckets, in milliseconds; the last bucket is unbounded
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+class ResumingHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection that offers the TLS session of the client's previous connection and records its handshakes."""
+
+    def __init__(self, host, port, tls_state):
+        # A session can only be resumed with the context that created it
+        super().__init__(host, port, context=tls_state["context"])
+        self.tls_state = tls_state
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        started = time.perf_counter()
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host, session=self.tls_state["session"])
+        self.tls_state["handshakes"].append((time.perf_counter() - started, self.sock.session_reused))
+
+    def close(self):
+        # TLS 1.3 tickets arrive after the handshake, so the session is taken when the connection is done
+        if self.sock is not None and self.tls_state["resume"]:
+            self.tls_state["session"] = self.sock.session
+        super().close()
+
+def get_connection(use_https, host, port, tls_state=None):
+    if use_https and tls_state is not None:
+        return ResumingHTTPSConnection(host, port, tls_state)
+    if use_https:
+        context = ssl._create_unverified_context()  # For testing only; consider using verified SSL in production
+        return http.client.HTTPSConnection(host, port, context=context)
+    else:
+        return http.client.HTTPConnection(host, port)
+
+def parse_mix(value):
+    """Parse request weights such as list=1,desk=10,category=5,put=1."""
+    mix = {}
+    for item in value.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in REQUEST_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown request kind: {kind}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+def summarize(latencies, elapsed):
+    """Return throughput, percentiles and a histogram of a list of latencies in seconds."""
+    latencies = sorted(latencies)
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    bucket = 0
+    for latency in latencies:
+        while bucket < len(HISTOGRAM_BOUNDS_MS) and latency * 1000 > HISTOGRAM_BOUNDS_MS[bucket]:
+            bucket += 1
+        counts[bucket] += 1
+    summary = {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+    for name, fraction in PERCENTILES.items():
+        summary[f"{name}_ms"] = round(percentile(latencies, fraction) * 1000, 3)
+    summary["histogram_ms"] = {"bounds": list(HISTOGRAM_BOUNDS_MS), "counts": counts}
+    return summary
+
+def make_request(rng, kind, base_url, desk_ids):
+    """Pick the method, endpoint and body of one request of the given kind."""
+    if kind == "list":
+        return "GET", base_url, None
+    desk_id = rng.choice(desk_ids)
+    if kind == "desk":
+        return "GET", f"{base_url}/{desk_id}", None
+    if kind == "category":
+        return "GET", f"{base_url}/{desk_id}/{rng.choice(CATEGORIES)}", None
+    return "PUT", f"{base_url}/{desk_id}/state", json.dumps({"position_mm": rng.randint(680, 1320)})
+
+def run_client(args, base_url, desk_ids, deadline, seed, latencies, errors, handshakes):
+    rng = random.Random(seed)
+    tls_state = {"context": ssl._create_unverified_context(), "session": None, "resume": args.tls_resume, "handshakes": handshakes}
+    kinds = list(args.mix)
+    weights = list(args.mix.values())
+    headers = {"Content-Type": "application/json"}
+    connection = None
+    while time.time() < deadline:
+        if connection is None:
+            connection = get_connection(args.https, args.host, args.port, tls_state)
+        kind = rng.choices(kinds, weights)[0]
+        method, endpoint, body = make_request(rng, kind, base_url, desk_ids)
+        start = time.perf_counter()
+        try:
+            connection.request(method, endpoint, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+            if not args.keep_alive or response.will_close:
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            connection.close()
+            connection = None
+            continue
+        latencies[kind].append(time.perf_counter() - start)
+    if connection is not None:
+        connection.close()
+
+def run_clients(args, base_url, desk_ids, deadline, process_index, results=None):
+    """Run the client threads of one process and return (latencies per kind, errors, TLS handshakes)."""
+    latencies = {kind: [] for kind in REQUEST_KINDS}
+    errors = []
+    handshakes = []
+    clients = [
+        threading.Thread(target=run_client, args=(args, base_url, desk_ids, deadline,
+                                                  args.seed + process_index * args.clients + i, latencies, errors, handshakes))
+        for i in range(args.clients)
+    ]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    if results is not None:
+        results.put((latencies, errors, handshakes))
+    return latencies, errors, handshakes
+
+def start_server(args):
+    """Start the simulator and REST server in this process and return (httpd, desk_manager, log_pipeline)."""
+    sys.path.insert(0, SIMULATOR_DIR)
+    from users import UserType
+    from desk_manager import DeskManager
+    from simple_rest_server import SimpleRESTServer
+    from response_cache import ResponseCache
+    from main import create_handler, create_http_server, create_tls_context, enable_https
+    from log_pipeline import LogPipeline, parse_log_rates
+    from admission import KeyRateLimiter, parse_rate_limits
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", filename=args.log_file)
+    log_pipeline = LogPipeline(parse_log_rates(args.log_rate) if args.log_rate else None, args.async_logging)
+    log_pipeline.start()
+    state_file = os.path.join(tempfile.mkdtemp(prefix="load_test_"), "desks_state.json")
+    desk_manager = DeskManager(engine=args.engine, seed=args.seed, state_file=state_file)
+    for i in range(args.desks):
+        desk_manager.add_desk(f"02:00:00:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}", f"DESK {i}", "Desk-O-Matic Co.", UserType.ACTIVE)
+    desk_manager.start_updates()
+
+    SimpleRESTServer.API_KEYS = frozenset([API_KEY])
+    response_cache = ResponseCache(args.response_cache_size) if args.response_cache_size > 0 else None
+    rate_limiter = KeyRateLimiter(*parse_rate_limits(args.rate_limit)) if args.rate_limit else None
+    handler = create_handler(desk_manager, SimpleRESTServer, args.server, 15, response_cache, rate_limiter)
+    httpd = create_http_server((args.host, args.port), handler, args.server, args.workers, args.queue_size,
+                               shed_load=args.overload == "shed", max_queue_wait=args.max_queue_wait)
+    if args.https:
+        enable_https(httpd, context=create_tls_context(args.certfile, args.keyfile, args.tls_tickets))
+    args.port = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, desk_manager, log_pipeline
+
+def summarize_handshakes(handshakes, requests):
+    """Summarize client-side (seconds, resumed) TLS handshakes made for a number of requests."""
+    full = sorted(elapsed for elapsed, resumed in handshakes if not resumed)
+    resumed = sorted(elapsed for elapsed, resumed in handshakes if resumed)
+    return {
+        "handshakes": len(handshakes),
+        "resumed": len(resumed),
+        "resumption_ratio": len(resumed) / len(handshakes),
+        "full_p50_ms": percentile(full, 0.5) * 1000,
+        "resumed_p50_ms": percentile(resumed, 0.5) * 1000,
+        "requests_per_handshake": requests / len(handshakes),
+    }
+
+def compare(results, baseline, tolerance):
+    """Print throughput and p99 changes against a baseline and return whether any request kind regressed."""
+    regressed = False
+    for kind, current in results["latency"].items():
+        previous = baseline.get("latency", {}).get(kind)
+        if not previous or not previous["requests"] or not current["requests"]:
+            continue
+        throughput = current["throughput_rps"] / previous["throughput_rps"] - 1
+        p99 = current["p99_ms"] / previous["p99_ms"] - 1 if previous["p99_ms"] else 0.0
+        failed = throughput < -tolerance or p99 > tolerance
+        regressed = regressed or failed
+        print(f"{kind:>8}: throughput {throughput:+.1%}, p99 {p99:+.1%}{'  REGRESSION' if failed else ''}")
+    return regressed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure throughput and latency of the Desk Management REST API.")
+    parser.add_argument("--https", action="store_true", help="Use HTTPS for requests")
+    parser.add_argument("--host", type=str, default="localhost", help="Server host (default: localhost)")
+    parser.add_argument("--port", type=int, default=8000, help="Server port (default: 8000)")
+    parser.add_argument("--clients", type=int, default=16, help="Number of concurrent clients per process (default: 16)")
+    parser.add_argument("--processes", type=int, default=1, help="Number of client processes, so that load generation is not limited by one interpreter (default: 1)")
+    parser.add_argument("--duration", type=float, default=10, help="Test duration in seconds (default: 10)")
+    parser.add_argument("--keep-alive", action="store_true", help="Reuse connections between requests")
+    parser.add_argument("--tls-resume", action="store_true", help="With --https, resume the previous TLS session when reconnecting")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("list=1,desk=1"), help="Weights of the request kinds list, desk, category and put (default: list=1,desk=1)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the request sequence and the in-process simulator (default: 1)")
+    parser.add_argument("--output", type=str, help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", type=str, help="Compare against results saved with --output and exit with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed throughput drop or p99 increase against the baseline (default: 0.1)")
+    parser.add_argument("--serve", action="store_true", help="Start the simulator and server in this process instead of using a running one")
+    parser.add_argument("--desks", type=int, default=100, help="Number of desks of the in-process simulator (default: 100)")
+    parser.add_argument("--engine", type=str, default="python", choices=["python", "numpy", "lazy", "compact"], help="Tick engine of the in-process simulator (default: python)")
+    parser.add_argument("--server", type=str, default="pool", choices=["single", "pool"], help="Serving mode of the in-process server (default: pool, required with --https)")
+    parser.add_argument("--workers", type=int, default=16, help="Number of worker threads of the in-process server (default: 16)")
+    parser.add_argument("--queue-size", type=int, default=64, help="Accept queue size of the in-process server (default: 64)")
+    parser.add_argument("--response-cache-size", type=int, default=1024, help="Response cache size of the in-process server (default: 1024)")
+    parser.add_argument("--rate-limit", type=str, help="Requests per second per API key of the in-process server, e.g. 50 or 50,<api_key>=200")
+    parser.add_argument("--overload", type=str, default="block", choices=["block", "shed"], help="Overload behavior of the in-process pool server (default: block)")
+    parser.add_argument("--max-queue-wait", type=float, default=1.0, help="Seconds a connection may wait for a worker of the in-process server with --overload shed (default: 1.0)")
+    parser.add_argument("--log-level", type=str, default="CRITICAL", help="Logging level of the in-process simulator and server (default: CRITICAL)")
+    parser.add_argument("--log-file", type=str, help="Write the in-process server's log to this file instead of stderr")
+    parser.add_argument("--async-logging", action="store_true", help="Format and write the in-process server's log in a background thread")
+    parser.add_argument("--log-rate", type=str, help="Rate limits of the in-process server's log categories, e.g. movement=10,requests=100")
+    parser.add_argument("--certfile", type=str, default=os.path.join(CONFIG_DIR, "cert.pem"), help="Certificate of the in-process HTTPS server")
+    parser.add_argument("--keyfile", type=str, default=os.path.join(CONFIG_DIR, "key.pem"), help="Key of the in-process HTTPS server")
+    parser.add_argument("--tls-tickets", type=int, default=2, help="TLS session tickets of the in-process HTTPS server, 0 to disable resumption (default: 2)")
+
+    args = parser.parse_args()
+    if args.serve and args.https and args.server == "single":
+        parser.error("--https requires --server pool")
+    base_url = f"/api/{API_VERSION}/{API_KEY}/desks"
+
+    httpd = desk_manager = None
+    if args.serve:
+        if args.port == 8000:
+            args.port = 0
+        httpd, desk_manager, log_pipeline = start_server(args)
+
+    connection = get_connection(args.https, args.host, args.port)
+    connection.request("GET", base_url)
+    desk_ids = json.loads(connection.getresponse().read())
+    connection.close()
+
+    latencies = {kind: [] for kind in REQUEST_KINDS}
+    errors = []
+    handshakes = []
+    deadline = time.time() + args.duration
+    started = time.perf_counter()
+    try:
+        if args.processes > 1:
+            # Spawned processes do not inherit the server's threads
+            context = multiprocessing.get_context("spawn")
+            queue = context.Queue()
+            processes = [context.Process(target=run_clients, args=(args, base_url, desk_ids, deadline, i, queue))
+                         for i in range(args.processes)]
+            for process in processes:
+                process.start()
+            parts = [queue.get() for _ in processes]
+            for process in processes:
+                process.join()
+        else:
+            parts = [run_clients(args, base_url, desk_ids, deadline, 0)]
+        elapsed = time.perf_counter() - started
+    finally:
+        if httpd is not None:
+            httpd.shutdown()
+            httpd.server_close()
+            desk_manager.stop_updates()
+            log_pipeline.stop()
+
+    for part_latencies, part_errors, part_handshakes in parts:
+        for kind in REQUEST_KINDS:
+            latencies[kind].extend(part_latencies[kind])
+        errors.extend(part_errors)
+        handshakes.extend(part_handshakes)
+
+    results = {
+        "config": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+        "elapsed_s": round(elapsed, 3),
+        "errors": len(errors),
+        "error_counts": {str(error): count for error, count in collections.Counter(errors).items()},
+        "latency": {"all": summarize([latency for kind in REQUEST_KINDS for latency in latencies[kind]], elapsed)},
+    }
+    for kind in REQUEST_KINDS:
+        if latencies[kind]:
+            results["latency"][kind] = summarize(latencies[kind], elapsed)
+
+    for kind, summary in results["latency"].items():
+        print(f"{kind:>8}: {summary['requests']} requests ({summary['throughput_rps']:.0f} req/s), "
+              f"p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms, p99 {summary['p99_ms']:.2f} ms, p999 {summary['p999_ms']:.2f} ms")
+    if handshakes:
+        results["tls"] = summarize_handshakes(handshakes, results["latency"]["all"]["requests"])
+        if httpd is not None:
+            results["tls"]["server"] = httpd.tls_stats()
+        tls = results["tls"]
+        print(f"     tls: {tls['handshakes']} handshakes, {tls['resumed']} resumed ({tls['resumption_ratio']:.1%}), "
+              f"full p50 {tls['full_p50_ms']:.2f} ms, resumed p50 {tls['resumed_p50_ms']:.2f} ms, {tls['requests_per_handshake']:.1f} requests per handshake")
+    print(f"Elapsed: {elapsed:.1f}s, errors: {len(errors)}" + (f" {results['error_counts']}" if errors else ""))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
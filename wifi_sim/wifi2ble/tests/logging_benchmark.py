@@ -0,0 +1,74 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulator"))
+
+from desk_manager import DeskManager
+from log_pipeline import LogPipeline, parse_log_rates
+from users import UserType
+
+# Level, asynchronous, rate limits
+MODES = {
+    "off": (logging.WARNING, False, None),
+    "sync": (logging.INFO, False, None),
+    "async": (logging.INFO, True, None),
+    "async-limited": (logging.INFO, True, "movement=100,requests=100"),
+}
+
+def run(mode, args, log_file):
+    """Tick a fleet whose desks keep moving with the given logging mode and return the tick times."""
+    level, asynchronous, rates = MODES[mode]
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.FileHandler(log_file, mode="w")
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level)
+    pipeline = LogPipeline(parse_log_rates(rates) if rates else None, asynchronous)
+    pipeline.start()
+
+    random.seed(args.seed)
+    state_file = os.path.join(tempfile.mkdtemp(prefix="logging_benchmark_"), "desks_state.json")
+    desk_manager = DeskManager(engine="python", seed=args.seed, state_file=state_file)
+    for i in range(args.desks):
+        desk_manager.add_desk(f"desk-{i}", f"DESK {i}", "Desk-O-Matic Co.", UserType.ACTIVE)
+
+    targets = random.Random(args.seed)
+    tick_times = []
+    for t in range(args.ticks):
+        if t % args.retarget_every == 0:
+            for desk in desk_manager.desks.values():
+                desk.set_target_position(targets.randint(desk.min_position, desk.max_position))
+        started = time.perf_counter()
+        desk_manager._tick()
+        tick_times.append(time.perf_counter() - started)
+        desk_manager.increment_time()
+
+    desk_manager.store.stop()
+    pipeline.stop()
+    handler.close()
+    root.removeHandler(handler)
+    return tick_times
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare tick time with logging off, synchronous, asynchronous and rate-limited.")
+    parser.add_argument("--desks", type=int, default=2000, help="Number of desks (default: 2000)")
+    parser.add_argument("--ticks", type=int, default=60, help="Number of ticks (default: 60)")
+    parser.add_argument("--retarget-every", type=int, default=20, help="Ticks between new targets for every desk (default: 20)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    parser.add_argument("--modes", type=str, default=",".join(MODES), help=f"Comma-separated modes to run (default: {','.join(MODES)})")
+
+    args = parser.parse_args()
+    log_file = os.path.join(tempfile.mkdtemp(prefix="logging_benchmark_"), "benchmark.log")
+
+    for mode in args.modes.split(","):
+        tick_times = sorted(run(mode, args, log_file))
+        mean = sum(tick_times) / len(tick_times)
+        p99 = tick_times[min(len(tick_times) - 1, int(0.99 * len(tick_times)))]
+        print(f"{mode:>14}: tick mean {mean * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, log {os.path.getsize(log_file)} bytes")
@@ -0,0 +1,83 @@
+import argparse
+import gc
+import logging
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulator"))
+
+from desk import Desk
+from desk_manager import DeskManager
+from users import ActiveUser, UserType
+from lazy_engine import LazyMotionEngine
+from compact_engine import CompactTickEngine
+from numpy_engine import NumpyTickEngine, np
+
+ENGINES = {"lazy": LazyMotionEngine, "compact": CompactTickEngine}
+if np is not None:
+    ENGINES["numpy"] = NumpyTickEngine
+
+def desk_id(i):
+    return f"{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}:00:00:00"
+
+def traced_bytes():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+def measure_desks(engine_name, count):
+    """Return the bytes per desk of the desk objects, or engine views, with their IDs and users."""
+    engine = ENGINES[engine_name]() if engine_name in ENGINES else None
+    started = traced_bytes()
+    desks = {}
+    for i in range(count):
+        desk = Desk(desk_id(i), f"DESK {i}", "Desk-O-Matic Co.")
+        desks[desk.desk_id] = engine.add(desk) if engine else desk
+    with_desks = traced_bytes()
+    # Kept alive until they are measured
+    users = {desk_id: ActiveUser(desk) for desk_id, desk in desks.items()}
+    with_users = traced_bytes()
+    del users
+    return (with_desks - started) / count, (with_users - with_desks) / count
+
+def run_manager(engine_name, args, directory):
+    """Run a seeded manager for a simulated hour and return it."""
+    random.seed(args.seed)
+    manager = DeskManager(60, engine=engine_name, seed=args.seed, state_file=os.path.join(directory, f"{engine_name}.json"),
+                          history_size=args.history_size)
+    for i in range(args.desks):
+        manager.add_desk(desk_id(i), f"DESK {i}", "Desk-O-Matic Co.", UserType.ACTIVE)
+    manager.run_virtual(args.duration)
+    manager.store.stop()
+    return manager
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the memory per desk of each engine and check that the compact engine serves the same data.")
+    parser.add_argument("--desks", type=int, default=20000, help="Number of desks (default: 20000)")
+    parser.add_argument("--duration", type=int, default=3600, help="Simulated seconds the managers run for, at 60 per tick (default: 3600)")
+    parser.add_argument("--history-size", type=int, default=0, help="History samples per desk of the managers (default: 0)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    tracemalloc.start()
+    print(f"Bytes per desk with {args.desks} desks, including desk IDs:")
+    for engine_name in ("python", *ENGINES):
+        desk_bytes, user_bytes = measure_desks(engine_name, args.desks)
+        print(f"{engine_name:>8}: desk {desk_bytes:7.0f}, user {user_bytes:5.0f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        sizes = {}
+        data = {}
+        for engine_name in ("python", "compact"):
+            started = traced_bytes()
+            manager = run_manager(engine_name, args, directory)
+            sizes[engine_name] = (traced_bytes() - started) / args.desks
+            data[engine_name] = manager.get_fleet_data()
+            del manager
+        for engine_name, size in sizes.items():
+            print(f"{engine_name:>8}: desk manager after {args.duration}s simulated, with snapshot and {args.history_size} history samples: {size:7.0f}")
+    assert data["python"] == data["compact"], "the compact engine serves different desk data"
+    print(f"Seeded runs serve identical data for all {len(data['python'])} desks.")
@@ -0,0 +1,91 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulator"))
+
+from desk_manager import DeskManager
+from mqtt_bridge import MqttBridge
+from users import UserType
+
+class StandInBroker:
+    """Keeps the retained message of every topic and the other messages in order, like a broker seen by one subscriber.
+
+    A delay per publish stands in for a slow broker or network.
+    """
+
+    def __init__(self, delay_s=0.0):
+        self.delay_s = delay_s
+        self.lock = threading.Lock()
+        self.retained = {}
+        self.events = []
+        self.published = 0
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        with self.lock:
+            self.published += 1
+            if not retain:
+                self.events.append((topic, json.loads(payload)))
+            elif payload:
+                self.retained[topic] = json.loads(payload)
+            else:
+                self.retained.pop(topic, None)
+
+def run(args, delay_s):
+    """Run a virtual simulation publishing to a stand-in broker and return the manager, broker and bridge."""
+    random.seed(args.seed)
+    broker = StandInBroker(delay_s)
+    bridge = MqttBridge(broker, flush_interval_s=args.interval)
+    with tempfile.TemporaryDirectory() as directory:
+        manager = DeskManager(60, engine=args.engine, seed=args.seed, state_file=os.path.join(directory, "state.json"), history_size=0)
+        for i in range(args.desks):
+            manager.add_desk(f"{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}:00:00:00", f"DESK {i}", "Desk-O-Matic Co.", UserType.ACTIVE)
+        manager.start_mqtt(bridge)
+        # Let the first flush publish every desk, so that every collision of the run is an error event
+        manager.get_snapshot()
+        while bridge.stats()["states"] < args.desks:
+            time.sleep(0.01)
+        started = time.perf_counter()
+        manager.run_virtual(args.duration)
+        elapsed = time.perf_counter() - started
+        manager.stop_updates()
+    return manager, broker, bridge, elapsed
+
+def check(manager, broker):
+    """Compare the retained states with the final snapshot and the error events with the collisions counted."""
+    snapshot = manager.get_snapshot()
+    expected = {f"{MqttBridge.TOPIC_PREFIX}/{desk_id}/state": snapshot.desks[desk_id].data for desk_id in snapshot.desk_ids}
+    assert broker.retained == expected, "retained states differ from the final snapshot"
+    collisions = sum(count for _, count in manager.collisions.samples())
+    errors = [event for topic, event in broker.events if topic.endswith("/errors")]
+    assert len(errors) == collisions, f"{len(errors)} error events for {collisions} collisions"
+    return collisions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a virtual simulation against a stand-in MQTT broker and check what it receives.")
+    parser.add_argument("--desks", type=int, default=2000, help="Number of desks (default: 2000)")
+    parser.add_argument("--duration", type=int, default=21600, help="Simulated seconds, at 60 per tick (default: 21600)")
+    parser.add_argument("--engine", type=str, default="python", choices=["python", "numpy", "lazy", "compact"], help="Tick engine (default: python)")
+    parser.add_argument("--interval", type=float, default=0.2, help="Seconds between bridge flushes (default: 0.2)")
+    parser.add_argument("--slow-delay", type=float, default=0.001, help="Seconds per publish of the slow stand-in broker (default: 0.001)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    for name, delay_s in (("fast broker", 0.0), ("slow broker", args.slow_delay)):
+        manager, broker, bridge, elapsed = run(args, delay_s)
+        collisions = check(manager, broker)
+        stats = bridge.stats()
+        ticks = manager.tick_count
+        print(f"{name}: {ticks} ticks in {elapsed:.2f}s ({elapsed / ticks * 1000:.2f} ms per tick), "
+              f"{stats['changes']} desk changes -> {stats['states']} states and {stats['errors']} error events "
+              f"in {stats['flushes']} flushes ({stats['changes'] / max(stats['states'], 1):.1f}x coalescing), "
+              f"{collisions} collisions, {len(broker.retained)} retained states match the snapshot")
@@ -35,6 +35,7 @@ def make_request(connection, method, endpoint, data=None):
     except json.JSONDecodeError:
         print("Response Text:")
         print(response_data)
+    return response.status
 
 def get_all_desks(connection, base_url):
     print("Fetching all desks...")
@@ -55,6 +56,18 @@ def update_desk_category(connection, base_url, desk_id, category, data):
     endpoint = f"{base_url}/{desk_id}/{category}"
     make_request(connection, "PUT", endpoint, data)
 
+def update_desks(connection, base_url, data):
+    print("Updating desks in one batch...")
+    return make_request(connection, "PUT", base_url, data)
+
+def update_desks_with_invalid_ids(connection, base_url):
+    print("Updating desks with desk IDs that are not strings...")
+    for data in ({"commands": [{"desk_id": ["x"], "position_mm": 900}]},
+                 {"commands": [{"desk_id": 1, "position_mm": 900}]},
+                 {"selector": {"desk_ids": [DESK_ID, 1]}, "position_mm": 900}):
+        status = make_request(connection, "PUT", base_url, data)
+        assert status == 400, f"batch update {data} answered {status} instead of 400"
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Test Desk Management REST API using HTTP or HTTPS.")
     parser.add_argument("--https", action="store_true", help="Use HTTPS for requests")
@@ -74,5 +87,7 @@ if __name__ == "__main__":
         get_desk_data(connection, base_url, DESK_ID)
         update_desk_category(connection, base_url, DESK_ID, CATEGORY, {"position_mm": 1000})
         get_desk_category(connection, base_url, DESK_ID, CATEGORY)
+        update_desks(connection, base_url, {"commands": [{"desk_id": DESK_ID, "position_mm": 1100}]})
+        update_desks_with_invalid_ids(connection, base_url)
     finally:
         connection.close()
@@ -0,0 +1,107 @@
+import argparse
+import gc
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulator"))
+
+from desk_manager import DeskManager
+from state_store import StateStore
+from users import UserType
+
+def desk_id(i):
+    return f"{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}:00:00:00"
+
+def build_state(args, state_file):
+    """Save the state of a seeded fleet after a simulated run, with a mix of user types."""
+    random.seed(args.seed)
+    user_types = list(UserType)
+    manager = DeskManager(60, engine=args.engine, seed=args.seed, state_file=state_file, history_size=0)
+    manager.add_desks((desk_id(i), f"DESK {i}", "Desk-O-Matic Co.", user_types[i % len(user_types)]) for i in range(args.desks))
+    manager.run_virtual(args.duration)
+    manager.stop_updates()
+    manager.store.stop()
+
+def copy_state(state_file, directory, name):
+    copy = os.path.join(directory, f"{name}.json")
+    shutil.copyfile(state_file, copy)
+    if os.path.exists(StateStore.journal_file_of(state_file)):
+        shutil.copyfile(StateStore.journal_file_of(state_file), StateStore.journal_file_of(copy))
+    return copy
+
+def load_eager(args, state_file):
+    """Load the state the way a virtual run does, building every desk before the manager is returned."""
+    manager = DeskManager(60, engine=args.engine, seed=args.seed, state_file=state_file, history_size=args.history_size)
+    return manager, {}
+
+def resume_gc():
+    gc.collect()
+    gc.freeze()
+    gc.enable()
+
+def load_in_background(args, state_file):
+    """Load the state the way the server does, and time reads of the fleet and of a desk while desks are being built."""
+    manager = DeskManager(60, engine=args.engine, seed=args.seed, state_file=state_file, history_size=args.history_size,
+                          load_in_background=True)
+    # The server pauses garbage collection until the saved desks are built
+    gc.disable()
+    manager.start_loading(resume_gc)
+    manager.ready.wait()
+    timings = {}
+    started = time.perf_counter()
+    manager.get_fleet_data()
+    timings["fleet_read_ms"] = (time.perf_counter() - started) * 1000
+    last_id = manager.get_snapshot().desk_ids[-1]
+    building = not manager.loaded.is_set()
+    started = time.perf_counter()
+    manager.get_desk(last_id)
+    timings["desk_write_access_ms"] = (time.perf_counter() - started) * 1000
+    timings["built_on_access"] = building
+    manager.loaded.wait()
+    return manager, timings
+
+def check(manager):
+    """Check that the saved data served until a desk is built matches the built desk."""
+    snapshot = manager.get_snapshot()
+    for desk_id in snapshot.desk_ids:
+        assert snapshot.desks[desk_id].data == manager.desks[desk_id].get_data(), f"desk {desk_id} serves stale saved data"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the time to load a saved fleet eagerly and in the background, as the server does.")
+    parser.add_argument("--desks", type=int, default=100000, help="Number of desks in the saved state (default: 100000)")
+    parser.add_argument("--duration", type=int, default=600, help="Simulated seconds run before saving the state (default: 600)")
+    parser.add_argument("--engine", type=str, default="python", choices=["python", "numpy", "lazy", "compact"], help="Tick engine (default: python)")
+    parser.add_argument("--history-size", type=int, default=512, help="History samples per desk of the loaded managers (default: 512)")
+    parser.add_argument("--memory", action="store_true", help="Also report the peak memory of each load, which slows it down")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directory:
+        state_file = os.path.join(directory, "desks_state.json")
+        started = time.perf_counter()
+        build_state(args, state_file)
+        print(f"Saved {args.desks} desks in {time.perf_counter() - started:.1f}s: {os.path.getsize(state_file) / 1e6:.1f} MB")
+
+        data = {}
+        for name, load in (("eager", load_eager), ("background", load_in_background)):
+            if args.memory:
+                tracemalloc.start()
+            manager, timings = load(args, copy_state(state_file, directory, name))
+            peak = f", peak memory {tracemalloc.get_traced_memory()[1] / 1e6:.0f} MB" if args.memory else ""
+            tracemalloc.stop()
+            check(manager)
+            data[name] = manager.get_fleet_data()
+            extra = "".join(f", {key} {value:.1f}" if isinstance(value, float) else f", {key} {value}" for key, value in timings.items())
+            print(f"{name:>10}: serving after {manager.startup_s['ready']:.2f}s, every desk built after {manager.startup_s['loaded']:.2f}s{extra}{peak}")
+            manager.stop_updates()
+            manager.store.stop()
+            del manager
+    assert data["eager"] == data["background"], "background loading serves different desk data"
+    print(f"Both loads serve identical data for all {len(data['eager'])} desks.")
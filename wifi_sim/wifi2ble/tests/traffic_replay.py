@@ -0,0 +1,224 @@
+import argparse
+import collections
+import http.client
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+SIMULATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulator")
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+sys.path.insert(0, SIMULATOR_DIR)
+
+from traffic_recorder import TrafficRecorder
+from load_test import summarize, percentile
+
+def parse_speed(value):
+    """Parse a replay speed: max, or a factor of the recorded pace such as 1, 10x or 0.5."""
+    if value == "max":
+        return None
+    try:
+        speed = float(value.removesuffix("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid speed: {value}")
+    if not speed > 0:
+        raise argparse.ArgumentTypeError("speed must be positive or max")
+    return speed
+
+def load_connections(trace_file):
+    """Read a trace and return its requests grouped by connection, in order of each connection's first request.
+
+    Offsets are shifted so that the first request of the trace is at 0.
+    """
+    _, requests = TrafficRecorder.load(trace_file)
+    first_offset_s = requests[0][0] if requests else 0.0
+    connections = {}
+    for request in requests:
+        connections.setdefault(request[1], []).append([request[0] - first_offset_s, *request[1:]])
+    return list(connections.values())
+
+def start_server(args, directory):
+    """Start a fresh simulator from a copy of the saved state, with a REST server on a free port. Returns (httpd, desk_manager)."""
+    from desk_manager import DeskManager
+    from state_store import StateStore
+    from simple_rest_server import SimpleRESTServer
+    from response_cache import ResponseCache
+    from main import create_handler, create_http_server
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    state_file = os.path.join(directory, "desks_state.json")
+    shutil.copyfile(args.state, state_file)
+    if os.path.exists(StateStore.journal_file_of(args.state)):
+        shutil.copyfile(StateStore.journal_file_of(args.state), StateStore.journal_file_of(state_file))
+    desk_manager = DeskManager(engine=args.engine, seed=args.seed, state_file=state_file)
+    desk_manager.start_updates()
+
+    # The trace's requests carry the API keys they were recorded with
+    SimpleRESTServer.API_KEYS = frozenset(SimpleRESTServer.load_api_keys(os.path.join(CONFIG_DIR, "api_keys.json")))
+    response_cache = ResponseCache(args.response_cache_size) if args.response_cache_size > 0 else None
+    handler = create_handler(desk_manager, SimpleRESTServer, args.server, 15, response_cache)
+    httpd = create_http_server((args.host, 0), handler, args.server, args.workers)
+    args.port = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, desk_manager
+
+def replay_connection(args, requests, started, speed, results, slots):
+    """Issue the requests of one recorded connection in order, each at its recorded offset divided by the speed."""
+    connection = None
+    try:
+        for offset_s, _, method, route, path, headers, body, status, duration_s in requests:
+            due = started + offset_s / speed if speed else time.perf_counter()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if connection is None:
+                connection = http.client.HTTPConnection(args.host, args.port, timeout=args.timeout)
+            request_started = time.perf_counter()
+            try:
+                connection.request(method, path, body=None if body is None else body.encode("utf-8", "surrogateescape"), headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+                outcome = response.status
+                if response.will_close:
+                    connection.close()
+                    connection = None
+            except (OSError, http.client.HTTPException) as e:
+                outcome = type(e).__name__
+                connection.close()
+                connection = None
+            results.append((route, status, duration_s, outcome, time.perf_counter() - request_started, request_started - due))
+    finally:
+        if connection is not None:
+            connection.close()
+        slots.release()
+
+def replay(args, connections, speed):
+    """Re-issue every recorded connection from its own thread, starting each when its first request is due.
+
+    Returns the (route, recorded status, recorded duration, status or error, latency, lag) of every request and the elapsed time.
+    """
+    results = []
+    threads = []
+    # Bounds the connections open at once, which a replay at max speed would otherwise open all together
+    slots = threading.BoundedSemaphore(args.max_connections)
+    started = time.perf_counter()
+    for requests in connections:
+        if speed:
+            delay = started + requests[0][0] / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        slots.acquire()
+        thread = threading.Thread(target=replay_connection, args=(args, requests, started, speed, results, slots), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+def is_error(status):
+    return not isinstance(status, int) or status >= 400
+
+def report(results, elapsed):
+    """Summarize the replay per route: latency, errors and status changes against the recording, and the recorded server time."""
+    by_route = collections.defaultdict(list)
+    for result in results:
+        by_route[result[0]].append(result)
+        by_route["all"].append(result)
+    routes = {}
+    for route, route_results in sorted(by_route.items(), key=lambda item: (item[0] != "all", item[0])):
+        server_times = sorted(duration_s for _, _, duration_s, _, _, _ in route_results)
+        routes[route] = {
+            "errors": sum(1 for *_, outcome, _, _ in route_results if is_error(outcome)),
+            "recorded_errors": sum(1 for _, status, *_ in route_results if is_error(status)),
+            "status_changes": sum(1 for _, status, _, outcome, _, _ in route_results if status != outcome),
+            "error_counts": dict(collections.Counter(str(outcome) for *_, outcome, _, _ in route_results if is_error(outcome))),
+            "latency": summarize([latency for *_, latency, _ in route_results], elapsed),
+            "recorded_server_p50_ms": round(percentile(server_times, 0.5) * 1000, 3),
+            "recorded_server_p99_ms": round(percentile(server_times, 0.99) * 1000, 3),
+        }
+    lags = sorted(lag for *_, lag in results)
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "lag_p99_ms": round(percentile(lags, 0.99) * 1000, 3),
+        "lag_max_ms": round(lags[-1] * 1000, 3) if lags else 0.0,
+        "routes": routes,
+    }
+
+def compare(results, baseline, tolerance):
+    """Print latency and error changes per route against a baseline replay and return whether any route regressed."""
+    regressed = False
+    for route, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous or not previous["latency"]["requests"]:
+            continue
+        latency, before = current["latency"], previous["latency"]
+        p50 = latency["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        p99 = latency["p99_ms"] / before["p99_ms"] - 1 if before["p99_ms"] else 0.0
+        errors = current["errors"] - previous["errors"]
+        failed = p99 > tolerance or errors > 0
+        regressed = regressed or failed
+        print(f"{route:>10}: p50 {p50:+.1%}, p99 {p99:+.1%}, errors {errors:+d}{'  REGRESSION' if failed else ''}")
+    return regressed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a traffic trace recorded with --record-traffic and report latency and errors per route.")
+    parser.add_argument("trace", type=str, help="Trace file recorded by the server with --record-traffic")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="Pace of the replay: 1 as recorded, a factor such as 10 or 0.5, or max to send requests as fast as each connection allows (default: 1)")
+    parser.add_argument("--state", type=str, default=os.path.join(DATA_DIR, "desks_state.json"), help="Saved state the fresh simulator starts from, with its journal if there is one (default: data/desks_state.json)")
+    parser.add_argument("--host", type=str, default="localhost", help="Server host (default: localhost)")
+    parser.add_argument("--port", type=int, help="Replay against the server running on this port instead of a fresh simulator")
+    parser.add_argument("--max-connections", type=int, default=256, help="Maximum connections open at once (default: 256)")
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for a response (default: 30)")
+    parser.add_argument("--engine", type=str, default="python", choices=["python", "numpy", "lazy", "compact"], help="Tick engine of the fresh simulator (default: python)")
+    parser.add_argument("--server", type=str, default="pool", choices=["single", "pool"], help="Serving mode of the fresh simulator (default: pool)")
+    parser.add_argument("--workers", type=int, default=16, help="Number of worker threads of the fresh simulator's pool server (default: 16)")
+    parser.add_argument("--response-cache-size", type=int, default=1024, help="Response cache size of the fresh simulator (default: 1024)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the fresh simulator (default: 1)")
+    parser.add_argument("--log-level", type=str, default="CRITICAL", help="Logging level of the fresh simulator (default: CRITICAL)")
+    parser.add_argument("--output", type=str, help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", type=str, help="Compare against results saved with --output and exit with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed p99 increase against the baseline (default: 0.1)")
+
+    args = parser.parse_args()
+    if args.port is None and not os.path.exists(args.state):
+        parser.error(f"State file not found: {args.state}")
+    connections = load_connections(args.trace)
+    print(f"Replaying {sum(len(requests) for requests in connections)} requests on {len(connections)} connections "
+          f"at {'max speed' if args.speed is None else f'{args.speed:g}x'}.")
+
+    with tempfile.TemporaryDirectory(prefix="traffic_replay_") as directory:
+        httpd = desk_manager = None
+        if args.port is None:
+            httpd, desk_manager = start_server(args, directory)
+        try:
+            results, elapsed = replay(args, connections, args.speed)
+        finally:
+            if httpd is not None:
+                httpd.shutdown()
+                httpd.server_close()
+                desk_manager.stop_updates()
+
+    results = {
+        "config": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+        **report(results, elapsed),
+    }
+    for route, summary in results["routes"].items():
+        latency = summary["latency"]
+        print(f"{route:>10}: {latency['requests']} requests, p50 {latency['p50_ms']:.2f} ms, p95 {latency['p95_ms']:.2f} ms, "
+              f"p99 {latency['p99_ms']:.2f} ms (recorded server p50 {summary['recorded_server_p50_ms']:.2f} ms, p99 {summary['recorded_server_p99_ms']:.2f} ms), "
+              f"errors {summary['errors']} (recorded {summary['recorded_errors']}), status changes {summary['status_changes']}")
+    print(f"Elapsed: {results['elapsed_s']:.1f}s, lag behind the schedule p99 {results['lag_p99_ms']:.1f} ms, max {results['lag_max_ms']:.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)